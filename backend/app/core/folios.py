@@ -0,0 +1,87 @@
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+
+from app import models
+
+# Folios reservados por viaje a la BD. Cada worker reparte su bloque en memoria;
+# los folios no usados de un bloque (reinicio del worker) quedan como saltos en la numeración.
+# El tamaño queda fijo en la secuencia al crearla (INCREMENT BY).
+FOLIO_BLOQUE = int(os.getenv("FOLIO_BLOQUE", 50))
+
+
+def nombre_secuencia_folio(sucursal_id: int, tipo_documento: models.TipoDocumento) -> str:
+    return f"folio_{sucursal_id}_{tipo_documento.value.lower()}"
+
+
+def crear_secuencias_folio(conn, sucursal_id: int):
+    """
+    Crea (si no existen) las secuencias de folios de la sucursal, una por tipo de documento.
+    Se ejecuta fuera de las ventas (al crear la sucursal o en migrar_esquema.py): el DDL es
+    transaccional y una secuencia creada dentro de una venta que falla desaparecería con sus
+    números ya repartidos.
+    """
+    for tipo in models.TipoDocumento:
+        conn.execute(text(
+            f"CREATE SEQUENCE IF NOT EXISTS {nombre_secuencia_folio(sucursal_id, tipo)} "
+            f"INCREMENT BY {FOLIO_BLOQUE} START WITH 1"
+        ))
+
+
+class AsignadorFolios:
+    """
+    Folios únicos por (sucursal, tipo de documento) sin una consulta por venta.
+    Los bloques se reservan con nextval() de una secuencia de Postgres por (sucursal, tipo), en la
+    conexión del llamador: nextval no es transaccional (no se deshace si la venta falla), no bloquea
+    filas y no necesita una segunda conexión del pool.
+    """
+
+    def __init__(self):
+        # Solo protege el dict en memoria y nunca se retiene durante la consulta: en el camino async
+        # (run_sync) la consulta cede el event loop y otra corrutina del mismo hilo podría esperar el lock.
+        self._lock = threading.Lock()
+        # (id_sucursal, tipo_documento) -> (siguiente, último del bloque)
+        self._rangos = {}
+
+    def siguiente(self, db, sucursal_id: int, tipo_documento: models.TipoDocumento) -> Optional[int]:
+        """Siguiente número del bloque en memoria. None si la sucursal no tiene secuencia."""
+        clave = (sucursal_id, tipo_documento)
+        with self._lock:
+            siguiente, limite = self._rangos.get(clave, (1, 0))
+            if siguiente <= limite:
+                self._rangos[clave] = (siguiente + 1, limite)
+                return siguiente
+
+        bloque = self._reservar_bloque(db, sucursal_id, tipo_documento)
+        if bloque is None:
+            return None
+        siguiente, limite = bloque
+        # Si otra petición reservó a la vez, el bloque que se reemplaza queda como salto
+        with self._lock:
+            self._rangos[clave] = (siguiente + 1, limite)
+        return siguiente
+
+    def nuevo_folio(self, db, sucursal_id: int, tipo_documento: models.TipoDocumento) -> Optional[str]:
+        numero = self.siguiente(db, sucursal_id, tipo_documento)
+        if numero is None:
+            return None
+        return f"{tipo_documento.value[0]}-{sucursal_id}-{numero}"
+
+    def _reservar_bloque(self, db, sucursal_id: int, tipo_documento: models.TipoDocumento):
+        # Sin fila en pg_sequences (secuencia inexistente) no se llama a nextval ni se aborta la transacción
+        fila = db.execute(
+            text(
+                "SELECT nextval(format('%I', sequencename)), increment_by FROM pg_sequences "
+                "WHERE schemaname = current_schema() AND sequencename = :nombre"
+            ),
+            {"nombre": nombre_secuencia_folio(sucursal_id, tipo_documento)}
+        ).first()
+        if fila is None:
+            return None
+        inicio, tamano = fila
+        return inicio, inicio + tamano - 1
+
+
+asignador_folios = AsignadorFolios()
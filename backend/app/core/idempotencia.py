@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from app.core.redis import redis_service
+
+logger = logging.getLogger(__name__)
+
+# Tiempo que se recuerda una Idempotency-Key (segundos)
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+# Mientras la primera petición está en curso
+_TTL_EN_CURSO = 60
+
+_EN_CURSO = "EN_CURSO"
+
+
+class Idempotencia:
+    """
+    Header Idempotency-Key en endpoints de creación.
+    La primera petición reserva la clave en Redis (SET NX); al terminar con éxito se guarda su respuesta
+    y los reintentos con la misma clave la reciben sin volver a ejecutar la operación.
+    Si la operación falla la clave se libera para permitir reintentar.
+    Sin header, o sin Redis disponible, el endpoint funciona como siempre.
+    Los endpoints async def usan las variantes *_async (cliente Redis async).
+    """
+
+    def __init__(self, clave: Optional[str], ambito: str, payload):
+        self.clave = f"idem:{ambito}:{clave}" if clave else None
+        self.huella = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+        self.reservada = False
+
+    def iniciar(self) -> Optional[JSONResponse]:
+        """Reserva la clave. Retorna la respuesta original si la petición ya se procesó."""
+        if not self.clave:
+            return None
+        reservado = redis_service.set_nx(self.clave, self._valor_en_curso(), ttl=_TTL_EN_CURSO)
+        if reservado is False:
+            return self._respuesta_guardada(redis_service.get(self.clave))
+        self._marcar_reservada(reservado)
+        return None
+
+    async def iniciar_async(self) -> Optional[JSONResponse]:
+        """iniciar() para endpoints async def (cliente Redis async, no bloquea el event loop)."""
+        if not self.clave:
+            return None
+        reservado = await redis_service.set_nx_async(self.clave, self._valor_en_curso(), ttl=_TTL_EN_CURSO)
+        if reservado is False:
+            return self._respuesta_guardada(await redis_service.get_async(self.clave))
+        self._marcar_reservada(reservado)
+        return None
+
+    def completar(self, status_code: int, body):
+        if self.reservada:
+            redis_service.set(self.clave, self._valor_completada(status_code, body), ttl=IDEMPOTENCY_TTL)
+
+    async def completar_async(self, status_code: int, body):
+        if self.reservada:
+            await redis_service.set_async(self.clave, self._valor_completada(status_code, body), ttl=IDEMPOTENCY_TTL)
+
+    def liberar(self):
+        if self.reservada:
+            redis_service.delete(self.clave)
+            self.reservada = False
+
+    async def liberar_async(self):
+        if self.reservada:
+            await redis_service.delete_async(self.clave)
+            self.reservada = False
+
+    def _valor_en_curso(self) -> str:
+        return json.dumps({"estado": _EN_CURSO, "huella": self.huella})
+
+    def _valor_completada(self, status_code: int, body) -> str:
+        return json.dumps({"estado": "COMPLETADA", "huella": self.huella, "status_code": status_code, "body": body}, default=str)
+
+    def _marcar_reservada(self, reservado: Optional[bool]):
+        # None: Redis no disponible, se sigue sin idempotencia
+        if reservado is None:
+            logger.warning("Redis no disponible: Idempotency-Key ignorada")
+        else:
+            self.reservada = True
+
+    def _respuesta_guardada(self, guardado: Optional[str]) -> JSONResponse:
+        # La clave ya existía: respuesta original, o 409/422
+        if not guardado:
+            # Expiró entre el SET NX y el GET
+            raise HTTPException(status_code=409, detail="Petición con la misma Idempotency-Key en curso, reintente")
+        guardado = json.loads(guardado)
+
+        if guardado.get("huella") != self.huella:
+            raise HTTPException(status_code=422, detail="Idempotency-Key ya usada con otro contenido")
+        if guardado.get("estado") == _EN_CURSO:
+            raise HTTPException(status_code=409, detail="Petición con la misma Idempotency-Key en curso, reintente")
+
+        return JSONResponse(
+            status_code=guardado["status_code"],
+            content=guardado["body"],
+            headers={"Idempotent-Replayed": "true"}
+        )
@@ -0,0 +1,141 @@
+import base64
+import hashlib
+import json
+import os
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.core.redis import redis_service
+
+# Segundos que se recuerda un total por conjunto de filtros (además se invalida en cada escritura)
+CONTEO_TTL = int(os.getenv("CONTEO_TTL", 300))
+
+
+# PAGINACIÓN POR CURSOR (keyset)
+# En vez de offset, cada página continúa desde la última clave vista ("WHERE id > :ultimo ORDER BY id"),
+# así el costo no crece con la profundidad de la página. El cursor es opaco para el cliente:
+# solo debe reenviar el next_cursor recibido.
+
+def codificar_cursor(ultimo_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": ultimo_id}).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> int:
+    """Retorna la última clave vista. Lanza ValueError si el cursor no es válido."""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        ultimo_id = json.loads(base64.urlsafe_b64decode(cursor + relleno))["id"]
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(ultimo_id, int):
+        raise ValueError("Cursor inválido")
+    return ultimo_id
+
+
+def cortar_pagina(filas: list, limit: int, clave: Callable) -> Tuple[List, Optional[str]]:
+    """
+    Recibe hasta limit + 1 filas ordenadas por la clave.
+    Si llegó la fila extra hay otra página y el next_cursor apunta a la última fila entregada.
+    """
+    if len(filas) <= limit:
+        return filas, None
+    filas = filas[:limit]
+    return filas, codificar_cursor(clave(filas[-1]))
+
+
+# TOTALES
+# El count() recorre todo el conjunto filtrado en cada página. Se cachea en Redis por tabla y
+# conjunto de filtros normalizado, y las escrituras de la tabla borran sus conteos (invalidar_conteos).
+
+def _clave_conteo(tabla: str, filtros: dict) -> str:
+    huella = hashlib.sha1(json.dumps(filtros, sort_keys=True, default=str).encode()).hexdigest()
+    return f"conteo:{tabla}:{huella}"
+
+
+def _normalizar_filtros(filtros: dict) -> dict:
+    return {k: v for k, v in filtros.items() if v is not None and v != ""}
+
+
+class ConteoPrecargado:
+    """
+    Conteo cacheado para el camino async: se lee con el cliente async antes de run_sync y el total
+    calculado se guarda después. La sesión (un greenlet en el hilo del event loop) no toca Redis.
+    """
+
+    def __init__(self, tabla: str, filtros: dict):
+        self.clave = _clave_conteo(tabla, _normalizar_filtros(filtros))
+        self.cacheado: Optional[int] = None
+        self.calculado: Optional[int] = None
+
+    async def leer(self):
+        valor = await redis_service.get_async(self.clave)
+        self.cacheado = int(valor) if valor is not None else None
+
+    async def guardar(self):
+        if self.calculado is not None:
+            await redis_service.set_async(self.clave, str(self.calculado), ttl=CONTEO_TTL)
+
+
+def invalidar_conteos(tabla: str):
+    redis_service.delete_pattern(f"conteo:{tabla}:*")
+
+
+def total_estimado(db, tabla: str) -> Optional[int]:
+    """Filas estimadas por el planner (pg_class.reltuples). None si la tabla aún no fue analizada."""
+    estimado = db.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:tabla)"),
+        {"tabla": tabla}
+    ).scalar()
+    if estimado is None or estimado < 0:
+        return None
+    return estimado
+
+
+def total_paginado(db, tabla: str, filtros: dict, query, aproximado: bool = False,
+                   conteo: Optional[ConteoPrecargado] = None) -> Tuple[int, bool]:
+    """
+    Total de un listado paginado y si es aproximado.
+    Sin filtros y con aproximado=True usa la estimación del planner (no toca la tabla);
+    en otro caso el count() exacto, cacheado por conjunto de filtros.
+    conteo: caché ya leída fuera de la sesión (camino async); el total calculado queda en conteo.calculado.
+    """
+    filtros = _normalizar_filtros(filtros)
+
+    if aproximado and not filtros:
+        estimado = total_estimado(db, tabla)
+        if estimado is not None:
+            return estimado, True
+
+    if conteo is not None:
+        if conteo.cacheado is not None:
+            return conteo.cacheado, False
+        conteo.calculado = query.count()
+        return conteo.calculado, False
+
+    clave = _clave_conteo(tabla, filtros)
+    cacheado = redis_service.get(clave)
+    if cacheado is not None:
+        return int(cacheado), False
+
+    total = query.count()
+    redis_service.set(clave, str(total), ttl=CONTEO_TTL)
+    return total, False
+
+
+# PROYECCIÓN
+# Listados que aceptan fields= ("nombre,precio_venta"): solo se seleccionan esas columnas.
+
+def campos_proyeccion(disponibles: dict, fields: Optional[str], clave: str) -> List[str]:
+    """
+    Nombres de columnas pedidos en fields, en el orden de disponibles y siempre con la clave (PK).
+    Sin fields retorna todas. Lanza ValueError si se pide un campo que no existe.
+    """
+    if not fields:
+        return list(disponibles)
+    pedidos = {campo.strip() for campo in fields.split(",") if campo.strip()}
+    desconocidos = pedidos - disponibles.keys()
+    if desconocidos:
+        raise ValueError(f"Campos no válidos: {', '.join(sorted(desconocidos))}. Disponibles: {', '.join(disponibles)}")
+    pedidos.add(clave)
+    return [nombre for nombre in disponibles if nombre in pedidos]
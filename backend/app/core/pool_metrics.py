@@ -0,0 +1,108 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolMetrics:
+    """Contadores del pool de conexiones (por proceso/worker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.conexiones_creadas = 0
+
+    def registrar_checkout(self, espera: float):
+        with self._lock:
+            self.checkouts += 1
+            self.espera_total += espera
+            if espera > self.espera_max:
+                self.espera_max = espera
+
+    def registrar_timeout(self, espera: float):
+        with self._lock:
+            self.timeouts += 1
+            self.espera_total += espera
+            if espera > self.espera_max:
+                self.espera_max = espera
+
+    def registrar_conexion(self):
+        with self._lock:
+            self.conexiones_creadas += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            promedio = self.espera_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts_total": self.checkouts,
+                "timeouts_total": self.timeouts,
+                "conexiones_creadas": self.conexiones_creadas,
+                "espera_total_ms": round(self.espera_total * 1000, 3),
+                "espera_promedio_ms": round(promedio * 1000, 3),
+                "espera_max_ms": round(self.espera_max * 1000, 3),
+            }
+
+
+class _InstrumentedPoolMixin:
+    """
+    Mide cuánto espera cada checkout por una conexión libre.
+    Se combina con QueuePool / AsyncAdaptedQueuePool, acepta los mismos parámetros.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.registrar_timeout(time.perf_counter() - inicio)
+            raise
+        self.metrics.registrar_checkout(time.perf_counter() - inicio)
+        return conn
+
+    def _create_connection(self):
+        self.metrics.registrar_conexion()
+        return super()._create_connection()
+
+    def recreate(self):
+        nuevo = super().recreate()
+        # Conservar contadores al recrear el pool (ej. tras dispose)
+        nuevo.metrics = self.metrics
+        return nuevo
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def get_pool_stats(engine, max_overflow: int) -> dict:
+    """max_overflow: el configurado al crear el engine (el pool no lo expone públicamente)."""
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "pool_size": pool.size(),
+            "max_overflow": max_overflow,
+            "timeout": pool.timeout(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+        })
+
+    metrics = getattr(pool, "metrics", None)
+    if metrics:
+        stats.update(metrics.snapshot())
+
+    return stats
@@ -0,0 +1,106 @@
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Máximo de veces que una misma forma de consulta puede repetirse en una petición (N+1)
+DB_QUERY_REPEAT_MAX = int(os.getenv("DB_QUERY_REPEAT_MAX", 10))
+# Modo estricto (tests): la petición falla si se supera DB_QUERY_REPEAT_MAX, si no solo se registra un warning
+DB_QUERY_STRICT = os.getenv("DB_QUERY_STRICT", "false").lower() in ("1", "true", "yes")
+
+_stats_peticion: contextvars.ContextVar[Optional["QueryStats"]] = contextvars.ContextVar("stats_peticion", default=None)
+
+_RE_PARAMETRO = re.compile(r"%\(\w+\)s|%s|\$\d+|\?")
+_RE_LISTA = re.compile(r"\?(?:\s*,\s*\?)+")
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_consulta(statement: str) -> str:
+    """Forma de la consulta: sin valores de parámetros y con listas IN (...) colapsadas."""
+    forma = _RE_PARAMETRO.sub("?", statement)
+    forma = _RE_LISTA.sub("?", forma)
+    return _RE_ESPACIOS.sub(" ", forma).strip()
+
+
+class QueryStats:
+    """Consultas SQL y tiempo en BD acumulados durante una petición."""
+
+    def __init__(self):
+        self.total = 0
+        self.tiempo = 0.0
+        self.formas = Counter()
+
+    def registrar(self, statement: str, duracion: float):
+        self.total += 1
+        self.tiempo += duracion
+        self.formas[normalizar_consulta(statement)] += 1
+
+    def forma_mas_repetida(self):
+        if not self.formas:
+            return None, 0
+        return self.formas.most_common(1)[0]
+
+
+def iniciar_medicion() -> QueryStats:
+    stats = QueryStats()
+    _stats_peticion.set(stats)
+    return stats
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_inicio", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info["query_inicio"].pop()
+    stats = _stats_peticion.get()
+    if stats is not None:
+        stats.registrar(statement, time.perf_counter() - inicio)
+
+
+@event.listens_for(Engine, "handle_error")
+def _error_al_ejecutar(exception_context):
+    # Descartar el inicio pendiente de la consulta que falló
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_inicio"):
+        conn.info["query_inicio"].pop()
+
+
+async def medir_consultas(request, call_next):
+    """
+    Middleware HTTP: agrega X-DB-Queries y Server-Timing con las consultas y el tiempo en BD.
+    Con DB_QUERY_STRICT la petición responde 500 si una misma consulta se repite más de DB_QUERY_REPEAT_MAX veces.
+    """
+    stats = iniciar_medicion()
+    inicio = time.perf_counter()
+    response = await call_next(request)
+    duracion = time.perf_counter() - inicio
+
+    forma, repeticiones = stats.forma_mas_repetida()
+    if repeticiones > DB_QUERY_REPEAT_MAX:
+        logger.warning(f"Posible N+1 en {request.method} {request.url.path}: {repeticiones} ejecuciones de '{forma[:200]}'")
+        if DB_QUERY_STRICT:
+            response = JSONResponse(
+                status_code=500,
+                content={
+                    "detail": f"Consulta repetida {repeticiones} veces (máximo {DB_QUERY_REPEAT_MAX})",
+                    "consulta": forma,
+                },
+            )
+
+    response.headers["X-DB-Queries"] = str(stats.total)
+    response.headers["Server-Timing"] = (
+        f'db;dur={stats.tiempo * 1000:.1f};desc="{stats.total} queries", app;dur={duracion * 1000:.1f}'
+    )
+    return response
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 import os
 import logging
 from typing import Optional
@@ -11,6 +12,8 @@ class RedisService:
 
     def __init__(self):
         self.client: Optional[redis.Redis] = None
+        # Cliente async para endpoints async def: el sync bloquearía el event loop en cada round trip
+        self.aclient: Optional[redis.asyncio.Redis] = None
         self.prefix: str = os.getenv("REDIS_PREFIX", "APP") 
 
     @classmethod
@@ -41,9 +44,19 @@ class RedisService:
             self.client.ping()
             logger.info(f"Conectado a Redis en {redis_host}:{redis_port}/{redis_db}")
 
+            # Mismo servidor; conecta en su primer comando (dentro del event loop)
+            self.aclient = redis.asyncio.Redis(
+                host=redis_host,
+                port=redis_port,
+                db=redis_db,
+                password=redis_password,
+                decode_responses=True
+            )
+
         except redis.RedisError as e:
             logger.critical(f"Error CRÍTICO al conectar a Redis: {e}")
             self.client = None
+            self.aclient = None
 
     def close(self):
         """Cierra la conexión a Redis."""
@@ -56,6 +69,16 @@ class RedisService:
             finally:
                 self.client = None
 
+    async def close_async(self):
+        """Cierra el cliente async (en el lifespan, antes que el sync)."""
+        if self.aclient:
+            try:
+                await self.aclient.aclose()
+            except redis.RedisError as e:
+                logger.error(f"Error al cerrar conexión Redis async: {e}")
+            finally:
+                self.aclient = None
+
     def _get_key(self, key: str) -> str:
         
         return f"{self.prefix}:{key}"
@@ -76,6 +99,24 @@ class RedisService:
             logger.error(f"Redis Error (SET): {e}")
             return False
 
+    def set_nx(self, key: str, value: str, ttl: int = 60) -> Optional[bool]:
+        """SET solo si la clave no existe. None si Redis no está disponible."""
+        if not self.client: return None
+        try:
+            return bool(self.client.set(self._get_key(key), value, ex=ttl, nx=True))
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (SET NX): {e}")
+            return None
+
+    def incr(self, key: str) -> Optional[int]:
+        """INCR atómico (sin TTL). None si Redis no está disponible."""
+        if not self.client: return None
+        try:
+            return self.client.incr(self._get_key(key))
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (INCR): {e}")
+            return None
+
     def delete(self, key: str) -> bool:
         if not self.client: return False
         try:
@@ -84,6 +125,183 @@ class RedisService:
             logger.error(f"Redis Error (DELETE): {e}")
             return False
 
+    def hgetall(self, key: str) -> dict:
+        if not self.client: return {}
+        try:
+            return self.client.hgetall(self._get_key(key))
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HGETALL): {e}")
+            return {}
+
+    def hset(self, key: str, mapping: dict, ttl: int = 60) -> bool:
+        if not self.client: return False
+        try:
+            full_key = self._get_key(key)
+            pipe = self.client.pipeline()
+            pipe.hset(full_key, mapping=mapping)
+            pipe.expire(full_key, ttl)
+            pipe.execute()
+            return True
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HSET): {e}")
+            return False
+
+    def hincrby(self, key: str, campo: str, incremento: int = 1, ttl: int = 60) -> Optional[int]:
+        """HINCRBY de un campo entero. None si Redis no está disponible."""
+        if not self.client: return None
+        try:
+            full_key = self._get_key(key)
+            pipe = self.client.pipeline()
+            pipe.hincrby(full_key, campo, incremento)
+            pipe.expire(full_key, ttl)
+            return pipe.execute()[0]
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HINCRBY): {e}")
+            return None
+
+    # Escrituras con reserva: el escritor suma 1 a 'pendientes' del hash de control antes de su commit
+    # y este script, después del commit, incrementa los campos (solo si el hash ya existe; si no, se
+    # reconstruye al leer), libera la reserva y sube 'version', todo atómico.
+    _SCRIPT_HINCRBY_Y_LIBERAR = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            for i = 3, #ARGV - 1, 2 do
+                redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+            end
+            redis.call('EXPIRE', KEYS[1], ARGV[1])
+        end
+        if tonumber(redis.call('HGET', KEYS[2], 'pendientes') or '0') > 0 then
+            redis.call('HINCRBY', KEYS[2], 'pendientes', -1)
+        end
+        redis.call('HINCRBY', KEYS[2], 'version', 1)
+        redis.call('EXPIRE', KEYS[2], ARGV[2])
+        return 1
+    """
+
+    # Reconstrucción: guarda el hash solo si sigue sin existir, no hay escrituras reservadas y la
+    # versión es la leída antes de calcular los valores (ninguna escritura terminó entremedio).
+    _SCRIPT_HSET_SI_VERSION = """
+        if redis.call('EXISTS', KEYS[1]) == 1 then
+            return 0
+        end
+        if tonumber(redis.call('HGET', KEYS[2], 'pendientes') or '0') > 0 then
+            return 0
+        end
+        if (redis.call('HGET', KEYS[2], 'version') or '0') ~= ARGV[1] then
+            return 0
+        end
+        for i = 3, #ARGV - 1, 2 do
+            redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        end
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+        return 1
+    """
+
+    def hincrby_y_liberar(self, key: str, control: str, incrementos: dict, ttl: int = 60) -> bool:
+        if not self.client: return False
+        try:
+            args = [ttl, ttl]
+            for campo, valor in incrementos.items():
+                args.extend([campo, int(valor)])
+            return self.client.eval(
+                self._SCRIPT_HINCRBY_Y_LIBERAR, 2, self._get_key(key), self._get_key(control), *args
+            ) == 1
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HINCRBY LIBERAR): {e}")
+            return False
+
+    def hset_si_version(self, key: str, control: str, version: str, mapping: dict, ttl: int = 60) -> bool:
+        if not self.client: return False
+        try:
+            args = [version, ttl]
+            for campo, valor in mapping.items():
+                args.extend([campo, valor])
+            return self.client.eval(
+                self._SCRIPT_HSET_SI_VERSION, 2, self._get_key(key), self._get_key(control), *args
+            ) == 1
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HSET VERSION): {e}")
+            return False
+
+    # VERSIONES ASYNC (mismas claves y scripts que las sync)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        if not self.aclient: return None
+        try:
+            return await self.aclient.get(self._get_key(key))
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (GET): {e}")
+            return None
+
+    async def set_async(self, key: str, value: str, ttl: int = 60) -> bool:
+        if not self.aclient: return False
+        try:
+            return await self.aclient.set(self._get_key(key), value, ex=ttl)
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (SET): {e}")
+            return False
+
+    async def set_nx_async(self, key: str, value: str, ttl: int = 60) -> Optional[bool]:
+        if not self.aclient: return None
+        try:
+            return bool(await self.aclient.set(self._get_key(key), value, ex=ttl, nx=True))
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (SET NX): {e}")
+            return None
+
+    async def delete_async(self, key: str) -> bool:
+        if not self.aclient: return False
+        try:
+            return await self.aclient.delete(self._get_key(key)) > 0
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (DELETE): {e}")
+            return False
+
+    async def hgetall_async(self, key: str) -> dict:
+        if not self.aclient: return {}
+        try:
+            return await self.aclient.hgetall(self._get_key(key))
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HGETALL): {e}")
+            return {}
+
+    async def hincrby_async(self, key: str, campo: str, incremento: int = 1, ttl: int = 60) -> Optional[int]:
+        if not self.aclient: return None
+        try:
+            full_key = self._get_key(key)
+            pipe = self.aclient.pipeline()
+            pipe.hincrby(full_key, campo, incremento)
+            pipe.expire(full_key, ttl)
+            return (await pipe.execute())[0]
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HINCRBY): {e}")
+            return None
+
+    async def hincrby_y_liberar_async(self, key: str, control: str, incrementos: dict, ttl: int = 60) -> bool:
+        if not self.aclient: return False
+        try:
+            args = [ttl, ttl]
+            for campo, valor in incrementos.items():
+                args.extend([campo, int(valor)])
+            return await self.aclient.eval(
+                self._SCRIPT_HINCRBY_Y_LIBERAR, 2, self._get_key(key), self._get_key(control), *args
+            ) == 1
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HINCRBY LIBERAR): {e}")
+            return False
+
+    async def hset_si_version_async(self, key: str, control: str, version: str, mapping: dict, ttl: int = 60) -> bool:
+        if not self.aclient: return False
+        try:
+            args = [version, ttl]
+            for campo, valor in mapping.items():
+                args.extend([campo, valor])
+            return await self.aclient.eval(
+                self._SCRIPT_HSET_SI_VERSION, 2, self._get_key(key), self._get_key(control), *args
+            ) == 1
+        except redis.RedisError as e:
+            logger.error(f"Redis Error (HSET VERSION): {e}")
+            return False
+
     def delete_pattern(self, pattern: str):
         if not self.client: return
         try:
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _por_defecto(valor):
+    # Mismo criterio que jsonable_encoder: Decimal como número
+    if isinstance(valor, Decimal):
+        return float(valor)
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def dumps(contenido) -> bytes:
+    """JSON con orjson (datetime, date, enum y dict/list nativos; Decimal como float)."""
+    return orjson.dumps(contenido, default=_por_defecto, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSONResponse serializada con orjson.
+    Con response_model FastAPI valida igual y solo cambia el json.dumps final; retornándola directamente
+    (modo proyección) se evita además la validación y jsonable_encoder.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
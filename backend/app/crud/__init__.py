@@ -6,3 +6,6 @@ from .inventarios import *
 from .caja import *
 from .documentos import *
 from .dashboard import *
+from .outbox import *
+from .exportacion import *
+from .asincrono import *
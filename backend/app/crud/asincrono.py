@@ -0,0 +1,91 @@
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import schemas
+from app.core.paginacion import ConteoPrecargado
+
+# VERSIONES ASYNC (AsyncSession)
+# Reutilizan la lógica sync mediante AsyncSession.run_sync: las consultas corren sobre asyncpg
+# en un greenlet, sin ocupar un hilo del threadpool. La serialización a esquemas se hace dentro
+# de run_sync para que las relaciones lazy se carguen en el mismo contexto.
+# run_sync corre en el hilo del event loop: las llamadas a Redis se hacen antes o después, con el
+# cliente async, nunca dentro.
+
+async def get_usuario_by_email_async(db: AsyncSession, email: str):
+    from .usuarios import get_usuario_by_email
+    return await db.run_sync(get_usuario_by_email, email)
+
+async def get_productos_async(db: AsyncSession, **filtros):
+    from .productos import get_productos, filtros_conteo_productos
+
+    # El total cacheado se lee y guarda con el cliente async, fuera de run_sync
+    conteo = None
+    if filtros.get("cursor") is None:
+        conteo = ConteoPrecargado("productos", filtros_conteo_productos(
+            filtros.get("busqueda"), filtros.get("id_categoria"), filtros.get("unidad_medida"),
+            filtros.get("precio_min"), filtros.get("precio_max")
+        ))
+        await conteo.leer()
+
+    def _consultar(session):
+        resultado = get_productos(session, conteo=conteo, **filtros)
+        if filtros.get("proyeccion") or filtros.get("fields"):
+            # Ya son dicts de columnas, se serializan sin pasar por el esquema
+            return resultado
+        return schemas.ProductoPaginatedResponse.model_validate(resultado, from_attributes=True)
+
+    resultado = await db.run_sync(_consultar)
+    if conteo:
+        await conteo.guardar()
+    return resultado
+
+async def get_inventario_agrupado_async(db: AsyncSession, **filtros):
+    from .inventarios import get_inventario_agrupado
+
+    def _consultar(session):
+        resultado = get_inventario_agrupado(session, **filtros)
+        return schemas.InventarioPaginatedResponse.model_validate(resultado)
+
+    return await db.run_sync(_consultar)
+
+async def verificar_estado_caja_async(db: AsyncSession, sucursal_id: int):
+    from .caja import verificar_estado_caja
+    return await db.run_sync(verificar_estado_caja, sucursal_id)
+
+async def obtener_resumen_caja_async(db: AsyncSession, sucursal_id: int, id_apertura: Optional[int] = None, detalle: bool = True):
+    from .caja import obtener_resumen_caja, obtener_resumen_contadores_async
+
+    if not detalle:
+        # Contadores en vivo: Redis con el cliente async, solo las consultas SQL en run_sync
+        resumen = await obtener_resumen_contadores_async(db, sucursal_id, id_apertura=id_apertura)
+        if "error" in resumen:
+            return resumen
+        return schemas.CajaResumenResponse.model_validate(resumen, from_attributes=True)
+
+    def _consultar(session):
+        resumen = obtener_resumen_caja(session, sucursal_id, id_apertura=id_apertura, detalle=detalle)
+        if "error" in resumen:
+            return resumen
+        return schemas.CajaResumenResponse.model_validate(resumen, from_attributes=True)
+
+    return await db.run_sync(_consultar)
+
+async def create_documento_async(db: AsyncSession, documento: schemas.DocumentoCreate):
+    from .documentos import preparar_documento
+    from .caja import confirmar_y_sumar_contadores_async
+
+    preparado = await db.run_sync(preparar_documento, documento)
+    if isinstance(preparado, dict):
+        return preparado
+    db_documento, incrementos_apertura = preparado
+
+    # Commit y contadores en vivo fuera de run_sync (cliente Redis async)
+    await confirmar_y_sumar_contadores_async(db, incrementos_apertura)
+    return await db.run_sync(lambda session: schemas.DocumentoResponse.model_validate(db_documento, from_attributes=True))
+
+async def create_documentos_lote_async(db: AsyncSession, documentos, aperturas: dict):
+    from .documentos import preparar_documentos_lote
+    from .caja import confirmar_y_sumar_contadores_async
+
+    resultado, incrementos_apertura = await db.run_sync(preparar_documentos_lote, documentos, aperturas)
+    await confirmar_y_sumar_contadores_async(db, incrementos_apertura)
+    return schemas.DocumentoLoteResponse.model_validate(resultado)
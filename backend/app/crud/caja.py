@@ -1,8 +1,11 @@
 from typing import Optional
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.orm import Session, joinedload, aliased
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, case, func, desc, select
 from datetime import datetime, timedelta
 from app import models, schemas
+from app.core.redis import redis_service
 
 # CAJA (APERTURA / CIERRE / CUADRATURA)
 
@@ -32,6 +35,9 @@ def abrir_caja(db: Session, sucursal_id: int, usuario_id: int, monto: float):
     db.add(movimiento)
     db.commit()
     db.refresh(movimiento)
+
+    # Sesión nueva: contadores en cero
+    iniciar_contadores_caja(movimiento.id_movimiento)
     return movimiento
 
 def verificar_estado_caja(db: Session, sucursal_id: int):
@@ -79,7 +85,7 @@ def registrar_movimiento_caja(db: Session, movimiento: schemas.MovimientoCajaCre
         
         # monto de total del documento si no se especifica
         if monto_final is None:
-            monto_final = doc.total # Usamos la propiedad calculada
+            monto_final = doc.total # Total persistido al crear el documento
             
     if monto_final is None:
          return {"error": "Debe especificar un monto si no asocia un documento."}
@@ -90,11 +96,146 @@ def registrar_movimiento_caja(db: Session, movimiento: schemas.MovimientoCajaCre
     
     db_mov = models.MovimientosCaja(**datos_mov)
     db.add(db_mov)
-    db.commit()
+    # Movimientos extra (los asociados a documentos ya cuentan como venta/compra)
+    if not db_mov.id_documento_asociado and db_mov.tipo in (models.TipoMovimientoCaja.INGRESO, models.TipoMovimientoCaja.EGRESO):
+        campo = "ingresos_extra" if db_mov.tipo == models.TipoMovimientoCaja.INGRESO else "egresos_extra"
+        monto = db_mov.monto
+        confirmar_con_contadores(db, ultimo.id_movimiento)
+        sumar_contadores_caja(ultimo.id_movimiento, **{campo: monto})
+    else:
+        db.commit()
     db.refresh(db_mov)
     return db_mov
 
-def obtener_resumen_caja(db: Session, sucursal_id: int, id_apertura: Optional[int] = None):
+# CONTADORES EN VIVO (Redis)
+# Totales de la sesión abierta por apertura, mantenidos al escribir para que el resumen sea O(1).
+# Montos en centavos enteros (HINCRBY): sin errores de redondeo de float.
+# Si la clave no existe (expiró, Redis reiniciado) se reconstruye desde SQL al leer. Para que la
+# reconstrucción no pierda ni duplique una escritura concurrente, cada escritura se reserva antes de su
+# commit (confirmar_con_contadores) y se libera al sumar; el resultado de SQL solo se cachea si no hubo
+# escrituras en curso ni terminadas mientras se calculaba (hash de control con pendientes / version).
+
+CAMPOS_CONTADORES = ("ventas", "compras", "ingresos_extra", "egresos_extra")
+TTL_CONTADORES = 2 * 86400
+
+def _clave_contadores(id_apertura: int) -> str:
+    return f"caja:contadores:{id_apertura}"
+
+def _clave_control_contadores(id_apertura: int) -> str:
+    return f"caja:contadores:{id_apertura}:control"
+
+def _centavos(valor) -> int:
+    return int((Decimal(str(valor)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def iniciar_contadores_caja(id_apertura: int):
+    # Solo al abrir: la sesión aún no tiene escrituras
+    redis_service.hset(
+        _clave_contadores(id_apertura),
+        {campo: 0 for campo in CAMPOS_CONTADORES},
+        ttl=TTL_CONTADORES
+    )
+
+def confirmar_con_contadores(db: Session, *id_aperturas: int):
+    """
+    db.commit() de una escritura que después sumará a los contadores de id_aperturas (ninguna: no suma).
+    Debe seguirle siempre sumar_contadores_caja por cada apertura, que libera su reserva.
+    """
+    for id_apertura in id_aperturas:
+        redis_service.hincrby(_clave_control_contadores(id_apertura), "pendientes", 1, ttl=TTL_CONTADORES)
+    try:
+        db.commit()
+    except Exception:
+        for id_apertura in id_aperturas:
+            sumar_contadores_caja(id_apertura)
+        raise
+
+async def confirmar_con_contadores_async(db: AsyncSession, *id_aperturas: int):
+    """confirmar_con_contadores para el camino async: reserva con el cliente Redis async y await db.commit()."""
+    for id_apertura in id_aperturas:
+        await redis_service.hincrby_async(_clave_control_contadores(id_apertura), "pendientes", 1, ttl=TTL_CONTADORES)
+    try:
+        await db.commit()
+    except Exception:
+        for id_apertura in id_aperturas:
+            await sumar_contadores_caja_async(id_apertura)
+        raise
+
+def sumar_contadores_caja(id_apertura: int, **incrementos):
+    redis_service.hincrby_y_liberar(
+        _clave_contadores(id_apertura),
+        _clave_control_contadores(id_apertura),
+        {campo: _centavos(valor) for campo, valor in incrementos.items()},
+        ttl=TTL_CONTADORES
+    )
+
+async def sumar_contadores_caja_async(id_apertura: int, **incrementos):
+    await redis_service.hincrby_y_liberar_async(
+        _clave_contadores(id_apertura),
+        _clave_control_contadores(id_apertura),
+        {campo: _centavos(valor) for campo, valor in incrementos.items()},
+        ttl=TTL_CONTADORES
+    )
+
+def confirmar_y_sumar_contadores(db: Session, incrementos_apertura: dict):
+    """Commit de una escritura ya preparada y sus sumas a los contadores: {id_apertura: {campo: monto}}."""
+    confirmar_con_contadores(db, *incrementos_apertura)
+    for id_apertura, incrementos in incrementos_apertura.items():
+        sumar_contadores_caja(id_apertura, **incrementos)
+
+async def confirmar_y_sumar_contadores_async(db: AsyncSession, incrementos_apertura: dict):
+    await confirmar_con_contadores_async(db, *incrementos_apertura)
+    for id_apertura, incrementos in incrementos_apertura.items():
+        await sumar_contadores_caja_async(id_apertura, **incrementos)
+
+def eliminar_contadores_caja(id_apertura: int):
+    redis_service.delete(_clave_contadores(id_apertura))
+    redis_service.delete(_clave_control_contadores(id_apertura))
+
+def _contadores_desde_redis(datos: dict) -> dict:
+    return {campo: Decimal(int(datos.get(campo, 0))) / 100 for campo in CAMPOS_CONTADORES}
+
+def _totales_sesion(db: Session, apertura: models.MovimientosCaja) -> dict:
+    return sumar_periodo(db, apertura.id_sucursal, apertura.fecha, models.get_now_chile() + timedelta(seconds=1))
+
+def obtener_contadores_caja(db: Session, apertura: models.MovimientosCaja) -> dict:
+    datos = redis_service.hgetall(_clave_contadores(apertura.id_movimiento))
+    if datos:
+        return _contadores_desde_redis(datos)
+
+    # Miss: reconstruir desde SQL. La versión se lee antes de sumar; si cambia (o hay escrituras
+    # reservadas) no se cachea y la próxima lectura vuelve a intentarlo.
+    control = redis_service.hgetall(_clave_control_contadores(apertura.id_movimiento))
+    totales = _totales_sesion(db, apertura)
+    if int(control.get("pendientes", 0)) == 0:
+        redis_service.hset_si_version(
+            _clave_contadores(apertura.id_movimiento),
+            _clave_control_contadores(apertura.id_movimiento),
+            control.get("version", "0"),
+            {campo: _centavos(totales[campo]) for campo in CAMPOS_CONTADORES},
+            ttl=TTL_CONTADORES
+        )
+    return totales
+
+async def obtener_contadores_caja_async(db: AsyncSession, apertura: models.MovimientosCaja) -> dict:
+    """obtener_contadores_caja con el cliente Redis async; solo la suma SQL de la reconstrucción va en run_sync."""
+    datos = await redis_service.hgetall_async(_clave_contadores(apertura.id_movimiento))
+    if datos:
+        return _contadores_desde_redis(datos)
+
+    control = await redis_service.hgetall_async(_clave_control_contadores(apertura.id_movimiento))
+    totales = await db.run_sync(_totales_sesion, apertura)
+    if int(control.get("pendientes", 0)) == 0:
+        await redis_service.hset_si_version_async(
+            _clave_contadores(apertura.id_movimiento),
+            _clave_control_contadores(apertura.id_movimiento),
+            control.get("version", "0"),
+            {campo: _centavos(totales[campo]) for campo in CAMPOS_CONTADORES},
+            ttl=TTL_CONTADORES
+        )
+    return totales
+
+def _apertura_resumen(db: Session, sucursal_id: int, id_apertura: Optional[int] = None):
+    """Apertura del resumen, o el dict a retornar (error, o caja CERRADA)."""
     # Buscar última apertura o la específica solicitada
     ultimo = None
     if id_apertura:
@@ -119,16 +260,49 @@ def obtener_resumen_caja(db: Session, sucursal_id: int, id_apertura: Optional[in
             "saldo_teorico": 0,
             "estado": "CERRADA"
         }
-    
+    return ultimo
+
+def obtener_resumen_caja(db: Session, sucursal_id: int, id_apertura: Optional[int] = None, detalle: bool = True):
+    """
+    detalle=False: solo totales, leídos de los contadores en Redis (polling del POS).
+    detalle=True: totales desde SQL más las listas de documentos y movimientos extra.
+    """
+    ultimo = _apertura_resumen(db, sucursal_id, id_apertura)
+    if isinstance(ultimo, dict):
+        return ultimo
+
     # Calcular hasta AHORA
-    resumen = calcular_resumen_periodo(db, sucursal_id, ultimo.fecha, models.get_now_chile() + timedelta(seconds=1), ultimo.monto)
+    fecha_fin = models.get_now_chile() + timedelta(seconds=1)
+    if detalle:
+        resumen = calcular_resumen_periodo(db, sucursal_id, ultimo.fecha, fecha_fin, ultimo.monto)
+    else:
+        resumen = _armar_resumen(ultimo.monto, obtener_contadores_caja(db, ultimo), ultimo.fecha, fecha_fin)
     resumen["estado"] = "ABIERTA"
+    resumen["id_apertura"] = ultimo.id_movimiento
+    return resumen
+
+async def obtener_resumen_contadores_async(db: AsyncSession, sucursal_id: int, id_apertura: Optional[int] = None):
+    """obtener_resumen_caja(detalle=False) para el camino async: la apertura por SQL y los contadores con Redis async."""
+    ultimo = await db.run_sync(_apertura_resumen, sucursal_id, id_apertura)
+    if isinstance(ultimo, dict):
+        return ultimo
+
+    fecha_fin = models.get_now_chile() + timedelta(seconds=1)
+    resumen = _armar_resumen(ultimo.monto, await obtener_contadores_caja_async(db, ultimo), ultimo.fecha, fecha_fin)
+    resumen["estado"] = "ABIERTA"
+    resumen["id_apertura"] = ultimo.id_movimiento
     return resumen
 
 def cerrar_caja(db: Session, sucursal_id: int, usuario_id: int, monto_real: float, id_apertura: Optional[int] = None):
     resumen = obtener_resumen_caja(db, sucursal_id, id_apertura=id_apertura)
     if "error" in resumen:
         return resumen
+    if resumen["estado"] != "ABIERTA":
+        return {"error": "No hay caja abierta para cerrar"}
+    if get_cierre_caja(db, resumen["id_apertura"]):
+        return {"error": "La sesión de caja ya fue cerrada"}
+
+    diferencia = Decimal(str(monto_real)) - Decimal(resumen["saldo_teorico"])
 
     # Registrar cierre
     cierre = models.MovimientosCaja(
@@ -136,27 +310,113 @@ def cerrar_caja(db: Session, sucursal_id: int, usuario_id: int, monto_real: floa
         id_usuario=usuario_id,
         tipo=models.TipoMovimientoCaja.CIERRE,
         monto=monto_real, 
-        descripcion=f"Cierre de Caja {id_apertura if id_apertura else 'General'}. Diferencia: {float(monto_real) - float(resumen['saldo_teorico'])}"
+        descripcion=f"Cierre de Caja {id_apertura if id_apertura else 'General'}. Diferencia: {float(diferencia)}"
     )
     db.add(cierre)
+    db.flush()
+
+    # Reporte de productos del mismo periodo que los totales
+    productos = obtener_reporte_productos(db, sucursal_id, resumen["fecha_inicio"], resumen["fecha_fin"])
+
+    # Cuadratura congelada, en la misma transacción que el cierre
+    db.add(models.CierreCaja(
+        id_apertura=resumen["id_apertura"],
+        id_cierre=cierre.id_movimiento,
+        id_sucursal=sucursal_id,
+        fecha_apertura=resumen["fecha_inicio"],
+        fecha_cierre=cierre.fecha,
+        saldo_inicial=resumen["saldo_inicial"],
+        ingresos_ventas=resumen["ingresos_ventas"],
+        egresos_compras=resumen["egresos_compras"],
+        ingresos_extra=resumen["ingresos_extra"],
+        egresos_extra=resumen["egresos_extra"],
+        saldo_teorico=resumen["saldo_teorico"],
+        monto_real=monto_real,
+        diferencia=diferencia,
+        productos=productos
+    ))
     db.commit()
     db.refresh(cierre)
 
-    # Calcular reporte de productos
-    productos = obtener_reporte_productos(db, sucursal_id, resumen["fecha_inicio"], models.get_now_chile() + timedelta(seconds=1)) 
+    eliminar_contadores_caja(resumen["id_apertura"])
 
     return {
         **resumen,
         "monto_real": monto_real,
-        "diferencia": float(monto_real) - float(resumen['saldo_teorico']),
+        "diferencia": float(diferencia),
         "productos": productos
     }
 
+def get_cierre_caja(db: Session, id_apertura: int):
+    return db.query(models.CierreCaja).filter(models.CierreCaja.id_apertura == id_apertura).first()
 
-def calcular_resumen_periodo(db: Session, sucursal_id: int, fecha_inicio: datetime, fecha_fin: datetime, saldo_inicial: float):
+def _resumen_desde_cierre(snapshot: models.CierreCaja) -> dict:
+    return {
+        "saldo_inicial": int(snapshot.saldo_inicial),
+        "ingresos_ventas": int(snapshot.ingresos_ventas),
+        "egresos_compras": int(snapshot.egresos_compras),
+        "ingresos_extra": int(snapshot.ingresos_extra),
+        "egresos_extra": int(snapshot.egresos_extra),
+        "saldo_teorico": int(snapshot.saldo_teorico),
+        "fecha_inicio": snapshot.fecha_apertura,
+        "fecha_fin": snapshot.fecha_cierre
+    }
+
+def reconstruir_cierres_caja(db: Session) -> int:
+    """
+    Genera la cuadratura congelada de las sesiones cerradas antes de existir cierres_caja.
+    Recalcula desde los documentos actuales, por lo que puede diferir de lo visto al cerrar.
+    """
+    cierres = db.query(models.MovimientosCaja).outerjoin(
+        models.CierreCaja, models.CierreCaja.id_cierre == models.MovimientosCaja.id_movimiento
+    ).filter(
+        models.MovimientosCaja.tipo == models.TipoMovimientoCaja.CIERRE,
+        models.CierreCaja.id_cierre.is_(None)
+    ).order_by(models.MovimientosCaja.fecha.asc()).all()
+
+    creados = 0
+    for cierre in cierres:
+        # Apertura de la sesión: el último APERTURA/CIERRE anterior de la sucursal, si es APERTURA
+        anterior = db.query(models.MovimientosCaja).filter(
+            models.MovimientosCaja.id_sucursal == cierre.id_sucursal,
+            models.MovimientosCaja.tipo.in_([models.TipoMovimientoCaja.APERTURA, models.TipoMovimientoCaja.CIERRE]),
+            models.MovimientosCaja.fecha < cierre.fecha
+        ).order_by(desc(models.MovimientosCaja.fecha)).first()
+        if not anterior or anterior.tipo != models.TipoMovimientoCaja.APERTURA:
+            continue
+        if get_cierre_caja(db, anterior.id_movimiento):
+            continue
+
+        resumen = _armar_resumen(anterior.monto, sumar_periodo(db, cierre.id_sucursal, anterior.fecha, cierre.fecha), anterior.fecha, cierre.fecha)
+        diferencia = _diferencia_desde_descripcion(cierre.descripcion)
+        if diferencia is None:
+            diferencia = cierre.monto - Decimal(resumen["saldo_teorico"])
+
+        db.add(models.CierreCaja(
+            id_apertura=anterior.id_movimiento,
+            id_cierre=cierre.id_movimiento,
+            id_sucursal=cierre.id_sucursal,
+            fecha_apertura=anterior.fecha,
+            fecha_cierre=cierre.fecha,
+            saldo_inicial=resumen["saldo_inicial"],
+            ingresos_ventas=resumen["ingresos_ventas"],
+            egresos_compras=resumen["egresos_compras"],
+            ingresos_extra=resumen["ingresos_extra"],
+            egresos_extra=resumen["egresos_extra"],
+            saldo_teorico=resumen["saldo_teorico"],
+            monto_real=cierre.monto,
+            diferencia=diferencia,
+            productos=obtener_reporte_productos(db, cierre.id_sucursal, anterior.fecha, cierre.fecha)
+        ))
+        db.commit()
+        creados += 1
+
+    return creados
+
+
+def sumar_periodo(db: Session, sucursal_id: int, fecha_inicio: datetime, fecha_fin: datetime) -> dict:
     #  Sumar Ventas (Ingresos)
-    ventas = db.query(func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario * (1 - models.DetalleDocumento.descuento / 100)))\
-        .join(models.Documento)\
+    ventas = db.query(func.sum(models.Documento.total))\
         .filter(
             models.Documento.id_sucursal == sucursal_id,
             models.Documento.fecha_emision >= fecha_inicio,
@@ -166,8 +426,7 @@ def calcular_resumen_periodo(db: Session, sucursal_id: int, fecha_inicio: dateti
         ).scalar() or 0
         
     # Sumar Compras (Egresos)
-    compras = db.query(func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario * (1 - models.DetalleDocumento.descuento / 100)))\
-        .join(models.Documento)\
+    compras = db.query(func.sum(models.Documento.total))\
         .filter(
             models.Documento.id_sucursal == sucursal_id,
             models.Documento.fecha_emision >= fecha_inicio,
@@ -194,8 +453,29 @@ def calcular_resumen_periodo(db: Session, sucursal_id: int, fecha_inicio: dateti
             models.MovimientosCaja.tipo == models.TipoMovimientoCaja.EGRESO,
             models.MovimientosCaja.id_documento_asociado.is_(None)
         ).scalar() or 0
-        
-    saldo_teorico = saldo_inicial + ventas + ingresos_extra - compras - egresos_extra
+
+    return {
+        "ventas": ventas,
+        "compras": compras,
+        "ingresos_extra": ingresos_extra,
+        "egresos_extra": egresos_extra
+    }
+
+def _armar_resumen(saldo_inicial, totales: dict, fecha_inicio: datetime, fecha_fin: datetime) -> dict:
+    saldo_teorico = saldo_inicial + totales["ventas"] + totales["ingresos_extra"] - totales["compras"] - totales["egresos_extra"]
+    return {
+        "saldo_inicial": int(saldo_inicial),
+        "ingresos_ventas": int(totales["ventas"]),
+        "egresos_compras": int(totales["compras"]),
+        "ingresos_extra": int(totales["ingresos_extra"]),
+        "egresos_extra": int(totales["egresos_extra"]),
+        "saldo_teorico": int(saldo_teorico),
+        "fecha_inicio": fecha_inicio,
+        "fecha_fin": fecha_fin
+    }
+
+def calcular_resumen_periodo(db: Session, sucursal_id: int, fecha_inicio: datetime, fecha_fin: datetime, saldo_inicial: float):
+    totales = sumar_periodo(db, sucursal_id, fecha_inicio, fecha_fin)
     
     # Obtener Lista de Documentos
     docs = db.query(models.Documento)\
@@ -219,14 +499,7 @@ def calcular_resumen_periodo(db: Session, sucursal_id: int, fecha_inicio: dateti
         ).order_by(models.MovimientosCaja.fecha.desc()).all()
 
     return {
-        "saldo_inicial": int(saldo_inicial),
-        "ingresos_ventas": int(ventas),
-        "egresos_compras": int(compras),
-        "ingresos_extra": int(ingresos_extra),
-        "egresos_extra": int(egresos_extra),
-        "saldo_teorico": int(saldo_teorico),
-        "fecha_inicio": fecha_inicio,
-        "fecha_fin": fecha_fin,
+        **_armar_resumen(saldo_inicial, totales, fecha_inicio, fecha_fin),
         "documentos": docs,
         "movimientos_extra": movs_extra
     }
@@ -301,61 +574,147 @@ def obtener_reporte_productos(db: Session, sucursal_id: int, fecha_inicio: datet
         
     return list(reporte.values())
 
+def _diferencia_desde_descripcion(descripcion: Optional[str]):
+    # El cierre guarda "... Diferencia: <monto>" en la descripción
+    partes = (descripcion or "").split("Diferencia: ")
+    if len(partes) > 1:
+        try:
+            return float(partes[1])
+        except ValueError:
+            pass
+    return None
+
 def get_reporte_caja_historico(db, fecha_inicio: datetime, fecha_fin: datetime, sucursal_id: Optional[int] = None, usuario_id: Optional[int] = None):
-    # Buscar Aperturas en rango
-    query = db.query(models.MovimientosCaja).filter(
-        models.MovimientosCaja.tipo == models.TipoMovimientoCaja.APERTURA,
-        models.MovimientosCaja.fecha >= fecha_inicio,
-        models.MovimientosCaja.fecha <= fecha_fin
+    """
+    Sesiones de caja del rango en una sola consulta:
+    - LEAD sobre APERTURA/CIERRE por sucursal empareja cada apertura con el evento siguiente.
+    - Sesiones cerradas: totales de la cuadratura congelada (cierres_caja).
+    - El resto: dos agregados agrupados por id_apertura.
+    No incluye las listas de documentos/movimientos (ver get_detalle_sesion_caja).
+    """
+    MC = models.MovimientosCaja
+    D = models.Documento
+    ahora = models.get_now_chile() + timedelta(seconds=1)
+
+    # 1 Eventos de apertura/cierre con el evento siguiente de la misma sucursal
+    ventana = {"partition_by": MC.id_sucursal, "order_by": MC.fecha}
+    eventos = select(
+        MC.id_movimiento, MC.id_sucursal, MC.id_usuario, MC.tipo, MC.fecha, MC.monto,
+        func.lead(MC.tipo, type_=MC.tipo.type).over(**ventana).label("sig_tipo"),
+        func.lead(MC.fecha, type_=MC.fecha.type).over(**ventana).label("sig_fecha"),
+        func.lead(MC.monto, type_=MC.monto.type).over(**ventana).label("sig_monto"),
+        func.lead(MC.descripcion, type_=MC.descripcion.type).over(**ventana).label("sig_descripcion"),
+        func.lead(MC.id_usuario, type_=MC.id_usuario.type).over(**ventana).label("sig_id_usuario"),
+    ).where(
+        MC.tipo.in_([models.TipoMovimientoCaja.APERTURA, models.TipoMovimientoCaja.CIERRE]),
+        MC.fecha >= fecha_inicio
     )
     if sucursal_id:
-        query = query.filter(models.MovimientosCaja.id_sucursal == sucursal_id)
+        eventos = eventos.where(MC.id_sucursal == sucursal_id)
+    eventos = eventos.subquery("eventos")
+
+    # 2 Sesiones: la apertura queda cerrada solo si el evento siguiente es un CIERRE.
+    #   Si tiene cuadratura congelada (cierres_caja) se usa esa y no se recalcula
+    cerrada = eventos.c.sig_tipo == models.TipoMovimientoCaja.CIERRE
+    CC = models.CierreCaja
+    sesiones = select(
+        eventos.c.id_movimiento.label("id_apertura"),
+        eventos.c.id_sucursal,
+        eventos.c.id_usuario,
+        eventos.c.fecha.label("fecha_apertura"),
+        eventos.c.monto.label("saldo_inicial"),
+        case((cerrada, eventos.c.sig_fecha)).label("fecha_cierre"),
+        case((cerrada, eventos.c.sig_monto)).label("monto_real"),
+        case((cerrada, eventos.c.sig_descripcion)).label("descripcion_cierre"),
+        case((cerrada, eventos.c.sig_id_usuario)).label("id_usuario_cierre"),
+        CC.id_cierre.label("cc_id_cierre"),
+        CC.ingresos_ventas.label("cc_ventas"),
+        CC.egresos_compras.label("cc_compras"),
+        CC.ingresos_extra.label("cc_ingresos_extra"),
+        CC.egresos_extra.label("cc_egresos_extra"),
+        CC.diferencia.label("cc_diferencia"),
+    ).select_from(eventos).outerjoin(
+        CC, CC.id_apertura == eventos.c.id_movimiento
+    ).where(
+        eventos.c.tipo == models.TipoMovimientoCaja.APERTURA,
+        eventos.c.fecha <= fecha_fin
+    )
     if usuario_id:
-        query = query.filter(models.MovimientosCaja.id_usuario == usuario_id)
-        
-    aperturas = query.order_by(desc(models.MovimientosCaja.fecha)).all()
-    
+        sesiones = sesiones.where(eventos.c.id_usuario == usuario_id)
+    sesiones = sesiones.cte("sesiones")
+    fin_sesion = func.coalesce(sesiones.c.fecha_cierre, ahora)
+
+    # 3 Totales por sesión sin cuadratura congelada (documentos pagados y movimientos extra)
+    tot_docs = select(
+        sesiones.c.id_apertura,
+        func.sum(case((D.tipo_operacion == models.TipoOperacion.VENTA, D.total), else_=0)).label("ventas"),
+        func.sum(case((D.tipo_operacion == models.TipoOperacion.COMPRA, D.total), else_=0)).label("compras"),
+    ).select_from(sesiones).join(D, and_(
+        D.id_sucursal == sesiones.c.id_sucursal,
+        D.fecha_emision >= sesiones.c.fecha_apertura,
+        D.fecha_emision <= fin_sesion
+    )).where(
+        sesiones.c.cc_id_cierre.is_(None),
+        D.estado_pago == models.EstadoPago.PAGADO
+    ).group_by(sesiones.c.id_apertura).subquery("tot_docs")
+
+    tot_movs = select(
+        sesiones.c.id_apertura,
+        func.sum(case((MC.tipo == models.TipoMovimientoCaja.INGRESO, MC.monto), else_=0)).label("ingresos_extra"),
+        func.sum(case((MC.tipo == models.TipoMovimientoCaja.EGRESO, MC.monto), else_=0)).label("egresos_extra"),
+    ).select_from(sesiones).join(MC, and_(
+        MC.id_sucursal == sesiones.c.id_sucursal,
+        MC.fecha >= sesiones.c.fecha_apertura,
+        MC.fecha <= fin_sesion
+    )).where(
+        sesiones.c.cc_id_cierre.is_(None),
+        MC.tipo.in_([models.TipoMovimientoCaja.INGRESO, models.TipoMovimientoCaja.EGRESO]),
+        MC.id_documento_asociado.is_(None)
+    ).group_by(sesiones.c.id_apertura).subquery("tot_movs")
+
+    # 4 Todo junto, con nombres de usuarios y sucursal
+    usuario_ape = aliased(models.Usuario)
+    usuario_cie = aliased(models.Usuario)
+    filas = db.execute(
+        select(
+            *sesiones.c,
+            func.coalesce(sesiones.c.cc_ventas, tot_docs.c.ventas, 0).label("ventas"),
+            func.coalesce(sesiones.c.cc_compras, tot_docs.c.compras, 0).label("compras"),
+            func.coalesce(sesiones.c.cc_ingresos_extra, tot_movs.c.ingresos_extra, 0).label("ingresos_extra"),
+            func.coalesce(sesiones.c.cc_egresos_extra, tot_movs.c.egresos_extra, 0).label("egresos_extra"),
+            usuario_ape.nombre.label("usuario_apertura"),
+            usuario_cie.nombre.label("usuario_cierre"),
+            models.Sucursal.nombre.label("sucursal"),
+        ).select_from(sesiones)
+        .join(usuario_ape, usuario_ape.id_usuario == sesiones.c.id_usuario)
+        .outerjoin(usuario_cie, usuario_cie.id_usuario == sesiones.c.id_usuario_cierre)
+        .join(models.Sucursal, models.Sucursal.id_sucursal == sesiones.c.id_sucursal)
+        .outerjoin(tot_docs, tot_docs.c.id_apertura == sesiones.c.id_apertura)
+        .outerjoin(tot_movs, tot_movs.c.id_apertura == sesiones.c.id_apertura)
+        .order_by(sesiones.c.fecha_apertura.desc())
+    ).all()
+
     reporte = []
-    for ape in aperturas:
-        # Buscar Cierre correspondiente (el siguiente cierre de esa sucursal despues de ape.fecha)
-        # O asumir que el periodo es hasta el siguiente cierre.
-        cierre = db.query(models.MovimientosCaja).filter(
-            models.MovimientosCaja.id_sucursal == ape.id_sucursal,
-            models.MovimientosCaja.tipo == models.TipoMovimientoCaja.CIERRE,
-            models.MovimientosCaja.fecha > ape.fecha
-        ).order_by(models.MovimientosCaja.fecha.asc()).first()
-        
-        fecha_fin_calculo = cierre.fecha if cierre else models.get_now_chile() + timedelta(seconds=1) 
-        
-        # Calcular resumen
-        resumen = calcular_resumen_periodo(db, ape.id_sucursal, ape.fecha, fecha_fin_calculo, ape.monto)
-        
-        # Extraer diferencia del cierre si existe
-        diff = None
-        monto_real = None
-        if cierre:
-            desc_parts = cierre.descripcion.split("Diferencia: ")
-            if len(desc_parts) > 1:
-                try:
-                    diff = float(desc_parts[1])
-                except:
-                    pass
-            monto_real = cierre.monto
-
-        item = {
-            **resumen,
-            "id_apertura": ape.id_movimiento,
-            "fecha_apertura": ape.fecha,
-            "fecha_cierre": cierre.fecha if cierre else None,
-            "usuario_apertura": ape.usuario.nombre,
-            "usuario_cierre": cierre.usuario.nombre if cierre else None,
-            "sucursal": ape.sucursal.nombre,
-            "estado": "CERRADA" if cierre else "ABIERTA",
-            "monto_real": monto_real,
-            "diferencia": diff
+    for f in filas:
+        totales = {
+            "ventas": f.ventas,
+            "compras": f.compras,
+            "ingresos_extra": f.ingresos_extra,
+            "egresos_extra": f.egresos_extra
         }
-        reporte.append(item)
-        
+        reporte.append({
+            **_armar_resumen(f.saldo_inicial, totales, f.fecha_apertura, f.fecha_cierre or ahora),
+            "id_apertura": f.id_apertura,
+            "fecha_apertura": f.fecha_apertura,
+            "fecha_cierre": f.fecha_cierre,
+            "usuario_apertura": f.usuario_apertura,
+            "usuario_cierre": f.usuario_cierre,
+            "sucursal": f.sucursal,
+            "estado": "CERRADA" if f.fecha_cierre else "ABIERTA",
+            "monto_real": f.monto_real,
+            "diferencia": f.cc_diferencia if f.cc_id_cierre else _diferencia_desde_descripcion(f.descripcion_cierre)
+        })
+
     return reporte
 
 def get_movimiento(db: Session, movimiento_id: int):
@@ -367,17 +726,25 @@ def get_detalle_sesion_caja(db: Session, id_apertura: int):
     if not apertura or apertura.tipo != models.TipoMovimientoCaja.APERTURA:
         return None
     
-    # 2 Buscar Cierre
-    cierre = db.query(models.MovimientosCaja).filter(
-        models.MovimientosCaja.id_sucursal == apertura.id_sucursal,
-        models.MovimientosCaja.tipo == models.TipoMovimientoCaja.CIERRE,
-        models.MovimientosCaja.fecha > apertura.fecha
-    ).order_by(models.MovimientosCaja.fecha.asc()).first()
+    # 2 Sesión cerrada: cuadratura congelada al cierre
+    snapshot = get_cierre_caja(db, id_apertura)
+    if snapshot:
+        cierre = get_movimiento(db, snapshot.id_cierre)
+    else:
+        # Sesión abierta (o cerrada antes de existir cierres_caja)
+        cierre = db.query(models.MovimientosCaja).filter(
+            models.MovimientosCaja.id_sucursal == apertura.id_sucursal,
+            models.MovimientosCaja.tipo == models.TipoMovimientoCaja.CIERRE,
+            models.MovimientosCaja.fecha > apertura.fecha
+        ).order_by(models.MovimientosCaja.fecha.asc()).first()
     
     fecha_fin = cierre.fecha if cierre else models.get_now_chile() + timedelta(seconds=1)
     
-    # 3 Calcular Resumen Base 
-    resumen = calcular_resumen_periodo(db, apertura.id_sucursal, apertura.fecha, fecha_fin, apertura.monto)
+    # 3 Resumen Base 
+    if snapshot:
+        resumen = _resumen_desde_cierre(snapshot)
+    else:
+        resumen = calcular_resumen_periodo(db, apertura.id_sucursal, apertura.fecha, fecha_fin, apertura.monto)
     
     # 4 Obtener Movimientos de Caja (Ingresos/Egresos/Apertura/Cierre)
     movs = db.query(models.MovimientosCaja).filter(
@@ -401,19 +768,18 @@ def get_detalle_sesion_caja(db: Session, id_apertura: int):
     
     
     # 6. Obtener reporte de productos
-    productos = obtener_reporte_productos(db, apertura.id_sucursal, apertura.fecha, fecha_fin)
+    if snapshot:
+        productos = snapshot.productos
+    else:
+        productos = obtener_reporte_productos(db, apertura.id_sucursal, apertura.fecha, fecha_fin)
 
     # 7 Construir Respuesta
-    diff = None
-    monto_real = None
-    if cierre:
-         desc_parts = cierre.descripcion.split("Diferencia: ")
-         if len(desc_parts) > 1:
-             try:
-                 diff = float(desc_parts[1])
-             except:
-                 pass
-         monto_real = cierre.monto
+    if snapshot:
+        diff = snapshot.diferencia
+        monto_real = snapshot.monto_real
+    else:
+        diff = _diferencia_desde_descripcion(cierre.descripcion) if cierre else None
+        monto_real = cierre.monto if cierre else None
 
     return {
         **resumen,
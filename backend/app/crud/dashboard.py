@@ -1,25 +1,94 @@
 from typing import Optional
+from decimal import Decimal
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime
+from sqlalchemy import func, select, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import date, datetime
 from app import models
 
+# Ventana del top de categorías en el dashboard
+DIAS_TOP_CATEGORIAS = 30
+
+# ROLLUP VENTAS DIARIAS
+
+def actualizar_ventas_diarias(db: Session, fecha: date, sucursal_id: int, lineas, signo: int = 1):
+    """
+    Suma (signo=1) o resta (signo=-1) líneas de venta al rollup ventas_diarias. No hace commit.
+    lineas: iterable de (id_producto, id_categoria, cantidad, precio_unitario, descuento %)
+    """
+    # Agrupar por producto: un upsert no puede tocar la misma fila dos veces
+    por_producto = {}
+    for id_producto, id_categoria, cantidad, precio, descuento in lineas:
+        total_linea = Decimal(precio) * cantidad * (100 - Decimal(descuento)) / 100
+        fila = por_producto.setdefault(id_producto, {
+            "fecha": fecha,
+            "id_sucursal": sucursal_id,
+            "id_producto": id_producto,
+            "id_categoria": id_categoria,
+            "cantidad": 0,
+            "total": Decimal(0)
+        })
+        fila["cantidad"] += signo * cantidad
+        fila["total"] += signo * total_linea
+
+    if not por_producto:
+        return
+
+    stmt = pg_insert(models.VentaDiaria).values(list(por_producto.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.VentaDiaria.fecha, models.VentaDiaria.id_sucursal, models.VentaDiaria.id_producto],
+        set_={
+            "cantidad": models.VentaDiaria.cantidad + stmt.excluded.cantidad,
+            "total": models.VentaDiaria.total + stmt.excluded.total,
+            "id_categoria": stmt.excluded.id_categoria
+        }
+    )
+    db.execute(stmt)
+
+def reconstruir_ventas_diarias(db: Session, desde: Optional[date] = None) -> int:
+    """
+    Recalcula ventas_diarias desde documentos/detalle_documento (todo el historial o desde una fecha).
+    """
+    fecha = func.date(models.Documento.fecha_emision)
+    origen = select(
+        fecha.label("fecha"),
+        models.Documento.id_sucursal,
+        models.DetalleDocumento.id_producto,
+        models.Producto.id_categoria,
+        func.sum(models.DetalleDocumento.cantidad).label("cantidad"),
+        func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario * (100 - models.DetalleDocumento.descuento) / 100).label("total")
+    ).join(models.DetalleDocumento, models.DetalleDocumento.id_documento == models.Documento.id_documento)\
+     .join(models.Producto, models.DetalleDocumento.id_producto == models.Producto.id_producto)\
+     .where(
+        models.Documento.tipo_operacion == models.TipoOperacion.VENTA,
+        models.Documento.estado_pago == models.EstadoPago.PAGADO
+    ).group_by(fecha, models.Documento.id_sucursal, models.DetalleDocumento.id_producto, models.Producto.id_categoria)
+
+    borrar = delete(models.VentaDiaria)
+    if desde:
+        origen = origen.where(models.Documento.fecha_emision >= desde)
+        borrar = borrar.where(models.VentaDiaria.fecha >= desde)
+
+    db.execute(borrar)
+    insertadas = db.execute(
+        pg_insert(models.VentaDiaria).from_select(
+            ["fecha", "id_sucursal", "id_producto", "id_categoria", "cantidad", "total"], origen
+        )
+    ).rowcount
+    db.commit()
+    return insertadas
+
+# DASHBOARD
+
 def get_dashboard_stats(db: Session, sucursal_id: Optional[int] = None):
-    #  Ventas del día 
-    hoy_inicio = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    hoy_fin = datetime.now().replace(hour=23, minute=59, second=59, microsecond=999999)
+    #  Ventas del día (rollup)
+    hoy = datetime.now().date()
     
-    q_ventas = db.query(func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario * (1 - models.DetalleDocumento.descuento / 100)))\
-        .join(models.Documento)\
-        .filter(
-            models.Documento.fecha_emision >= hoy_inicio,
-            models.Documento.fecha_emision <= hoy_fin,
-            models.Documento.tipo_operacion == models.TipoOperacion.VENTA,
-            models.Documento.estado_pago == models.EstadoPago.PAGADO
-        )
+    q_ventas = db.query(func.sum(models.VentaDiaria.total))\
+        .filter(models.VentaDiaria.fecha == hoy)
         
     if sucursal_id:
-        q_ventas = q_ventas.filter(models.Documento.id_sucursal == sucursal_id)
+        q_ventas = q_ventas.filter(models.VentaDiaria.id_sucursal == sucursal_id)
         
     ventas_dia = q_ventas.scalar() or 0
 
@@ -81,18 +150,16 @@ def get_dashboard_charts(db: Session, sucursal_id: Optional[int] = None):
     # Agrupar por fecha (solo dia/mes)
     
     q_ventas_sem = db.query(
-        func.date(models.Documento.fecha_emision).label("fecha"), 
-        func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario * (1 - models.DetalleDocumento.descuento / 100)).label("total")
-    ).join(models.DetalleDocumento).filter(
-        models.Documento.fecha_emision >= fecha_inicio,
-        models.Documento.tipo_operacion == models.TipoOperacion.VENTA,
-        models.Documento.estado_pago == models.EstadoPago.PAGADO
+        models.VentaDiaria.fecha, 
+        func.sum(models.VentaDiaria.total).label("total")
+    ).filter(
+        models.VentaDiaria.fecha >= fecha_inicio.date()
     )
     
     if sucursal_id:
-        q_ventas_sem = q_ventas_sem.filter(models.Documento.id_sucursal == sucursal_id)
+        q_ventas_sem = q_ventas_sem.filter(models.VentaDiaria.id_sucursal == sucursal_id)
         
-    ventas_sem = q_ventas_sem.group_by("fecha").all()
+    ventas_sem = q_ventas_sem.group_by(models.VentaDiaria.fecha).all()
     
     # Rellenar días vacíos
     datos_semana = []
@@ -107,22 +174,19 @@ def get_dashboard_charts(db: Session, sucursal_id: Optional[int] = None):
             "total": int(ventas_map.get(d_str, 0))
         })
 
-    #  Ventas por Categoría (Top 5) 
+    #  Ventas por Categoría (Top 5, últimos DIAS_TOP_CATEGORIAS días)
     q_cat = db.query(
         models.Categoria.nombre,
-        func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario * (1 - models.DetalleDocumento.descuento / 100)).label("total")
-    ).join(models.Producto, models.DetalleDocumento.id_producto == models.Producto.id_producto)\
-     .join(models.Categoria, models.Producto.id_categoria == models.Categoria.id_categoria)\
-     .join(models.Documento, models.DetalleDocumento.id_documento == models.Documento.id_documento)\
+        func.sum(models.VentaDiaria.total).label("total")
+    ).join(models.Categoria, models.VentaDiaria.id_categoria == models.Categoria.id_categoria)\
      .filter(
-        models.Documento.tipo_operacion == models.TipoOperacion.VENTA,
-        models.Documento.estado_pago == models.EstadoPago.PAGADO
+        models.VentaDiaria.fecha >= (hoy - timedelta(days=DIAS_TOP_CATEGORIAS - 1)).date()
     )
     
     if sucursal_id:
-        q_cat = q_cat.filter(models.Documento.id_sucursal == sucursal_id)
+        q_cat = q_cat.filter(models.VentaDiaria.id_sucursal == sucursal_id)
         
-    top_categorias = q_cat.group_by(models.Categoria.nombre).order_by(func.sum(models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario).desc()).limit(5).all()
+    top_categorias = q_cat.group_by(models.Categoria.nombre).order_by(func.sum(models.VentaDiaria.total).desc()).limit(5).all()
     
     datos_categoria = [{"categoria": c.nombre, "total": int(c.total or 0)} for c in top_categorias]
 
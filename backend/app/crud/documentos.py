@@ -1,22 +1,56 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List
 from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
 from app import models, schemas
+from app.core.folios import asignador_folios
 
 # DOCUMENTOS
 
+CENTAVOS = Decimal("0.01")
+
+def calcular_totales_documento(lineas):
+    """
+    Totales de un documento a partir de (precio_unitario, cantidad, descuento %) de sus líneas.
+    Retorna (subtotal, descuento_total, total).
+    """
+    subtotal = Decimal(0)
+    total = Decimal(0)
+    for precio, cantidad, descuento in lineas:
+        bruto = Decimal(precio) * cantidad
+        subtotal += bruto
+        # precio * cantidad * (1 - descuento/100), descuento es porcentaje 0-100
+        total += bruto * (100 - Decimal(descuento)) / 100
+
+    subtotal = subtotal.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    total = total.quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+    return subtotal, subtotal - total, total
+
+def _asignar_totales(documento: models.Documento):
+    documento.subtotal, documento.descuento_total, documento.total = calcular_totales_documento(
+        (det.precio_unitario, det.cantidad, det.descuento) for det in documento.detalles
+    )
+
 def get_documento(db: Session, documento_id: int):
     return db.query(models.Documento).filter(models.Documento.id_documento == documento_id).first()
 
-def create_documento(db: Session, documento: schemas.DocumentoCreate):
+def _registrar_documento(db: Session, documento: schemas.DocumentoCreate):
+    """
+    Documento, detalles, stock, kardex, totales y evento de outbox. No valida caja ni hace commit/rollback:
+    el llamador decide la transacción (create_documento o un savepoint por documento en el lote).
+    Retorna el documento, o un dict con "error"; lanza ValueError si no hay stock.
+    """
     # Dynamic imports
-    from .caja import get_ultimo_cierre_o_apertura, registrar_movimiento_caja
-    from .inventarios import get_inventario_by_sucursal_producto
-    from .productos import get_producto
+    from .inventarios import ajustar_stock_atomico, registrar_movimiento_stock
+    from .outbox import encolar_evento
     
-    # Validar Folio (usar el enviado o generar uno)
+    # Validar Folio (usar el enviado o asignar el siguiente de la sucursal)
     folio = documento.folio
     if not folio:
-        import time
-        folio = f"{documento.tipo_documento.value[0]}-{int(time.time())}"
+        folio = asignador_folios.nuevo_folio(db, documento.id_sucursal, documento.tipo_documento)
+        if not folio:
+            return {"error": "La sucursal no tiene secuencia de folios. Ejecute migrar_esquema.py."}
     
     db_documento = models.Documento(
         id_sucursal=documento.id_sucursal,
@@ -31,53 +65,37 @@ def create_documento(db: Session, documento: schemas.DocumentoCreate):
     db.add(db_documento)
     db.flush() 
     
-    # Validar Caja Abierta
-    ultimo_caja = get_ultimo_cierre_o_apertura(db, documento.id_sucursal)
-    if not ultimo_caja or ultimo_caja.tipo == models.TipoMovimientoCaja.CIERRE:
-         db.rollback()
-         return {"error": "La caja está cerrada. Debe abrir caja antes de operar."}
+    # Precargar productos e inventarios del documento (2 consultas, sin importar el número de líneas)
+    productos, inventarios = _precargar_productos_inventarios(
+        db, documento.id_sucursal, {detalle.id_producto for detalle in documento.detalles}
+    )
 
     # Procesar detalles y calcular total
-    total_doc = 0
+    lineas_total = []
+    lineas_rollup = []
+    lineas_stock = []
+    filas_detalle = []
     
     for detalle in documento.detalles:
-        # Verificar Inventario
-        inventario = get_inventario_by_sucursal_producto(db, documento.id_sucursal, detalle.id_producto)
-        
         # Obtener precio del producto si no se envió
-        producto_info = get_producto(db, detalle.id_producto)
+        producto_info = productos.get(detalle.id_producto)
         if not producto_info:
-             db.rollback()
              return {"error": f"Producto ID {detalle.id_producto} no encontrado"}
 
         precio_final = detalle.precio_unitario
         if precio_final is None:
             precio_final = producto_info.precio_venta
 
-        # Calcular subtotal para el total del documento
-        # (precio * cantidad) * (1 - descuento/100)
-        factor_desc = (100 - detalle.descuento) / 100
-        total_doc += float(precio_final * detalle.cantidad) * float(factor_desc)
-
-        # Verificar Inventario
-        inventario = get_inventario_by_sucursal_producto(
-            db, 
-            documento.id_sucursal, 
-            detalle.id_producto,
-            ubicacion=detalle.ubicacion_especifica
-        )
+        # Acumular línea para los totales del documento
+        lineas_total.append((precio_final, detalle.cantidad, detalle.descuento))
+        lineas_rollup.append((detalle.id_producto, producto_info.id_categoria, detalle.cantidad, precio_final, detalle.descuento))
+
+        # Verificar Inventario (la ubicación indicada o la primera del producto en la sucursal)
+        inventario = _elegir_inventario(inventarios.get(detalle.id_producto, []), detalle.ubicacion_especifica)
 
         if documento.tipo_operacion == models.TipoOperacion.VENTA:
-            # VENTA: Descontar Stock
-            # Validar stock suficiente
-            if not inventario or inventario.cantidad < detalle.cantidad:
-                db.rollback()
-                ubicacion_msg = f" en {detalle.ubicacion_especifica}" if detalle.ubicacion_especifica else ""
-                raise ValueError(f"Stock insuficiente para el producto {detalle.id_producto}{ubicacion_msg}")
-            
-            # Descontar
-            inventario.cantidad -= detalle.cantidad
-            db.add(inventario)
+            if not inventario:
+                raise ValueError(_mensaje_stock_insuficiente(detalle))
         # Logica para COMPRA
         elif documento.tipo_operacion == models.TipoOperacion.COMPRA:
             if not inventario:
@@ -90,49 +108,201 @@ def create_documento(db: Session, documento: schemas.DocumentoCreate):
                 )
                 db.add(inventario)
                 db.flush()
+                inventarios.setdefault(detalle.id_producto, []).append(inventario)
+
+        lineas_stock.append((inventario, detalle))
             
+        # Detalle (se insertan todos juntos)
+        filas_detalle.append({
+            "id_documento": db_documento.id_documento,
+            "id_producto": detalle.id_producto,
+            "cantidad": detalle.cantidad,
+            "precio_unitario": precio_final,
+            "descuento": detalle.descuento
+        })
+
+    if filas_detalle:
+        db.execute(insert(models.DetalleDocumento), filas_detalle)
+
+    # Mover stock con UPDATE condicionales, en orden de id_inventario:
+    # ventas concurrentes toman los locks de fila siempre en el mismo orden (sin deadlocks)
+    for inventario, detalle in sorted(lineas_stock, key=lambda linea: linea[0].id_inventario):
+        if documento.tipo_operacion == models.TipoOperacion.VENTA:
+            # VENTA: Descontar Stock solo si alcanza
+            if ajustar_stock_atomico(db, inventario, -detalle.cantidad) is None:
+                raise ValueError(_mensaje_stock_insuficiente(detalle))
+            registrar_movimiento_stock(db, inventario, -detalle.cantidad, models.TipoMovimientoStock.VENTA, db_documento.id_documento)
+        elif documento.tipo_operacion == models.TipoOperacion.COMPRA:
             # Aumentar stock
-            inventario.cantidad += detalle.cantidad
-            
-        # Crear detalle
-        db_detalle = models.DetalleDocumento(
-            id_documento=db_documento.id_documento,
-            id_producto=detalle.id_producto,
-            cantidad=detalle.cantidad,
-            precio_unitario=precio_final,
-            descuento=detalle.descuento
-        )
-        db.add(db_detalle)
+            ajustar_stock_atomico(db, inventario, detalle.cantidad)
+            registrar_movimiento_stock(db, inventario, detalle.cantidad, models.TipoMovimientoStock.COMPRA, db_documento.id_documento)
         
-    db.commit()
-    db.refresh(db_documento)
-    
-    # --- REGISTRAR MOVIMIENTO DE CAJA ---
-    # Si es VENTA -> INGRESO. Si es COMPRA -> EGRESO.
+    # Persistir totales (listados y sumas no necesitan leer detalle_documento)
+    db_documento.subtotal, db_documento.descuento_total, db_documento.total = calcular_totales_documento(lineas_total)
+
+    # Rollup, cachés y webhooks los procesa el worker del outbox (evento en esta misma transacción)
+    encolar_evento(db, "documento_creado", _payload_evento_documento(db_documento, lineas_rollup))
+
+    return db_documento
+
+def create_documento(db: Session, documento: schemas.DocumentoCreate):
+    from .caja import confirmar_y_sumar_contadores
+
+    preparado = preparar_documento(db, documento)
+    if isinstance(preparado, dict):
+        return preparado
+    db_documento, incrementos_apertura = preparado
+    confirmar_y_sumar_contadores(db, incrementos_apertura)
+    return db_documento
+
+def preparar_documento(db: Session, documento: schemas.DocumentoCreate):
+    """
+    create_documento sin el commit: valida la caja y registra el documento con su movimiento de caja.
+    Retorna un dict con "error", o (documento, {id_apertura: incrementos}) para confirmar_y_sumar_contadores.
+    """
+    # Dynamic imports
+    from .caja import get_ultimo_cierre_o_apertura
+
+    # Validar Caja Abierta
+    ultimo_caja = get_ultimo_cierre_o_apertura(db, documento.id_sucursal)
+    if not ultimo_caja or ultimo_caja.tipo == models.TipoMovimientoCaja.CIERRE:
+         return {"error": "La caja está cerrada. Debe abrir caja antes de operar."}
+
+    try:
+        db_documento = _registrar_documento(db, documento)
+    except ValueError:
+        db.rollback()
+        raise
+    if isinstance(db_documento, dict):
+        db.rollback()
+        return db_documento
+
+    # Movimiento de caja con los valores ya conocidos, en la misma transacción:
+    # un solo commit y el documento nunca queda sin su ingreso/egreso
+    db.add(_movimiento_caja_documento(db_documento))
+    # Contadores en vivo de la sesión de caja (solo suman los pagados)
+    incrementos_apertura = {}
+    if db_documento.estado_pago == models.EstadoPago.PAGADO:
+        incrementos_apertura[ultimo_caja.id_movimiento] = _incremento_contadores(db_documento, signo=1)
+    return db_documento, incrementos_apertura
+
+def _payload_evento_documento(documento: models.Documento, lineas_rollup) -> dict:
+    # Solo las ventas pagadas suman (o restan al anular) en ventas_diarias
+    suma_rollup = documento.tipo_operacion == models.TipoOperacion.VENTA and documento.estado_pago == models.EstadoPago.PAGADO
+    return {
+        "id_documento": documento.id_documento,
+        "id_sucursal": documento.id_sucursal,
+        "tipo_operacion": documento.tipo_operacion.value,
+        "fecha": documento.fecha_emision.date().isoformat(),
+        # (id_producto, id_categoria, cantidad, precio, descuento); decimales como texto en JSON
+        "rollup": [[p, c, q, str(precio), str(desc)] for p, c, q, precio, desc in lineas_rollup] if suma_rollup else []
+    }
+
+def _movimiento_caja_documento(documento: models.Documento) -> models.MovimientosCaja:
+    # VENTA -> INGRESO, COMPRA -> EGRESO, por el total ya calculado
     tipo_mov = models.TipoMovimientoCaja.INGRESO if documento.tipo_operacion == models.TipoOperacion.VENTA else models.TipoMovimientoCaja.EGRESO
-    
-    # Crear esquema para el movimiento
-    mov_caja = schemas.MovimientoCajaCreate(
+    return models.MovimientosCaja(
         id_sucursal=documento.id_sucursal,
         id_usuario=documento.id_usuario,
         tipo=tipo_mov,
-        monto=total_doc,
-        descripcion=f"Movimiento por Doc {db_documento.folio} ({documento.tipo_documento.value})",
-        id_documento_asociado=db_documento.id_documento
+        monto=documento.total,
+        descripcion=f"Movimiento por Doc {documento.folio} ({documento.tipo_documento.value})",
+        id_documento_asociado=documento.id_documento
     )
-    
 
-    res_caja = registrar_movimiento_caja(db, mov_caja)
-    
-    if isinstance(res_caja, dict) and "error" in res_caja:
- 
-        pass
+def create_documentos_lote(db: Session, documentos: List[schemas.DocumentoCreate], aperturas: Dict[int, int]) -> dict:
+    """
+    Registra muchos documentos (sincronización offline del POS) en una sola transacción.
+    Cada documento va en su propio savepoint: si falla (sin stock, producto inexistente,
+    error de la BD) se descarta solo ese y se informa en su resultado.
+    aperturas: id_sucursal -> id_apertura de la caja abierta, ya validada por el llamador (una vez por sucursal).
+    """
+    from .caja import confirmar_y_sumar_contadores
 
-    return db_documento
+    resultado, incrementos_apertura = preparar_documentos_lote(db, documentos, aperturas)
+    confirmar_y_sumar_contadores(db, incrementos_apertura)
+    return resultado
+
+def preparar_documentos_lote(db: Session, documentos: List[schemas.DocumentoCreate], aperturas: Dict[int, int]):
+    """create_documentos_lote sin el commit. Retorna (resultado, {id_apertura: incrementos})."""
+    resultados = []
+    creados = []
+    # Contadores en vivo: una suma por sesión de caja con el total del lote
+    incrementos_apertura = {}
+
+    for indice, documento in enumerate(documentos):
+        id_apertura = aperturas.get(documento.id_sucursal)
+        if not id_apertura:
+            resultados.append({"indice": indice, "error": "La caja está cerrada. Debe abrir caja antes de operar."})
+            continue
+
+        savepoint = db.begin_nested()
+        try:
+            db_documento = _registrar_documento(db, documento)
+            if not isinstance(db_documento, dict):
+                db.add(_movimiento_caja_documento(db_documento))
+                savepoint.commit()
+        except ValueError as e:
+            savepoint.rollback()
+            resultados.append({"indice": indice, "error": str(e)})
+            continue
+        except SQLAlchemyError as e:
+            # Error de la BD en este documento (FK inexistente, restricción): se descarta solo ese
+            savepoint.rollback()
+            resultados.append({"indice": indice, "error": f"Error de base de datos: {getattr(e, 'orig', None) or e}"})
+            continue
+        if isinstance(db_documento, dict):
+            savepoint.rollback()
+            resultados.append({"indice": indice, "error": db_documento["error"]})
+            continue
+
+        creados.append(db_documento)
+        if db_documento.estado_pago == models.EstadoPago.PAGADO:
+            incrementos = incrementos_apertura.setdefault(id_apertura, {})
+            for campo, valor in _incremento_contadores(db_documento, signo=1).items():
+                incrementos[campo] = incrementos.get(campo, 0) + valor
+        resultados.append({"indice": indice, "id_documento": db_documento.id_documento, "folio": db_documento.folio})
+
+    return {
+        "creados": len(creados),
+        "fallidos": len(documentos) - len(creados),
+        "resultados": resultados
+    }, incrementos_apertura
+
+def _precargar_productos_inventarios(db: Session, sucursal_id: int, ids_productos):
+    """Productos por id e inventarios de la sucursal por id de producto (en orden de id_inventario)."""
+    productos = {
+        p.id_producto: p
+        for p in db.query(models.Producto).filter(models.Producto.id_producto.in_(ids_productos))
+    }
+    inventarios = {}
+    for inv in db.query(models.Inventario).filter(
+        models.Inventario.id_sucursal == sucursal_id,
+        models.Inventario.id_producto.in_(ids_productos)
+    ).order_by(models.Inventario.id_inventario):
+        inventarios.setdefault(inv.id_producto, []).append(inv)
+    return productos, inventarios
+
+def _elegir_inventario(candidatos, ubicacion: str = None):
+    # Mismo criterio que get_inventario_by_sucursal_producto sobre las filas ya cargadas
+    for inv in candidatos:
+        if not ubicacion or inv.ubicacion_especifica == ubicacion:
+            return inv
+    return None
+
+def _mensaje_stock_insuficiente(detalle: schemas.DetalleDocumentoCreate) -> str:
+    ubicacion_msg = f" en {detalle.ubicacion_especifica}" if detalle.ubicacion_especifica else ""
+    return f"Stock insuficiente para el producto {detalle.id_producto}{ubicacion_msg}"
+
+def _incremento_contadores(documento: models.Documento, signo: int) -> dict:
+    campo = "ventas" if documento.tipo_operacion == models.TipoOperacion.VENTA else "compras"
+    return {campo: signo * documento.total}
 
 def anular_documento(db: Session, documento_id: int):
     # Dynamic import
-    from .inventarios import get_inventario_by_sucursal_producto
+    from .inventarios import ajustar_stock_atomico, registrar_movimiento_stock
+    from .outbox import encolar_evento
+    from .caja import get_ultimo_cierre_o_apertura, confirmar_con_contadores, sumar_contadores_caja
 
     documento = get_documento(db, documento_id)
     if not documento:
@@ -141,20 +311,81 @@ def anular_documento(db: Session, documento_id: int):
     if documento.estado_pago == models.EstadoPago.ANULADO:
         return documento # Ya anulado
         
+    # Precargar productos e inventarios del documento (2 consultas, sin importar el número de líneas)
+    productos, inventarios = _precargar_productos_inventarios(
+        db, documento.id_sucursal, {detalle.id_producto for detalle in documento.detalles}
+    )
+
     # Revertir Stock
     for detalle in documento.detalles:
-        inventario = get_inventario_by_sucursal_producto(db, documento.id_sucursal, detalle.id_producto)
+        inventario = _elegir_inventario(inventarios.get(detalle.id_producto, []))
         if inventario:
             if documento.tipo_operacion == models.TipoOperacion.VENTA:
                 # Devolver stock
-                inventario.cantidad += detalle.cantidad
+                ajustar_stock_atomico(db, inventario, detalle.cantidad)
+                registrar_movimiento_stock(db, inventario, detalle.cantidad, models.TipoMovimientoStock.ANULACION, documento.id_documento)
             elif documento.tipo_operacion == models.TipoOperacion.COMPRA:
                 # Restar stock (corrección)
                 # OJO: Podría quedar negativo si ya se vendió, pero asumimos corrección contable
-                inventario.cantidad -= detalle.cantidad
+                ajustar_stock_atomico(db, inventario, -detalle.cantidad, exigir_stock=False)
+                registrar_movimiento_stock(db, inventario, -detalle.cantidad, models.TipoMovimientoStock.ANULACION, documento.id_documento)
     
+    # Documentos anteriores a los totales persistidos: calcularlos ahora
+    if documento.total is None:
+        _asignar_totales(documento)
+
+    # Descontar del rollup de ventas diarias (lo aplica el worker del outbox)
+    lineas_rollup = [
+        (det.id_producto, productos[det.id_producto].id_categoria, det.cantidad, det.precio_unitario, det.descuento)
+        for det in documento.detalles
+    ]
+    encolar_evento(db, "documento_anulado", _payload_evento_documento(documento, lineas_rollup))
+
+    # Descontar de los contadores en vivo si el documento es de la sesión abierta
+    apertura = get_ultimo_cierre_o_apertura(db, documento.id_sucursal)
+    descuenta = documento.estado_pago == models.EstadoPago.PAGADO and apertura \
+        and apertura.tipo == models.TipoMovimientoCaja.APERTURA and documento.fecha_emision >= apertura.fecha
+
     documento.estado_pago = models.EstadoPago.ANULADO
     db.add(documento)
-    db.commit()
+    if descuenta:
+        incremento = _incremento_contadores(documento, signo=-1)
+        confirmar_con_contadores(db, apertura.id_movimiento)
+        sumar_contadores_caja(apertura.id_movimiento, **incremento)
+    else:
+        db.commit()
     db.refresh(documento)
     return documento
+
+def recalcular_totales_documentos(db: Session, solo_pendientes: bool = True) -> int:
+    """
+    Rellena subtotal / descuento_total / total desde detalle_documento en un solo UPDATE.
+    solo_pendientes: solo documentos con total NULL (creados antes de persistir los totales).
+    """
+    bruto = models.DetalleDocumento.cantidad * models.DetalleDocumento.precio_unitario
+    agregados = select(
+        models.DetalleDocumento.id_documento,
+        func.round(func.sum(bruto), 2).label("subtotal"),
+        func.round(func.sum(bruto * (100 - models.DetalleDocumento.descuento) / 100), 2).label("total")
+    ).group_by(models.DetalleDocumento.id_documento).subquery()
+
+    stmt = update(models.Documento)\
+        .where(models.Documento.id_documento == agregados.c.id_documento)\
+        .values(
+            subtotal=agregados.c.subtotal,
+            descuento_total=agregados.c.subtotal - agregados.c.total,
+            total=agregados.c.total
+        )
+    if solo_pendientes:
+        stmt = stmt.where(models.Documento.total.is_(None))
+
+    actualizados = db.execute(stmt.execution_options(synchronize_session=False)).rowcount
+
+    # Documentos sin líneas
+    sin_lineas = update(models.Documento)\
+        .where(models.Documento.total.is_(None))\
+        .values(subtotal=0, descuento_total=0, total=0)
+    actualizados += db.execute(sin_lineas.execution_options(synchronize_session=False)).rowcount
+
+    db.commit()
+    return actualizados
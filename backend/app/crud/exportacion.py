@@ -0,0 +1,92 @@
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+from app import models
+from .productos import _filtrar_productos
+from .inventarios import _filtrar_inventarios
+
+# EXPORTACIÓN
+# Consultas planas (solo columnas, sin entidades ORM) ordenadas por PK para /export.
+# Se ejecutan con yield_per: el cursor del servidor entrega las filas por lotes.
+
+def consulta_exportar_productos(
+    busqueda: str = None,
+    id_categoria: int = None,
+    unidad_medida: str = None,
+    precio_min: float = None,
+    precio_max: float = None
+) -> Select:
+    query = select(
+        models.Producto.id_producto,
+        models.Producto.codigo_barras,
+        models.Producto.nombre,
+        models.Producto.descripcion,
+        models.Producto.id_categoria,
+        models.Categoria.nombre.label("categoria"),
+        models.Producto.unidad_medida,
+        models.Producto.costo_neto,
+        models.Producto.precio_venta
+    ).outerjoin(models.Categoria, models.Producto.id_categoria == models.Categoria.id_categoria)
+
+    query = _filtrar_productos(query, busqueda, id_categoria, unidad_medida, precio_min, precio_max)
+    return query.order_by(models.Producto.id_producto)
+
+def consulta_exportar_inventario(
+    sucursal_id: int = None,
+    producto_id: int = None,
+    alerta_stock: bool = False,
+    categoria_id: int = None
+) -> Select:
+    query = select(
+        models.Inventario.id_inventario,
+        models.Inventario.id_sucursal,
+        models.Sucursal.nombre.label("sucursal"),
+        models.Inventario.id_producto,
+        models.Producto.codigo_barras,
+        models.Producto.nombre.label("producto"),
+        models.Inventario.ubicacion_especifica,
+        models.Inventario.cantidad,
+        models.Inventario.stock_minimo,
+        models.Inventario.stock_maximo
+    ).join(models.Producto, models.Inventario.id_producto == models.Producto.id_producto).join(
+        models.Sucursal, models.Inventario.id_sucursal == models.Sucursal.id_sucursal
+    )
+
+    query = _filtrar_inventarios(query, sucursal_id, producto_id, alerta_stock, categoria_id)
+    return query.order_by(models.Inventario.id_inventario)
+
+def consulta_exportar_documentos(
+    sucursal_id: int = None,
+    fecha_inicio: datetime = None,
+    fecha_fin: datetime = None,
+    tipo_operacion: models.TipoOperacion = None,
+    estado_pago: models.EstadoPago = None
+) -> Select:
+    # Una fila por documento (encabezado y totales)
+    query = select(
+        models.Documento.id_documento,
+        models.Documento.id_sucursal,
+        models.Documento.tipo_operacion,
+        models.Documento.tipo_documento,
+        models.Documento.folio,
+        models.Documento.fecha_emision,
+        models.Documento.estado_pago,
+        models.Documento.id_tercero,
+        models.Documento.id_usuario,
+        models.Documento.subtotal,
+        models.Documento.descuento_total,
+        models.Documento.total
+    )
+
+    if sucursal_id:
+        query = query.filter(models.Documento.id_sucursal == sucursal_id)
+    if fecha_inicio:
+        query = query.filter(models.Documento.fecha_emision >= fecha_inicio)
+    if fecha_fin:
+        query = query.filter(models.Documento.fecha_emision <= fecha_fin)
+    if tipo_operacion:
+        query = query.filter(models.Documento.tipo_operacion == tipo_operacion)
+    if estado_pago:
+        query = query.filter(models.Documento.estado_pago == estado_pago)
+
+    return query.order_by(models.Documento.id_documento)
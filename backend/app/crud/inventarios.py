@@ -1,6 +1,11 @@
+from datetime import datetime
+from typing import Optional
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, literal, or_, select, text, update
 from app import models, schemas
+from app.core.paginacion import campos_proyeccion, cortar_pagina, decodificar_cursor
+from .productos import _subarbol_categoria
 
 # INVENTARIO
 
@@ -16,6 +21,38 @@ def get_inventario_by_sucursal_producto(db: Session, sucursal_id: int, producto_
         query = query.filter(models.Inventario.ubicacion_especifica == ubicacion)
     return query.first()
 
+# Columnas del modo proyección de get_inventarios
+COLUMNAS_INVENTARIO = {
+    "id_inventario": models.Inventario.id_inventario,
+    "id_sucursal": models.Inventario.id_sucursal,
+    "sucursal": models.Sucursal.nombre.label("sucursal"),
+    "id_producto": models.Inventario.id_producto,
+    "producto": models.Producto.nombre.label("producto"),
+    "codigo_barras": models.Producto.codigo_barras,
+    "precio_venta": models.Producto.precio_venta,
+    "ubicacion_especifica": models.Inventario.ubicacion_especifica,
+    "cantidad": models.Inventario.cantidad,
+    "stock_minimo": models.Inventario.stock_minimo,
+    "stock_maximo": models.Inventario.stock_maximo
+}
+
+def _filtrar_inventarios(query, sucursal_id: int = None, producto_id: int = None, alerta_stock: bool = False, categoria_id: int = None):
+    # Filtros del listado de inventario (compartidos con la exportación). La consulta debe incluir el join a Producto
+    if sucursal_id:
+        query = query.filter(models.Inventario.id_sucursal == sucursal_id)
+
+    if producto_id:
+        query = query.filter(models.Inventario.id_producto == producto_id)
+        
+    if categoria_id:
+        query = query.filter(models.Producto.id_categoria.in_(_subarbol_categoria(categoria_id)))
+        
+    if alerta_stock:
+        # Stock crítico: cantidad <= stock_minimo
+        query = query.filter(models.Inventario.cantidad <= models.Inventario.stock_minimo)
+
+    return query
+
 def get_inventarios(
     db: Session, 
     skip: int = 0, 
@@ -23,25 +60,25 @@ def get_inventarios(
     sucursal_id: int = None, 
     producto_id: int = None,
     alerta_stock: bool = False,
-    categoria_id: int = None
+    categoria_id: int = None,
+    proyeccion: bool = False,
+    fields: str = None
 ):
+    if proyeccion or fields:
+        # Solo columnas planas (sin producto/sucursal anidados): lista de dicts listos para serializar.
+        # fields limita las columnas; el join a sucursales solo se hace si se pide su nombre
+        campos = campos_proyeccion(COLUMNAS_INVENTARIO, fields, "id_inventario")
+        query = db.query(*[COLUMNAS_INVENTARIO[c] for c in campos]).select_from(models.Inventario).join(models.Inventario.producto)
+        if "sucursal" in campos:
+            query = query.join(models.Inventario.sucursal)
+        query = _filtrar_inventarios(query, sucursal_id, producto_id, alerta_stock, categoria_id)
+        return [fila._asdict() for fila in query.offset(skip).limit(limit).all()]
+
     query = db.query(models.Inventario).join(models.Inventario.producto).options(
         joinedload(models.Inventario.producto),
         joinedload(models.Inventario.sucursal)
     )
-    
-    if sucursal_id:
-        query = query.filter(models.Inventario.id_sucursal == sucursal_id)
-
-    if producto_id:
-        query = query.filter(models.Inventario.id_producto == producto_id)
-        
-    if categoria_id:
-        query = query.filter(models.Producto.id_categoria == categoria_id)
-        
-    if alerta_stock:
-        # Stock crítico: cantidad <= stock_minimo
-        query = query.filter(models.Inventario.cantidad <= models.Inventario.stock_minimo)
+    query = _filtrar_inventarios(query, sucursal_id, producto_id, alerta_stock, categoria_id)
         
     return query.offset(skip).limit(limit).all()
 
@@ -61,10 +98,29 @@ def create_inventario(db: Session, inventario: schemas.InventarioCreate):
 
     db_inventario = models.Inventario(**inventario.model_dump())
     db.add(db_inventario)
+    if db_inventario.cantidad:
+        registrar_movimiento_stock(db, db_inventario, db_inventario.cantidad, models.TipoMovimientoStock.AJUSTE)
     db.commit()
     db.refresh(db_inventario)
     return db_inventario
 
+def ajustar_stock_atomico(db: Session, inventario: models.Inventario, delta: int, exigir_stock: bool = True) -> Optional[int]:
+    """
+    cantidad = cantidad + delta en un solo UPDATE ... RETURNING (sin leer y escribir desde Python).
+    Con delta negativo y exigir_stock solo descuenta si cantidad >= -delta.
+    Retorna la cantidad resultante, o None si no había stock suficiente.
+    """
+    stmt = update(models.Inventario).where(models.Inventario.id_inventario == inventario.id_inventario)
+    if delta < 0 and exigir_stock:
+        stmt = stmt.where(models.Inventario.cantidad >= -delta)
+    stmt = stmt.values(cantidad=models.Inventario.cantidad + delta).returning(models.Inventario.cantidad)
+
+    nueva = db.execute(stmt.execution_options(synchronize_session=False)).scalar_one_or_none()
+    if nueva is not None:
+        # Mantener el objeto de la sesión al día sin marcarlo como modificado
+        set_committed_value(inventario, "cantidad", nueva)
+    return nueva
+
 def update_inventario(db: Session, inventario_id: int, inventario_update: schemas.InventarioUpdate):
     db_inventario = get_inventario(db, inventario_id)
     if not db_inventario:
@@ -79,10 +135,14 @@ def update_inventario(db: Session, inventario_id: int, inventario_update: schema
     if nueva_cantidad > nuevo_maximo:
         return "ExcedeStockMaximo"
 
+    delta = nueva_cantidad - db_inventario.cantidad
+
     for key, value in update_data.items():
         setattr(db_inventario, key, value)
         
     db.add(db_inventario)
+    if delta:
+        registrar_movimiento_stock(db, db_inventario, delta, models.TipoMovimientoStock.AJUSTE)
     db.commit()
     db.refresh(db_inventario)
     return db_inventario
@@ -99,7 +159,113 @@ def delete_inventario(db: Session, inventario_id: int):
     db.commit()
     return True
 
-def get_inventario_agrupado(db: Session, sucursal_id: int, busqueda: str = None, categoria_id: int = None, alerta_stock: bool = False, skip: int = 0, limit: int = 100):
+# KARDEX (movimientos de stock y stock a una fecha)
+
+def registrar_movimiento_stock(db: Session, inventario: models.Inventario, cantidad: int, tipo: models.TipoMovimientoStock, id_documento: Optional[int] = None):
+    """Agrega un movimiento al kardex. No hace commit: va en la transacción de quien modifica el stock."""
+    db.add(models.MovimientoStock(
+        id_sucursal=inventario.id_sucursal,
+        id_producto=inventario.id_producto,
+        ubicacion_especifica=inventario.ubicacion_especifica,
+        tipo=tipo,
+        cantidad=cantidad,
+        id_documento=id_documento
+    ))
+
+def get_movimientos_stock(db: Session, sucursal_id: int, producto_id: int, fecha_inicio: datetime = None, fecha_fin: datetime = None, skip: int = 0, limit: int = 100):
+    query = db.query(models.MovimientoStock).filter(
+        models.MovimientoStock.id_sucursal == sucursal_id,
+        models.MovimientoStock.id_producto == producto_id
+    )
+    if fecha_inicio:
+        query = query.filter(models.MovimientoStock.fecha >= fecha_inicio)
+    if fecha_fin:
+        query = query.filter(models.MovimientoStock.fecha <= fecha_fin)
+    return query.order_by(models.MovimientoStock.fecha.desc(), models.MovimientoStock.id_movimiento_stock.desc())\
+        .offset(skip).limit(limit).all()
+
+def get_stock_a_fecha(db: Session, sucursal_id: int, fecha: datetime, producto_id: int = None):
+    """
+    Stock por producto de una sucursal a una fecha: último snapshot anterior a la fecha
+    más los movimientos del kardex entre ese snapshot y la fecha.
+    Productos sin snapshot previo (creados después) suman todos sus movimientos.
+    Retorna un dict con "error" si la fecha es anterior al primer snapshot de la sucursal: el kardex
+    solo no incluye el stock que existía antes de registrarse.
+    """
+    SS = models.SnapshotStock
+    MS = models.MovimientoStock
+    fecha = models.a_hora_chile(fecha)
+
+    primer_snapshot = db.query(func.min(SS.fecha)).filter(SS.id_sucursal == sucursal_id).scalar()
+    if primer_snapshot is None or fecha < primer_snapshot:
+        return {"error": "No hay snapshot de stock base para esa fecha (el historial comienza con el primer snapshot)."}
+
+    # Último snapshot <= fecha por producto
+    base = select(SS.id_producto, SS.cantidad, SS.fecha).where(
+        SS.id_sucursal == sucursal_id,
+        SS.fecha <= fecha
+    )
+    if producto_id:
+        base = base.where(SS.id_producto == producto_id)
+    base = base.distinct(SS.id_producto).order_by(SS.id_producto, SS.fecha.desc()).subquery("base")
+
+    # Deltas posteriores al snapshot de cada producto
+    deltas = select(MS.id_producto, func.sum(MS.cantidad).label("cantidad"))\
+        .select_from(MS)\
+        .outerjoin(base, base.c.id_producto == MS.id_producto)\
+        .where(
+            MS.id_sucursal == sucursal_id,
+            MS.fecha <= fecha,
+            or_(base.c.fecha.is_(None), MS.fecha > base.c.fecha)
+        )
+    if producto_id:
+        deltas = deltas.where(MS.id_producto == producto_id)
+    deltas = deltas.group_by(MS.id_producto).subquery("deltas")
+
+    filas = db.execute(
+        select(
+            func.coalesce(base.c.id_producto, deltas.c.id_producto).label("id_producto"),
+            (func.coalesce(base.c.cantidad, 0) + func.coalesce(deltas.c.cantidad, 0)).label("cantidad")
+        ).select_from(base)
+        .join(deltas, deltas.c.id_producto == base.c.id_producto, full=True)
+        .order_by("id_producto")
+    ).all()
+
+    return [{"id_producto": f.id_producto, "cantidad": int(f.cantidad)} for f in filas]
+
+def crear_snapshot_stock(db: Session) -> int:
+    """
+    Guarda el stock actual (suma de ubicaciones) de cada sucursal/producto.
+    El kardex se marca con la hora del flush y la venta puede confirmarse después: para que ningún
+    movimiento quede fuera del snapshot y a la vez antes de su fecha, se toma con inventario bloqueado
+    en modo SHARE (espera las escrituras en curso y frena las nuevas hasta el commit) y con la fecha
+    leída ya con el bloqueo.
+    """
+    db.execute(text("LOCK TABLE inventario IN SHARE MODE"))
+    fecha = models.get_now_chile()
+    actual = select(
+        models.Inventario.id_sucursal,
+        models.Inventario.id_producto,
+        func.sum(models.Inventario.cantidad).label("cantidad")
+    ).group_by(models.Inventario.id_sucursal, models.Inventario.id_producto).subquery()
+
+    stmt = models.SnapshotStock.__table__.insert().from_select(
+        ["id_sucursal", "id_producto", "fecha", "cantidad"],
+        select(actual.c.id_sucursal, actual.c.id_producto, literal(fecha, models.SnapshotStock.fecha.type), actual.c.cantidad)
+    )
+    filas = db.execute(stmt).rowcount
+    db.commit()
+    return filas
+
+def _fila_agrupada(row) -> dict:
+    return {
+        "id_producto": row.id_producto,
+        "nombre": row.nombre,
+        "codigo_barras": row.codigo_barras,
+        "total_cantidad": row.total_cantidad
+    }
+
+def get_inventario_agrupado(db: Session, sucursal_id: int, busqueda: str = None, categoria_id: int = None, alerta_stock: bool = False, skip: int = 0, limit: int = 100, cursor: str = None):
   
     query = db.query(
         models.Inventario.id_producto,
@@ -122,12 +288,25 @@ def get_inventario_agrupado(db: Session, sucursal_id: int, busqueda: str = None,
         )
         
     if categoria_id:
-        query = query.filter(models.Producto.id_categoria == categoria_id)
+        query = query.filter(models.Producto.id_categoria.in_(_subarbol_categoria(categoria_id)))
 
     # Filtro de Alerta Stock
 
     if alerta_stock:
         query = query.filter(models.Inventario.cantidad <= models.Inventario.stock_minimo)
+
+    if cursor is not None:
+        # Modo cursor: continúa por id_producto (ix_inventario_sucursal_producto_ubicacion), sin offset ni count
+        if cursor:
+            query = query.filter(models.Inventario.id_producto > decodificar_cursor(cursor))
+        filas = query.group_by(
+            models.Inventario.id_producto,
+            models.Producto.id_categoria,
+            models.Producto.nombre,
+            models.Producto.codigo_barras
+        ).order_by(models.Inventario.id_producto).limit(limit + 1).all()
+        filas, next_cursor = cortar_pagina(filas, limit, lambda row: row.id_producto)
+        return {"total": None, "items": [_fila_agrupada(row) for row in filas], "next_cursor": next_cursor}
     
    
     count_q = db.query(models.Inventario).join(models.Producto)
@@ -142,7 +321,7 @@ def get_inventario_agrupado(db: Session, sucursal_id: int, busqueda: str = None,
             )
         )
     if categoria_id:
-        count_q = count_q.filter(models.Producto.id_categoria == categoria_id)
+        count_q = count_q.filter(models.Producto.id_categoria.in_(_subarbol_categoria(categoria_id)))
     
     if alerta_stock:
         count_q = count_q.filter(models.Inventario.cantidad <= models.Inventario.stock_minimo)
@@ -158,13 +337,6 @@ def get_inventario_agrupado(db: Session, sucursal_id: int, busqueda: str = None,
     ).offset(skip).limit(limit).all()
     
 
-    items = []
-    for row in stats:
-        items.append({
-            "id_producto": row.id_producto,
-            "nombre": row.nombre,
-            "codigo_barras": row.codigo_barras,
-            "total_cantidad": row.total_cantidad
-        })
+    items = [_fila_agrupada(row) for row in stats]
         
     return {"total": total, "items": items}
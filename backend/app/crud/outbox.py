@@ -0,0 +1,58 @@
+from datetime import timedelta
+from sqlalchemy.orm import Session
+from app import models
+
+# OUTBOX
+# Efectos secundarios (rollups, invalidación de caché, webhooks) que no deben alargar la petición.
+# Se encolan en la misma transacción del negocio y worker_outbox.py los procesa tras el commit.
+
+OUTBOX_MAX_INTENTOS = 10
+# Entrega al webhook: evento aparte por consumidor, así un webhook caído no deshace ni agota el rollup
+TIPO_WEBHOOK = "webhook"
+
+def encolar_evento(db: Session, tipo: str, payload: dict):
+    """No hace commit: el evento se guarda solo si se confirma la transacción que lo generó."""
+    db.add(models.EventoOutbox(tipo=tipo, payload=payload))
+
+def tomar_eventos_pendientes(db: Session, limite: int = 100, webhooks: bool = False):
+    # SKIP LOCKED: varios workers pueden drenar la cola sin tomar el mismo evento.
+    # webhooks=True toma solo las entregas al webhook, si no el resto de los eventos
+    tipo = models.EventoOutbox.tipo == TIPO_WEBHOOK if webhooks else models.EventoOutbox.tipo != TIPO_WEBHOOK
+    return db.query(models.EventoOutbox).filter(
+        models.EventoOutbox.procesado.is_(None),
+        models.EventoOutbox.disponible_desde <= models.get_now_chile(),
+        models.EventoOutbox.intentos < OUTBOX_MAX_INTENTOS,
+        tipo
+    ).order_by(models.EventoOutbox.id_evento)\
+     .limit(limite)\
+     .with_for_update(skip_locked=True)\
+     .all()
+
+def encolar_webhook(db: Session, evento: models.EventoOutbox):
+    """Entrega pendiente del evento al webhook (no hace commit)."""
+    encolar_evento(db, TIPO_WEBHOOK, {"id_evento": evento.id_evento, "tipo": evento.tipo, "payload": evento.payload})
+
+def reservar_eventos(eventos, segundos: int):
+    # Los eventos tomados no vuelven a estar disponibles hasta que pase la reserva:
+    # tras el commit (sin locks) otro worker no los toma mientras este los envía
+    hasta = models.get_now_chile() + timedelta(seconds=segundos)
+    for evento in eventos:
+        evento.disponible_desde = hasta
+
+def marcar_evento_procesado(evento: models.EventoOutbox):
+    evento.procesado = models.get_now_chile()
+
+def marcar_evento_fallido(evento: models.EventoOutbox, error: Exception):
+    # Reintento con espera exponencial (máximo 5 minutos)
+    evento.intentos += 1
+    evento.ultimo_error = str(error)[:1000]
+    evento.disponible_desde = models.get_now_chile() + timedelta(seconds=min(2 ** evento.intentos, 300))
+
+def limpiar_eventos_procesados(db: Session, dias: int = 7) -> int:
+    limite = models.get_now_chile() - timedelta(days=dias)
+    borrados = db.query(models.EventoOutbox).filter(
+        models.EventoOutbox.procesado.isnot(None),
+        models.EventoOutbox.procesado < limite
+    ).delete(synchronize_session=False)
+    db.commit()
+    return borrados
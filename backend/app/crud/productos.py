@@ -1,6 +1,11 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_
+import json
+from sqlalchemy.orm import Session, aliased, joinedload
+from sqlalchemy import Integer, delete, func, insert, literal, or_, select
 from app import models, schemas
+from app.core.redis import redis_service
+from app.core.paginacion import (
+    ConteoPrecargado, campos_proyeccion, cortar_pagina, decodificar_cursor, invalidar_conteos, total_paginado
+)
 
 # CATEGORIA
 
@@ -10,12 +15,31 @@ def get_categorias(db: Session, skip: int = 0, limit: int = 100):
 def get_categoria(db: Session, categoria_id: int):
     return db.query(models.Categoria).filter(models.Categoria.id_categoria == categoria_id).first()
 
-def get_categorias_arbol(db: Session):
+# Árbol de categorías materializado en Redis. La clave incluye una versión que create/delete_categoria
+# incrementan: los árboles anteriores dejan de leerse sin borrar nada y expiran solos
+CLAVE_VERSION_CATEGORIAS = "categorias:version"
+CACHE_TTL_CATEGORIAS = 3600
 
-    return db.query(models.Categoria).filter(models.Categoria.id_padre == None).all()
+def invalidar_arbol_categorias():
+    redis_service.incr(CLAVE_VERSION_CATEGORIAS)
 
-def get_subcategorias(db: Session, categoria_id: int):
-    return db.query(models.Categoria).filter(models.Categoria.id_padre == categoria_id).all()
+def _construir_arbol_categorias(db: Session) -> list:
+    # Una sola consulta; el árbol se arma en memoria enlazando cada nodo con su padre
+    filas = db.query(
+        models.Categoria.id_categoria,
+        models.Categoria.nombre,
+        models.Categoria.id_padre
+    ).order_by(models.Categoria.id_categoria).all()
+
+    nodos = {f.id_categoria: {"id_categoria": f.id_categoria, "nombre": f.nombre, "id_padre": f.id_padre, "hijas": []} for f in filas}
+    raices = []
+    for nodo in nodos.values():
+        padre = nodos.get(nodo["id_padre"])
+        if padre:
+            padre["hijas"].append(nodo)
+        else:
+            raices.append(nodo)
+    return raices
 
 def _flatten_categorias(categorias, level=0, result=None):
     if result is None:
@@ -24,49 +48,110 @@ def _flatten_categorias(categorias, level=0, result=None):
     for cat in categorias:
     
         prefix = "— " * level
-        nombre_display = f"{prefix}{cat.nombre}"
-        
-        cat_copy = models.Categoria(
-            id_categoria=cat.id_categoria,
-            nombre=nombre_display,
-            id_padre=cat.id_padre
-        )
-      
-        
-        result.append(cat_copy)
+        result.append({
+            "id_categoria": cat["id_categoria"],
+            "nombre": f"{prefix}{cat['nombre']}",
+            "id_padre": cat["id_padre"],
+            "hijas": []
+        })
         
-        if cat.hijas:
-            _flatten_categorias(cat.hijas, level + 1, result)
+        if cat["hijas"]:
+            _flatten_categorias(cat["hijas"], level + 1, result)
             
     return result
 
+def _categorias_materializadas(db: Session) -> dict:
+    clave = f"categorias:arbol:{redis_service.get(CLAVE_VERSION_CATEGORIAS) or 0}"
+    cacheado = redis_service.get(clave)
+    if cacheado:
+        return json.loads(cacheado)
+
+    arbol = _construir_arbol_categorias(db)
+    datos = {"arbol": arbol, "plano": _flatten_categorias(arbol)}
+    redis_service.set(clave, json.dumps(datos), ttl=CACHE_TTL_CATEGORIAS)
+    return datos
+
+def get_categorias_arbol(db: Session):
+    # Raíces con sus hijas anidadas (dicts)
+    return _categorias_materializadas(db)["arbol"]
+
+def get_subcategorias(db: Session, categoria_id: int):
+    return db.query(models.Categoria).filter(models.Categoria.id_padre == categoria_id).all()
+
 def get_categorias_flat_sorted(db: Session):
-    arbol = get_categorias_arbol(db)
-    return _flatten_categorias(arbol)
+    # Lista plana en orden de árbol, con el nivel como prefijo en el nombre
+    return _categorias_materializadas(db)["plano"]
 
-def _tiene_productos_recursivo(categoria: models.Categoria) -> bool:
-    # Verificar si la categoría actual tiene productos
-    if categoria.productos:
-        return True
-    
-    # Verificar recursivamente en las hijas
-    for hija in categoria.hijas:
-        if _tiene_productos_recursivo(hija):
-            return True
-            
-    return False
+# CLAUSURA DE CATEGORÍAS (categorias_closure)
+
+def _subarbol_categoria(categoria_id: int):
+    # Ids de la categoría y todas sus descendientes (PK de categorias_closure)
+    return select(models.CategoriaClosure.id_descendiente).where(models.CategoriaClosure.id_ancestro == categoria_id)
+
+def _agregar_a_closure(db: Session, categoria: models.Categoria):
+    # La nueva hoja es descendiente de sí misma y de todos los ancestros de su padre
+    cc = models.CategoriaClosure
+    db.execute(insert(cc).values(id_ancestro=categoria.id_categoria, id_descendiente=categoria.id_categoria, profundidad=0))
+    if categoria.id_padre:
+        db.execute(insert(cc).from_select(
+            ["id_ancestro", "id_descendiente", "profundidad"],
+            select(cc.id_ancestro, literal(categoria.id_categoria, Integer), cc.profundidad + 1).where(cc.id_descendiente == categoria.id_padre)
+        ))
+
+def _quitar_de_closure(db: Session, categoria_id: int):
+    # Separa el subárbol: borra los pares (ancestro de la categoría, descendiente de la categoría).
+    # Las hijas quedan como raíces (id_padre pasa a NULL al borrar) y conservan sus propios pares
+    cc = models.CategoriaClosure
+    ancestros = select(cc.id_ancestro).where(cc.id_descendiente == categoria_id)
+    db.execute(delete(cc).where(cc.id_ancestro.in_(ancestros), cc.id_descendiente.in_(_subarbol_categoria(categoria_id))))
+
+def _tiene_productos_en_subarbol(db: Session, categoria_id: int) -> bool:
+    return db.query(
+        db.query(models.Producto.id_producto).filter(models.Producto.id_categoria.in_(_subarbol_categoria(categoria_id))).exists()
+    ).scalar()
+
+def reconstruir_closure_categorias(db: Session) -> int:
+    """Regenera categorias_closure desde id_padre con un CTE recursivo. Retorna las filas generadas."""
+    cc = models.CategoriaClosure
+    hija = aliased(models.Categoria)
+
+    arbol = select(
+        models.Categoria.id_categoria.label("id_ancestro"),
+        models.Categoria.id_categoria.label("id_descendiente"),
+        literal(0, Integer).label("profundidad")
+    ).cte("arbol", recursive=True)
+    arbol = arbol.union_all(
+        select(arbol.c.id_ancestro, hija.id_categoria, arbol.c.profundidad + 1)
+        .select_from(arbol)
+        .join(hija, hija.id_padre == arbol.c.id_descendiente)
+    )
+
+    db.execute(delete(cc))
+    filas = db.execute(insert(cc).from_select(
+        ["id_ancestro", "id_descendiente", "profundidad"],
+        select(arbol.c.id_ancestro, arbol.c.id_descendiente, arbol.c.profundidad)
+    )).rowcount
+    db.commit()
+    return filas
 
 def delete_categoria(db: Session, categoria_id: int):
     categoria = db.query(models.Categoria).filter(models.Categoria.id_categoria == categoria_id).first()
     if not categoria:
         return None
     
-    # Verificar recursivamente si tiene productos en toda la rama
-    if _tiene_productos_recursivo(categoria):
+    # Clausura sin la categoría (BD previa sin migrar_esquema.py): regenerarla antes de confiar en ella
+    cc = models.CategoriaClosure
+    if not db.query(db.query(cc).filter(cc.id_ancestro == categoria_id, cc.id_descendiente == categoria_id).exists()).scalar():
+        reconstruir_closure_categorias(db)
+
+    # Verificar si tiene productos en toda la rama (una consulta sobre la clausura)
+    if _tiene_productos_en_subarbol(db, categoria_id):
         return False # Indica que no se puede borrar por integridad
         
+    _quitar_de_closure(db, categoria_id)
     db.delete(categoria)
     db.commit()
+    invalidar_arbol_categorias()
     return True
 
 def create_categoria(db: Session, categoria: schemas.CategoriaCreate):
@@ -77,8 +162,11 @@ def create_categoria(db: Session, categoria: schemas.CategoriaCreate):
         
     db_categoria = models.Categoria(**cat_data)
     db.add(db_categoria)
+    db.flush()
+    _agregar_a_closure(db, db_categoria)
     db.commit()
     db.refresh(db_categoria)
+    invalidar_arbol_categorias()
     return db_categoria
 
 
@@ -88,20 +176,31 @@ def create_categoria(db: Session, categoria: schemas.CategoriaCreate):
 def get_producto(db: Session, producto_id: int):
     return db.query(models.Producto).filter(models.Producto.id_producto == producto_id).first()
 
-def get_productos(
-    db: Session, 
-    skip: int = 0, 
-    limit: int = 100, 
-    busqueda: str = None, 
+# Columnas del modo proyección de get_productos (categoria es el nombre, sin objetos anidados)
+COLUMNAS_PRODUCTO = {
+    "id_producto": models.Producto.id_producto,
+    "nombre": models.Producto.nombre,
+    "codigo_barras": models.Producto.codigo_barras,
+    "id_categoria": models.Producto.id_categoria,
+    "categoria": models.Categoria.nombre.label("categoria"),
+    "descripcion": models.Producto.descripcion,
+    "costo_neto": models.Producto.costo_neto,
+    "precio_venta": models.Producto.precio_venta,
+    "unidad_medida": models.Producto.unidad_medida
+}
+
+def _filtrar_productos(
+    query,
+    busqueda: str = None,
     id_categoria: int = None,
     unidad_medida: str = None,
     precio_min: float = None,
     precio_max: float = None
 ):
-    query = db.query(models.Producto).options(joinedload(models.Producto.categoria))
-    
+    # Filtros del listado de productos (compartidos con la exportación). Sirve para Query y select()
     if id_categoria:
-        query = query.filter(models.Producto.id_categoria == id_categoria)
+        # La categoría y todas sus subcategorías
+        query = query.filter(models.Producto.id_categoria.in_(_subarbol_categoria(id_categoria)))
         
     if unidad_medida:
         query = query.filter(models.Producto.unidad_medida == unidad_medida)
@@ -124,11 +223,66 @@ def get_productos(
             filtros_busqueda.append(models.Producto.id_producto == int(busqueda))
             
         query = query.filter(or_(*filtros_busqueda))
+
+    return query
+
+def filtros_conteo_productos(busqueda: str = None, id_categoria: int = None, unidad_medida: str = None,
+                             precio_min: float = None, precio_max: float = None) -> dict:
+    # Clave del total cacheado de get_productos
+    return {
+        "busqueda": busqueda.lower() if busqueda else None,
+        "id_categoria": id_categoria or None,
+        "unidad_medida": unidad_medida,
+        "precio_min": precio_min,
+        "precio_max": precio_max
+    }
+
+def get_productos(
+    db: Session, 
+    skip: int = 0, 
+    limit: int = 100, 
+    busqueda: str = None, 
+    id_categoria: int = None,
+    unidad_medida: str = None,
+    precio_min: float = None,
+    precio_max: float = None,
+    cursor: str = None,
+    approx_total: bool = False,
+    proyeccion: bool = False,
+    fields: str = None,
+    conteo: ConteoPrecargado = None
+):
+    if fields:
+        proyeccion = True
+
+    if proyeccion:
+        # Solo columnas (tuplas, sin identity map ni relaciones lazy): items como dicts listos para serializar.
+        # fields limita las columnas; el join a categorías solo se hace si se pide su nombre
+        campos = campos_proyeccion(COLUMNAS_PRODUCTO, fields, "id_producto")
+        query = db.query(*[COLUMNAS_PRODUCTO[c] for c in campos]).select_from(models.Producto)
+        if "categoria" in campos:
+            query = query.outerjoin(models.Categoria, models.Producto.id_categoria == models.Categoria.id_categoria)
+    else:
+        query = db.query(models.Producto).options(joinedload(models.Producto.categoria))
+    query = _filtrar_productos(query, busqueda, id_categoria, unidad_medida, precio_min, precio_max)
+
+    if cursor is not None:
+        # Modo cursor: continúa por id_producto (PK), sin offset ni count. cursor="" es la primera página
+        if cursor:
+            query = query.filter(models.Producto.id_producto > decodificar_cursor(cursor))
+        filas = query.order_by(models.Producto.id_producto).limit(limit + 1).all()
+        items, next_cursor = cortar_pagina(filas, limit, lambda p: p.id_producto)
+        if proyeccion:
+            items = [fila._asdict() for fila in items]
+        return {"total": None, "items": items, "next_cursor": next_cursor}
     
-    total = query.count()
+    filtros = filtros_conteo_productos(busqueda, id_categoria, unidad_medida, precio_min, precio_max)
+    total, aproximado = total_paginado(db, "productos", filtros, query, aproximado=approx_total, conteo=conteo)
     items = query.offset(skip).limit(limit).all()
+    if proyeccion:
+        items = [fila._asdict() for fila in items]
         
-    return {"total": total, "items": items}
+    return {"total": total, "total_aproximado": aproximado, "items": items}
 
 def get_producto_by_codigo(db: Session, codigo: str):
     return db.query(models.Producto).filter(models.Producto.codigo_barras == codigo).first()
@@ -145,6 +299,7 @@ def update_producto(db: Session, producto_id: int, producto_update: schemas.Prod
     db.add(db_producto)
     db.commit()
     db.refresh(db_producto)
+    invalidar_conteos("productos")
     return db_producto
 
 def create_producto(db: Session, producto: schemas.ProductoCreate):
@@ -159,6 +314,7 @@ def create_producto(db: Session, producto: schemas.ProductoCreate):
     db.commit()
     db.refresh(db_producto)
     db.refresh(db_producto)
+    invalidar_conteos("productos")
     return db_producto
 
 def delete_producto(db: Session, producto_id: int):
@@ -181,4 +337,5 @@ def delete_producto(db: Session, producto_id: int):
     
     db.delete(producto)
     db.commit()
+    invalidar_conteos("productos")
     return True
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Session
 from app import models, schemas
+from app.core.folios import crear_secuencias_folio
 
 # SUCURSAL
 
@@ -23,6 +24,9 @@ def get_sucursales(db: Session, skip: int = 0, limit: int = 100):
 def create_sucursal(db: Session, sucursal: schemas.SucursalCreate):
     db_sucursal = models.Sucursal(**sucursal.model_dump())
     db.add(db_sucursal)
+    db.flush()
+    # Secuencias de folios en la misma transacción que la sucursal
+    crear_secuencias_folio(db, db_sucursal.id_sucursal)
     db.commit()
     db.refresh(db_sucursal)
     return db_sucursal
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func, or_
 from app import models, schemas
+from app.core.paginacion import cortar_pagina, decodificar_cursor, invalidar_conteos, total_paginado
 
 # CLIENTE / PROVEEDOR
 
@@ -16,7 +17,9 @@ def get_terceros(
     limit: int = 100, 
     rut: str = None, 
     rol: str = None, 
-    busqueda: str = None
+    busqueda: str = None,
+    cursor: str = None,
+    approx_total: bool = False
 ):
     query = db.query(models.ClienteProveedor)
     
@@ -43,20 +46,33 @@ def get_terceros(
                 func.replace(models.ClienteProveedor.rut, '.', '').ilike(f"%{busqueda_limpia}%")
             )
         )
-        
+
+    if cursor is not None:
+        # Modo cursor: continúa por id_tercero (PK), sin offset ni count. cursor="" es la primera página
+        if cursor:
+            query = query.filter(models.ClienteProveedor.id_tercero > decodificar_cursor(cursor))
+        filas = query.order_by(models.ClienteProveedor.id_tercero).limit(limit + 1).all()
+        items, next_cursor = cortar_pagina(filas, limit, lambda t: t.id_tercero)
+        return {"total": None, "items": items, "next_cursor": next_cursor}
     
-    # Clonar query para contar total antes de paginar
-    total = query.count()
+    # Total antes de paginar (cacheado por filtros, o estimado si no hay filtros y approx_total)
+    filtros = {
+        "rut": rut,
+        "rol": rol.lower() if rol else None,
+        "busqueda": busqueda.lower() if busqueda else None
+    }
+    total, aproximado = total_paginado(db, "cliente_proveedor", filtros, query, aproximado=approx_total)
     
     items = query.offset(skip).limit(limit).all()
     
-    return {"total": total, "items": items}
+    return {"total": total, "total_aproximado": aproximado, "items": items}
 
 def create_tercero(db: Session, tercero: schemas.ClienteProveedorCreate):
     db_tercero = models.ClienteProveedor(**tercero.model_dump())
     db.add(db_tercero)
     db.commit()
     db.refresh(db_tercero)
+    invalidar_conteos("cliente_proveedor")
     return db_tercero
 
 def update_tercero(db: Session, tercero_id: int, tercero_update: schemas.ClienteProveedorUpdate):
@@ -71,4 +87,5 @@ def update_tercero(db: Session, tercero_id: int, tercero_update: schemas.Cliente
     db.add(db_tercero)
     db.commit()
     db.refresh(db_tercero)
+    invalidar_conteos("cliente_proveedor")
     return db_tercero
@@ -1,19 +1,89 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
+from app.core.pool_metrics import InstrumentedAsyncAdaptedQueuePool, InstrumentedQueuePool
+
 #  Cargar variables del archivo .env
 load_dotenv()
 
 #  Construir la URL de conexión segura
 DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}"
 
-#  Crear el motor 
-engine = create_engine(DATABASE_URL)
+#  Réplica de solo lectura (opcional). Si no se define, las lecturas van al primario
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL") or None
+
+def _url_async(url: str) -> str:
+    return url.replace("postgresql+psycopg2://", "postgresql://", 1).replace("postgresql://", "postgresql+asyncpg://", 1)
+
+ASYNC_DATABASE_URL = _url_async(DATABASE_URL)
+
+#  Configuración del pool (por worker de uvicorn). Cada worker tiene dos pools hacia el primario
+#  (sync y async) y, con réplica, los mismos dos hacia la réplica. Conexiones posibles por servidor:
+#    primario = workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW + DB_ASYNC_POOL_SIZE + DB_ASYNC_MAX_OVERFLOW)
+#    réplica  = el mismo valor (solo si DATABASE_REPLICA_URL está definida)
+#  y deben quedar bajo max_connections de cada Postgres (más los scripts y el worker del outbox)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", DB_POOL_SIZE))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", DB_MAX_OVERFLOW))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+#  Crear el motor
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
 
-#  Crear la sesión 
+#  Motor asíncrono (asyncpg) para endpoints async def, con su propio pool
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedAsyncAdaptedQueuePool,
+    pool_size=DB_ASYNC_POOL_SIZE,
+    max_overflow=DB_ASYNC_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+#  Motores de la réplica (mismos parámetros de pool que sus pares del primario)
+if DATABASE_REPLICA_URL:
+    replica_engine = create_engine(
+        DATABASE_REPLICA_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    async_replica_engine = create_async_engine(
+        _url_async(DATABASE_REPLICA_URL),
+        poolclass=InstrumentedAsyncAdaptedQueuePool,
+        pool_size=DB_ASYNC_POOL_SIZE,
+        max_overflow=DB_ASYNC_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+else:
+    replica_engine = engine
+    async_replica_engine = async_engine
+
+#  Crear la sesión
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_replica_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Base para los modelos
 Base = declarative_base()
@@ -24,4 +94,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Dependencia async: no ocupa un hilo del threadpool mientras espera a Postgres
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
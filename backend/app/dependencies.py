@@ -1,27 +1,46 @@
-from fastapi import Depends, HTTPException, status
+import logging
+import os
+
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import crud, models, schemas, security
-from app.database import get_db
+from app.database import (
+    DATABASE_REPLICA_URL,
+    AsyncReadSessionLocal,
+    AsyncSessionLocal,
+    ReadSessionLocal,
+    SessionLocal,
+    get_async_db,
+    get_db,
+)
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.Usuario:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="No se pudieron validar las credenciales",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="No se pudieron validar las credenciales",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def _decodificar_token(token: str) -> schemas.TokenData:
     try:
         payload = jwt.decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        return schemas.TokenData(email=email)
     except JWTError:
         raise credentials_exception
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.Usuario:
+    token_data = _decodificar_token(token)
     
     user = crud.get_usuario_by_email(db, email=token_data.email)
     if user is None:
@@ -33,7 +52,94 @@ def get_current_active_user(current_user: models.Usuario = Depends(get_current_u
         raise HTTPException(status_code=400, detail="Usuario inactivo")
     return current_user
 
+# Variantes async para endpoints async def (comparten la AsyncSession de la petición)
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> models.Usuario:
+    token_data = _decodificar_token(token)
+
+    user = await crud.get_usuario_by_email_async(db, email=token_data.email)
+    if user is None:
+        raise credentials_exception
+    return user
+
+async def get_current_active_user_async(current_user: models.Usuario = Depends(get_current_user_async)) -> models.Usuario:
+    if not current_user.estado:
+        raise HTTPException(status_code=400, detail="Usuario inactivo")
+    return current_user
+
 from app.core.redis import redis_service, RedisService
 
 def get_redis() -> RedisService:
     return redis_service
+
+#  LECTURAS EN RÉPLICA
+
+# Segundos que las lecturas de un usuario van al primario después de escribir (read your writes)
+REPLICA_RYW_TTL = int(os.getenv("REPLICA_RYW_TTL", 10))
+
+def marcar_lectura_primaria(email: str):
+    """Fuerza al primario las lecturas del usuario por REPLICA_RYW_TTL segundos (tras una venta, anulación, etc.)."""
+    if DATABASE_REPLICA_URL:
+        redis_service.set(f"ryw:{email}", "1", ttl=REPLICA_RYW_TTL)
+
+async def marcar_lectura_primaria_async(email: str):
+    """marcar_lectura_primaria para endpoints async def (cliente Redis async)."""
+    if DATABASE_REPLICA_URL:
+        await redis_service.set_async(f"ryw:{email}", "1", ttl=REPLICA_RYW_TTL)
+
+def _forzar_primario(request: Request) -> bool:
+    # Sin réplica, o override explícito por petición
+    if not DATABASE_REPLICA_URL:
+        return True
+    return request.headers.get("X-Read-Your-Writes", "").lower() in ("1", "true", "yes")
+
+def _leer_de_primario(request: Request, token: str) -> bool:
+    if _forzar_primario(request):
+        return True
+    token_data = _decodificar_token(token)
+    return redis_service.get(f"ryw:{token_data.email}") is not None
+
+async def _leer_de_primario_async(request: Request, token: str) -> bool:
+    if _forzar_primario(request):
+        return True
+    token_data = _decodificar_token(token)
+    return await redis_service.get_async(f"ryw:{token_data.email}") is not None
+
+def abrir_sesion_lectura(primario: bool = False) -> Session:
+    """Sesión en la réplica (o en el primario si se pide o la réplica no responde). Quien la abre la cierra."""
+    if primario:
+        return SessionLocal()
+    db = ReadSessionLocal()
+    try:
+        db.connection()
+    except (DBAPIError, OSError) as e:
+        logger.warning(f"Réplica no disponible, leyendo del primario: {e}")
+        db.close()
+        db = SessionLocal()
+    return db
+
+def get_lectura_primaria(request: Request, token: str = Depends(oauth2_scheme)) -> bool:
+    # Para endpoints que abren su propia sesión de lectura (ej. exportaciones en streaming)
+    return _leer_de_primario(request, token)
+
+def get_read_db(request: Request, token: str = Depends(oauth2_scheme)):
+    db = abrir_sesion_lectura(_leer_de_primario(request, token))
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request, token: str = Depends(oauth2_scheme)):
+    if await _leer_de_primario_async(request, token):
+        db = AsyncSessionLocal()
+    else:
+        db = AsyncReadSessionLocal()
+        try:
+            await db.connection()
+        except (DBAPIError, OSError) as e:
+            logger.warning(f"Réplica no disponible, leyendo del primario: {e}")
+            await db.close()
+            db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
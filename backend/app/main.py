@@ -1,6 +1,6 @@
 from fastapi import FastAPI
-from app.database import engine, Base
-from app.routers import auth, productos, sucursales, terceros, inventarios, documentos, caja, dashboard
+from app.database import engine, async_engine, async_replica_engine, Base
+from app.routers import auth, productos, sucursales, terceros, inventarios, documentos, caja, dashboard, metrics, exportar
 from app import models 
 
 def create_tables():
@@ -10,6 +10,7 @@ def create_tables():
 
 from contextlib import asynccontextmanager
 from app.core.redis import redis_service
+from app.core.query_stats import medir_consultas
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -18,10 +19,17 @@ async def lifespan(app: FastAPI):
     create_tables()
     yield
 
+    await redis_service.close_async()
     redis_service.close()
+    await async_engine.dispose()
+    if async_replica_engine is not async_engine:
+        await async_replica_engine.dispose()
 
 app = FastAPI(title="Sistema de Inventario", lifespan=lifespan)
 
+# Conteo de consultas SQL / tiempo en BD por petición (X-DB-Queries, Server-Timing)
+app.middleware("http")(medir_consultas)
+
 app.include_router(auth.router)
 app.include_router(sucursales.router)
 app.include_router(productos.router)
@@ -30,6 +38,8 @@ app.include_router(inventarios.router)
 app.include_router(documentos.router)
 app.include_router(caja.router)
 app.include_router(dashboard.router)
+app.include_router(metrics.router)
+app.include_router(exportar.router)
 
 @app.get("/")
 def read_root():
@@ -1,21 +1,26 @@
 import enum
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal
 from typing import List, Optional
 import pytz
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
+    Date,
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
     Text,
     func,
+    text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -49,11 +54,24 @@ class TipoMovimientoCaja(str, enum.Enum):
     CIERRE = "CIERRE"
 
 
+class TipoMovimientoStock(str, enum.Enum):
+    VENTA = "VENTA"
+    COMPRA = "COMPRA"
+    ANULACION = "ANULACION"
+    AJUSTE = "AJUSTE"
+
+
 # Configuración Hora
 def get_now_chile():
     chile_tz = pytz.timezone('America/Santiago')
     return datetime.now(chile_tz).replace(tzinfo=None)
 
+def a_hora_chile(fecha: datetime) -> datetime:
+    # Fechas con zona horaria (ej. query params ISO con offset) a la hora local sin zona que guarda la BD
+    if fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone(pytz.timezone('America/Santiago')).replace(tzinfo=None)
+
 # MODELS
 
 
@@ -71,6 +89,20 @@ class Categoria(Base):
     productos: Mapped[List["Producto"]] = relationship(back_populates="categoria")
 
 
+# Clausura del árbol de categorías: una fila por par (ancestro, descendiente), incluida la propia
+# categoría con profundidad 0. El subárbol de X es "id_ancestro = X" (ver crud/productos.py)
+class CategoriaClosure(Base):
+    __tablename__ = "categorias_closure"
+    __table_args__ = (
+        # Ancestros de una categoría (alta y baja de nodos)
+        Index("ix_categorias_closure_descendiente", "id_descendiente"),
+    )
+
+    id_ancestro: Mapped[int] = mapped_column(ForeignKey("categorias.id_categoria", ondelete="CASCADE"), primary_key=True)
+    id_descendiente: Mapped[int] = mapped_column(ForeignKey("categorias.id_categoria", ondelete="CASCADE"), primary_key=True)
+    profundidad: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
 class Sucursal(Base):
     __tablename__ = "sucursales"
 
@@ -121,7 +153,8 @@ class Producto(Base):
     __tablename__ = "productos"
 
     id_producto: Mapped[int] = mapped_column(primary_key=True, index=True)
-    id_categoria: Mapped[Optional[int]] = mapped_column(ForeignKey("categorias.id_categoria"))
+    # Indexado: filtro por subárbol de categorías (categorias_closure)
+    id_categoria: Mapped[Optional[int]] = mapped_column(ForeignKey("categorias.id_categoria"), index=True)
     codigo_barras: Mapped[Optional[str]] = mapped_column(String(50), unique=True)
     nombre: Mapped[str] = mapped_column(String(150), nullable=False)
     descripcion: Mapped[Optional[str]] = mapped_column(Text)
@@ -136,10 +169,14 @@ class Producto(Base):
 
 class Inventario(Base):
     __tablename__ = "inventario"
+    __table_args__ = (
+        # get_inventario_by_sucursal_producto
+        Index("ix_inventario_sucursal_producto_ubicacion", "id_sucursal", "id_producto", "ubicacion_especifica"),
+    )
 
     id_inventario: Mapped[int] = mapped_column(primary_key=True, index=True)
     id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), nullable=False)
-    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), nullable=False)
+    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), nullable=False, index=True)
     cantidad: Mapped[int] = mapped_column(Integer, default=0)
     ubicacion_especifica: Mapped[str] = mapped_column(String(50), nullable=False)
     stock_minimo: Mapped[int] = mapped_column(Integer, default=5)
@@ -151,6 +188,12 @@ class Inventario(Base):
 
 class Documento(Base):
     __tablename__ = "documentos"
+    __table_args__ = (
+        # Resúmenes de caja y dashboard por sucursal y rango de fechas
+        Index("ix_documentos_sucursal_fecha_tipo_estado", "id_sucursal", "fecha_emision", "tipo_operacion", "estado_pago"),
+        # Dashboard global (sin filtro de sucursal)
+        Index("ix_documentos_fecha_emision", "fecha_emision"),
+    )
 
     id_documento: Mapped[int] = mapped_column(primary_key=True, index=True)
     id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), nullable=False)
@@ -162,6 +205,10 @@ class Documento(Base):
     fecha_emision: Mapped[datetime] = mapped_column(DateTime, default=get_now_chile)
     estado_pago: Mapped[EstadoPago] = mapped_column(Enum(EstadoPago), default=EstadoPago.PAGADO)
     observaciones: Mapped[Optional[str]] = mapped_column(Text)
+    # Totales calculados al crear el documento (ver crud.create_documento)
+    subtotal: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 2))
+    descuento_total: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 2))
+    total: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 2))
 
     sucursal: Mapped["Sucursal"] = relationship(back_populates="documentos")
     tercero: Mapped[Optional["ClienteProveedor"]] = relationship(back_populates="documentos")
@@ -169,23 +216,13 @@ class Documento(Base):
     detalles: Mapped[List["DetalleDocumento"]] = relationship(back_populates="documento", cascade="all, delete-orphan")
     movimientos_caja: Mapped[List["MovimientosCaja"]] = relationship(back_populates="documento_asociado")
 
-    @property
-    def total(self):
-        total_doc = 0
-        for det in self.detalles:
-            # precio * cantidad * (1 - descuento/100)
-            # descuento es porcentaje 0-100
-            factor_descuento = (100 - det.descuento) / 100
-            total_doc += (det.precio_unitario * det.cantidad * factor_descuento)
-        return total_doc
-
 
 class DetalleDocumento(Base):
     __tablename__ = "detalle_documento"
 
     id_detalle: Mapped[int] = mapped_column(primary_key=True, index=True)
-    id_documento: Mapped[int] = mapped_column(ForeignKey("documentos.id_documento", ondelete="CASCADE"), nullable=False)
-    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), nullable=False)
+    id_documento: Mapped[int] = mapped_column(ForeignKey("documentos.id_documento", ondelete="CASCADE"), nullable=False, index=True)
+    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), nullable=False, index=True)
     cantidad: Mapped[int] = mapped_column(Integer, nullable=False)
     precio_unitario: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
     descuento: Mapped[Decimal] = mapped_column(Numeric(10, 2), default=0.00)
@@ -196,10 +233,21 @@ class DetalleDocumento(Base):
 
 class MovimientosCaja(Base):
     __tablename__ = "movimientos_caja"
+    __table_args__ = (
+        # Sumas de ingresos/egresos por sucursal, tipo y fecha
+        Index("ix_movimientos_caja_sucursal_tipo_fecha", "id_sucursal", "tipo", "fecha"),
+        # Último APERTURA/CIERRE de la sucursal (estado de caja)
+        Index(
+            "ix_movimientos_caja_apertura_cierre",
+            "id_sucursal",
+            "fecha",
+            postgresql_where=text("tipo IN ('APERTURA', 'CIERRE')"),
+        ),
+    )
 
     id_movimiento: Mapped[int] = mapped_column(primary_key=True, index=True)
     id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), nullable=False)
-    id_documento_asociado: Mapped[Optional[int]] = mapped_column(ForeignKey("documentos.id_documento"), nullable=True)
+    id_documento_asociado: Mapped[Optional[int]] = mapped_column(ForeignKey("documentos.id_documento"), nullable=True, index=True)
     tipo: Mapped[TipoMovimientoCaja] = mapped_column(Enum(TipoMovimientoCaja), nullable=False)
     monto: Mapped[Decimal] = mapped_column(Numeric(12, 2), nullable=False)
     descripcion: Mapped[Optional[str]] = mapped_column(String(200))
@@ -209,3 +257,82 @@ class MovimientosCaja(Base):
     sucursal: Mapped["Sucursal"] = relationship(back_populates="movimientos_caja")
     documento_asociado: Mapped[Optional["Documento"]] = relationship(back_populates="movimientos_caja")
     usuario: Mapped["Usuario"] = relationship(back_populates="movimientos_caja")
+
+
+# Cuadratura congelada al cerrar caja (una fila por sesión). Los reportes de sesiones cerradas leen de aquí
+class CierreCaja(Base):
+    __tablename__ = "cierres_caja"
+
+    id_apertura: Mapped[int] = mapped_column(ForeignKey("movimientos_caja.id_movimiento"), primary_key=True)
+    id_cierre: Mapped[int] = mapped_column(ForeignKey("movimientos_caja.id_movimiento"), unique=True, nullable=False)
+    id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), nullable=False, index=True)
+    fecha_apertura: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    fecha_cierre: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    saldo_inicial: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    ingresos_ventas: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    egresos_compras: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    ingresos_extra: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    egresos_extra: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    saldo_teorico: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    monto_real: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    diferencia: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    # Reporte de productos del periodo (lista de ReporteProductoItem)
+    productos: Mapped[list] = mapped_column(JSONB, default=list)
+
+
+# Rollup de ventas PAGADAS por día, sucursal y producto (mantenido por worker_outbox.py al crear / anular documentos)
+class VentaDiaria(Base):
+    __tablename__ = "ventas_diarias"
+
+    fecha: Mapped[date] = mapped_column(Date, primary_key=True)
+    id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), primary_key=True)
+    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), primary_key=True)
+    id_categoria: Mapped[Optional[int]] = mapped_column(ForeignKey("categorias.id_categoria", ondelete="SET NULL"), nullable=True, index=True)
+    cantidad: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[Decimal] = mapped_column(Numeric(14, 2), default=0)
+
+
+# Kardex: libro de movimientos de stock, solo se agregan filas (cantidad con signo)
+class MovimientoStock(Base):
+    __tablename__ = "movimientos_stock"
+    __table_args__ = (
+        # Stock a una fecha: deltas por sucursal/producto desde el último snapshot
+        Index("ix_movimientos_stock_sucursal_producto_fecha", "id_sucursal", "id_producto", "fecha"),
+    )
+
+    id_movimiento_stock: Mapped[int] = mapped_column(primary_key=True)
+    id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), nullable=False)
+    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), nullable=False)
+    ubicacion_especifica: Mapped[Optional[str]] = mapped_column(String(50))
+    tipo: Mapped[TipoMovimientoStock] = mapped_column(Enum(TipoMovimientoStock), nullable=False)
+    cantidad: Mapped[int] = mapped_column(Integer, nullable=False)
+    id_documento: Mapped[Optional[int]] = mapped_column(ForeignKey("documentos.id_documento"), nullable=True, index=True)
+    fecha: Mapped[datetime] = mapped_column(DateTime, default=get_now_chile)
+
+
+# Stock total por sucursal y producto a una fecha (generado periódicamente por mantenimiento.py)
+class SnapshotStock(Base):
+    __tablename__ = "snapshots_stock"
+
+    id_sucursal: Mapped[int] = mapped_column(ForeignKey("sucursales.id_sucursal"), primary_key=True)
+    id_producto: Mapped[int] = mapped_column(ForeignKey("productos.id_producto"), primary_key=True)
+    fecha: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    cantidad: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+# Outbox: efectos secundarios escritos en la transacción del negocio y procesados después por worker_outbox.py
+class EventoOutbox(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        # Cola de pendientes del worker
+        Index("ix_outbox_pendientes", "disponible_desde", postgresql_where=text("procesado IS NULL")),
+    )
+
+    id_evento: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    tipo: Mapped[str] = mapped_column(String(50), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    creado: Mapped[datetime] = mapped_column(DateTime, default=get_now_chile)
+    disponible_desde: Mapped[datetime] = mapped_column(DateTime, default=get_now_chile)
+    procesado: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    intentos: Mapped[int] = mapped_column(Integer, default=0)
+    ultimo_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
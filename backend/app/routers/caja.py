@@ -1,10 +1,13 @@
 from typing import List, Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app import crud, models, schemas
-from app.database import get_db
-from app.dependencies import get_current_active_user
+from app.database import get_async_db, get_db
+from app.dependencies import get_current_active_user, get_current_active_user_async, get_read_db, marcar_lectura_primaria
+from app.core.idempotencia import Idempotencia
+from app.core.respuestas import ORJSONResponse
 
 router = APIRouter(prefix="/caja", tags=["Caja"])
 
@@ -21,6 +24,7 @@ def abrir_caja(
     if isinstance(resultado, dict) and "error" in resultado:
         raise HTTPException(status_code=400, detail=resultado["error"])
     
+    marcar_lectura_primaria(current_user.email)
     return resultado
 
 @router.get("/estado", response_model=schemas.EstadoCajaResponse)
@@ -86,29 +90,35 @@ def cerrar_caja(
     if isinstance(resultado, dict) and "error" in resultado:
         raise HTTPException(status_code=400, detail=resultado["error"])
     
+    marcar_lectura_primaria(current_user.email)
     return resultado
 
 @router.get("/resumen", response_model=schemas.CajaResumenResponse)
-def obtener_resumen(
-    db: Session = Depends(get_db),
-    current_user: models.Usuario = Depends(get_current_active_user)
+async def obtener_resumen(
+    detalle: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Usuario = Depends(get_current_active_user_async)
 ):
     """
     Obtiene el resumen actual de la caja desde la última apertura.
+    detalle: Si es True, incluye la lista de documentos y movimientos extra (calculado desde SQL).
+    Sin detalle los totales salen de los contadores en vivo (Redis).
     """
 
-    resumen = crud.obtener_resumen_caja(db=db, sucursal_id=current_user.id_sucursal)
+    resumen = await crud.obtener_resumen_caja_async(db=db, sucursal_id=current_user.id_sucursal, detalle=detalle)
     return resumen
 
 @router.post("/movimientos", response_model=schemas.MovimientoCajaResponse, status_code=status.HTTP_201_CREATED)
 def registrar_movimiento(
     movimiento: schemas.MovimientoCajaCreate,
     db: Session = Depends(get_db),
-    current_user: models.Usuario = Depends(get_current_active_user)
+    current_user: models.Usuario = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
 ):
     """
     Registra un ingreso o egreso manual (NO VENTA/COMPRA).
     El usuario debe especificar tipo INGRESO o EGRESO.
+    Idempotency-Key (header opcional): un reintento con la misma clave retorna el movimiento ya registrado.
     """
     if movimiento.tipo in [models.TipoMovimientoCaja.APERTURA, models.TipoMovimientoCaja.CIERRE]:
          raise HTTPException(status_code=400, detail="Use los endpoints de apertura/cierre para estas operaciones")
@@ -123,12 +133,25 @@ def registrar_movimiento(
     # Forzar sucursal si no es admin 
     if current_user.rol not in [models.TipoRol.ADMIN, models.TipoRol.SUPERADMIN]:
         movimiento.id_sucursal = current_user.id_sucursal
-        
-    resultado = crud.registrar_movimiento_caja(db=db, movimiento=movimiento)
+
+    idempotencia = Idempotencia(idempotency_key, f"caja_movimientos:{current_user.id_usuario}", movimiento.model_dump(mode="json"))
+    repetida = idempotencia.iniciar()
+    if repetida:
+        return repetida
+
+    try:
+        resultado = crud.registrar_movimiento_caja(db=db, movimiento=movimiento)
+    except Exception:
+        idempotencia.liberar()
+        raise
     if isinstance(resultado, dict) and "error" in resultado:
+        idempotencia.liberar()
         raise HTTPException(status_code=400, detail=resultado["error"])
-    
-    return resultado
+
+    respuesta = schemas.MovimientoCajaResponse.model_validate(resultado)
+    idempotencia.completar(status.HTTP_201_CREATED, respuesta.model_dump(mode="json"))
+    marcar_lectura_primaria(current_user.email)
+    return respuesta
 
 @router.get("/reportes", response_model=List[schemas.ReporteCajaItem])
 def obtener_reportes(
@@ -136,7 +159,7 @@ def obtener_reportes(
     fecha_fin: datetime,
     sucursal_id: Optional[int] = None,
     usuario_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: models.Usuario = Depends(get_current_active_user)
 ):
     """
@@ -151,7 +174,7 @@ def obtener_reportes(
         usuario_id=usuario_id
     )
 
-@router.get("/sesion/{id_apertura}", response_model=schemas.CajaSesionDetalleResponse)
+@router.get("/sesion/{id_apertura}", response_model=schemas.CajaSesionDetalleResponse, response_class=ORJSONResponse)
 def obtener_detalle_sesion(
     id_apertura: int,
     db: Session = Depends(get_db),
@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app import crud, models, schemas
-from app.database import get_db
 from app.core.redis import RedisService
-from app.dependencies import get_current_user, get_redis
+from app.dependencies import get_current_user, get_read_db, get_redis
 import json
 from fastapi.encoders import jsonable_encoder
 
@@ -19,7 +18,7 @@ from typing import Optional
 def get_dashboard_stats(
     sucursal_id: Optional[int] = None,
     force_refresh: bool = False,
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: models.Usuario = Depends(get_current_user),
     redis: RedisService = Depends(get_redis)
 ):
@@ -50,7 +49,7 @@ def get_dashboard_stats(
 def get_dashboard_charts(
     sucursal_id: Optional[int] = None,
     force_refresh: bool = False,
-    db: Session = Depends(get_db), 
+    db: Session = Depends(get_read_db), 
     current_user: models.Usuario = Depends(get_current_user),
     redis: RedisService = Depends(get_redis)
 ):
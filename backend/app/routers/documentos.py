@@ -1,28 +1,36 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app import crud, models, schemas
-from app.database import get_db
-from app.dependencies import get_current_active_user, get_redis
-from app.core.redis import RedisService
+from app.database import get_async_db, get_db
+from app.dependencies import get_current_active_user, get_current_active_user_async, marcar_lectura_primaria, marcar_lectura_primaria_async
+from app.core.idempotencia import Idempotencia
 
 router = APIRouter(prefix="/documentos", tags=["Documentos (Ventas/Compras)"])
 
 @router.post("/", response_model=schemas.DocumentoResponse, status_code=status.HTTP_201_CREATED)
-def crear_documento(
+async def crear_documento(
     documento: schemas.DocumentoCreate, 
-    db: Session = Depends(get_db),
-    current_user: models.Usuario = Depends(get_current_active_user),
-    redis: RedisService = Depends(get_redis)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Usuario = Depends(get_current_active_user_async),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
 ):
     """
     Registra una VENTA o COMPRA.
     - **Venta**: Valida stock y descuenta inventario.
     - **Compra**: Aumenta stock en inventario.
+    - **Idempotency-Key** (header opcional): un reintento con la misma clave retorna el documento ya creado.
     """
+    idempotencia = Idempotencia(idempotency_key, f"documentos:{current_user.id_usuario}", documento.model_dump(mode="json"))
+    repetida = await idempotencia.iniciar_async()
+    if repetida:
+        return repetida
+
     # Validar Caja Abierta 
-    estado_caja = crud.verificar_estado_caja(db, documento.id_sucursal)
+    estado_caja = await crud.verificar_estado_caja_async(db, documento.id_sucursal)
     if estado_caja["estado"] != "ABIERTA":
+         await idempotencia.liberar_async()
          if estado_caja["estado"] == "PENDIENTE_CIERRE":
              raise HTTPException(status_code=400, detail=f"BLOQUEO: {estado_caja['mensaje']}")
          raise HTTPException(status_code=400, detail="No hay caja abierta en esta sucursal. Debe abrir caja para realizar operaciones.")
@@ -30,17 +38,60 @@ def crear_documento(
     # Asignar usuario autenticado
     try:
         documento.id_usuario = current_user.id_usuario
-        resultado = crud.create_documento(db=db, documento=documento)
+        resultado = await crud.create_documento_async(db=db, documento=documento)
         if isinstance(resultado, dict) and "error" in resultado:
             raise HTTPException(status_code=400, detail=resultado["error"])
         
-        # Invalidar caché
-        redis.delete(f"caja:resumen:{documento.id_sucursal}")
+        # Guardar la respuesta para los reintentos con la misma Idempotency-Key
+        await idempotencia.completar_async(status.HTTP_201_CREATED, resultado.model_dump(mode="json"))
+
+        # Las lecturas siguientes del usuario van al primario (read your writes)
+        await marcar_lectura_primaria_async(current_user.email)
         return resultado
     except Exception as e:
+        await idempotencia.liberar_async()
         import traceback
         raise HTTPException(status_code=500, detail=f"Error Interno: {str(e)}")
 
+# Máximo de documentos por llamada a /documentos/batch
+LOTE_MAXIMO = 500
+
+@router.post("/batch", response_model=schemas.DocumentoLoteResponse)
+async def crear_documentos_lote(
+    documentos: List[schemas.DocumentoCreate],
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Usuario = Depends(get_current_active_user_async)
+):
+    """
+    Registra un lote de VENTAS/COMPRAS (sincronización del POS tras una caída de conexión).
+    Una sola transacción con un savepoint por documento: los que fallan se informan
+    en **resultados** (por índice) y no impiden registrar el resto.
+    """
+    if not documentos:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(documentos) > LOTE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"El lote excede el máximo de {LOTE_MAXIMO} documentos")
+
+    # Validar Caja Abierta (una vez por sucursal del lote); el crud recibe las aperturas ya validadas
+    aperturas = {}
+    for sucursal_id in {doc.id_sucursal for doc in documentos}:
+        estado_caja = await crud.verificar_estado_caja_async(db, sucursal_id)
+        if estado_caja["estado"] != "ABIERTA":
+            if estado_caja["estado"] == "PENDIENTE_CIERRE":
+                raise HTTPException(status_code=400, detail=f"BLOQUEO: {estado_caja['mensaje']}")
+            raise HTTPException(status_code=400, detail=f"No hay caja abierta en la sucursal {sucursal_id}. Debe abrir caja para realizar operaciones.")
+        aperturas[sucursal_id] = estado_caja["info"].id_movimiento
+
+    # Asignar usuario autenticado
+    for doc in documentos:
+        doc.id_usuario = current_user.id_usuario
+
+    resultado = await crud.create_documentos_lote_async(db, documentos, aperturas)
+
+    if resultado.creados:
+        await marcar_lectura_primaria_async(current_user.email)
+    return resultado
+
 @router.get("/{documento_id}", response_model=schemas.DocumentoResponse)
 def obtener_documento(
     documento_id: int, 
@@ -56,8 +107,7 @@ def obtener_documento(
 def anular_documento(
     documento_id: int, 
     db: Session = Depends(get_db),
-    current_user: models.Usuario = Depends(get_current_active_user),
-    redis: RedisService = Depends(get_redis)
+    current_user: models.Usuario = Depends(get_current_active_user)
 ):
     """
     Anula un documento y revierte los movimientos de stock asociados.
@@ -66,6 +116,5 @@ def anular_documento(
     if not db_documento:
         raise HTTPException(status_code=404, detail="Documento no encontrado")
 
-    # Invalidar caché
-    redis.delete(f"caja:resumen:{db_documento.id_sucursal}")
+    marcar_lectura_primaria(current_user.email)
     return db_documento
@@ -0,0 +1,145 @@
+import csv
+import enum
+import io
+import json
+import os
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app import crud, models
+from app.dependencies import abrir_sesion_lectura, get_current_active_user, get_lectura_primaria
+
+router = APIRouter(prefix="/export", tags=["Exportación"])
+
+# Filas por lote del cursor del servidor (y por bloque enviado al cliente)
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", 1000))
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+def _valor(valor):
+    if isinstance(valor, enum.Enum):
+        return valor.value
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    return valor
+
+def _generar(consulta, formato: str, primario: bool):
+    """
+    Ejecuta la consulta con yield_per (stream_results: cursor del servidor) y entrega el archivo por lotes,
+    la memoria no depende del tamaño de la tabla.
+    La sesión es propia del generador: las dependencias de la petición ya se cerraron cuando se envía el cuerpo.
+    """
+    db = abrir_sesion_lectura(primario)
+    try:
+        resultado = db.execute(consulta.execution_options(yield_per=EXPORT_LOTE))
+        columnas = list(resultado.keys())
+
+        if formato == "csv":
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(columnas)
+            yield buffer.getvalue()
+            for lote in resultado.partitions():
+                buffer.seek(0)
+                buffer.truncate(0)
+                escritor.writerows([_valor(v) for v in fila] for fila in lote)
+                yield buffer.getvalue()
+        else:
+            for lote in resultado.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columnas, map(_valor, fila))), default=float, ensure_ascii=False) + "\n"
+                    for fila in lote
+                )
+    finally:
+        db.close()
+
+def _respuesta(consulta, formato: str, nombre: str, primario: bool) -> StreamingResponse:
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado, use: {', '.join(FORMATOS)}")
+    return StreamingResponse(
+        _generar(consulta, formato, primario),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    )
+
+def _sucursal_exportacion(current_user: models.Usuario, sucursal_id: Optional[int]) -> Optional[int]:
+    # Mismo criterio que /inventarios/agrupado: SUPERADMIN puede exportar todas las sucursales
+    if current_user.rol == models.TipoRol.SUPERADMIN:
+        return sucursal_id
+    if current_user.rol == models.TipoRol.ADMIN:
+        return sucursal_id if sucursal_id else current_user.id_sucursal
+    return current_user.id_sucursal
+
+@router.get("/productos")
+def exportar_productos(
+    formato: str = "csv",
+    busqueda: Optional[str] = None,
+    id_categoria: Optional[int] = None,
+    unidad_medida: Optional[str] = None,
+    precio_min: Optional[float] = None,
+    precio_max: Optional[float] = None,
+    primario: bool = Depends(get_lectura_primaria),
+    current_user: models.Usuario = Depends(get_current_active_user)
+):
+    """
+    Catálogo completo en CSV o NDJSON (formato=csv|ndjson), con los filtros de GET /productos/.
+    """
+    consulta = crud.consulta_exportar_productos(
+        busqueda=busqueda,
+        id_categoria=id_categoria,
+        unidad_medida=unidad_medida,
+        precio_min=precio_min,
+        precio_max=precio_max
+    )
+    return _respuesta(consulta, formato, "productos", primario)
+
+@router.get("/inventario")
+def exportar_inventario(
+    formato: str = "csv",
+    sucursal_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    alerta_stock: bool = False,
+    categoria_id: Optional[int] = None,
+    primario: bool = Depends(get_lectura_primaria),
+    current_user: models.Usuario = Depends(get_current_active_user)
+):
+    """
+    Inventario por sucursal y ubicación, con los filtros de GET /inventarios/.
+    """
+    consulta = crud.consulta_exportar_inventario(
+        sucursal_id=_sucursal_exportacion(current_user, sucursal_id),
+        producto_id=producto_id,
+        alerta_stock=alerta_stock,
+        categoria_id=categoria_id
+    )
+    return _respuesta(consulta, formato, "inventario", primario)
+
+@router.get("/documentos")
+def exportar_documentos(
+    formato: str = "csv",
+    sucursal_id: Optional[int] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    tipo_operacion: Optional[models.TipoOperacion] = None,
+    estado_pago: Optional[models.EstadoPago] = None,
+    primario: bool = Depends(get_lectura_primaria),
+    current_user: models.Usuario = Depends(get_current_active_user)
+):
+    """
+    Documentos (encabezado y totales, una fila por documento) filtrados por sucursal, rango de fechas,
+    tipo de operación y estado de pago.
+    """
+    consulta = crud.consulta_exportar_documentos(
+        sucursal_id=_sucursal_exportacion(current_user, sucursal_id),
+        fecha_inicio=fecha_inicio,
+        fecha_fin=fecha_fin,
+        tipo_operacion=tipo_operacion,
+        estado_pago=estado_pago
+    )
+    return _respuesta(consulta, formato, "documentos", primario)
@@ -1,9 +1,12 @@
+from datetime import datetime
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app import crud, models, schemas
+from app.core.respuestas import ORJSONResponse
 from app.database import get_db
-from app.dependencies import get_current_active_user
+from app.dependencies import get_async_read_db, get_current_active_user, get_read_db, get_current_active_user_async, marcar_lectura_primaria
 
 router = APIRouter(prefix="/inventarios", tags=["Inventario"])
 
@@ -20,9 +23,10 @@ def inicializar_stock(
          raise HTTPException(status_code=400, detail="La cantidad inicial excede el stock máximo permitido")
     if not nuevo_inventario:
          raise HTTPException(status_code=400, detail="El producto ya está registrado en esta sucursal")
+    marcar_lectura_primaria(current_user.email)
     return nuevo_inventario
 
-@router.get("/", response_model=List[schemas.InventarioResponse])
+@router.get("/", response_model=List[schemas.InventarioResponse], response_class=ORJSONResponse)
 def consultar_inventario(
     skip: int = 0, 
     limit: int = 100, 
@@ -30,6 +34,8 @@ def consultar_inventario(
     producto_id: Optional[int] = None,
     alerta_stock: Optional[bool] = False,
     categoria_id: Optional[int] = None,
+    proyeccion: bool = False,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_active_user)
 ):
@@ -39,22 +45,32 @@ def consultar_inventario(
     producto_id: Filtra por producto específico.
     alerta_stock: Si es True, muestra solo productos con stock bajo (crítico).
     categoria_id: Filtra por categoría de producto.
+    proyeccion: Filas planas (ids, nombres de producto/sucursal, código, precio y stock) sin objetos anidados.
+    fields: Columnas a retornar separadas por coma (ej. producto,cantidad), implica proyeccion. id_inventario siempre se incluye.
     """
+    if proyeccion or fields:
+        try:
+            filas = crud.get_inventarios(db, skip=skip, limit=limit, sucursal_id=sucursal_id, producto_id=producto_id, alerta_stock=alerta_stock, categoria_id=categoria_id, proyeccion=True, fields=fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return ORJSONResponse(filas)
     return crud.get_inventarios(db, skip=skip, limit=limit, sucursal_id=sucursal_id, producto_id=producto_id, alerta_stock=alerta_stock, categoria_id=categoria_id)
 
 @router.get("/agrupado", response_model=schemas.InventarioPaginatedResponse)
-def obtener_inventario_agrupado(
+async def obtener_inventario_agrupado(
     skip: int = 0,
     limit: int = 100,
     sucursal_id: Optional[int] = None,
     busqueda: Optional[str] = None,
     categoria_id: Optional[int] = None,
     alerta_stock: bool = False,
-    db: Session = Depends(get_db),
-    current_user: models.Usuario = Depends(get_current_active_user)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.Usuario = Depends(get_current_active_user_async)
 ):
     """
     Retorna el stock total agrupado por producto para una sucursal.
+    cursor: Paginación por cursor (vacío para la primera página, luego el next_cursor recibido). Ignora skip y no calcula total.
     """
     try:
         target_sucursal = None
@@ -65,20 +81,64 @@ def obtener_inventario_agrupado(
         else:
             target_sucursal = current_user.id_sucursal
 
-        resultado = crud.get_inventario_agrupado(
+        resultado = await crud.get_inventario_agrupado_async(
             db, 
             sucursal_id=target_sucursal, 
             busqueda=busqueda, 
             categoria_id=categoria_id,
             alerta_stock=alerta_stock,
             skip=skip,
-            limit=limit
+            limit=limit,
+            cursor=cursor
         )
         return resultado
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
       
         raise e
 
+def _sucursal_consulta(current_user: models.Usuario, sucursal_id: Optional[int]) -> int:
+    # Solo ADMIN/SUPERADMIN consultan otras sucursales
+    if sucursal_id and current_user.rol in [models.TipoRol.ADMIN, models.TipoRol.SUPERADMIN]:
+        return sucursal_id
+    return current_user.id_sucursal
+
+@router.get("/stock-a-fecha", response_model=List[schemas.StockAFechaItem])
+def consultar_stock_a_fecha(
+    fecha: datetime,
+    sucursal_id: Optional[int] = None,
+    producto_id: Optional[int] = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.Usuario = Depends(get_current_active_user)
+):
+    """
+    Stock por producto a una fecha (último snapshot + movimientos del kardex hasta la fecha).
+    """
+    resultado = crud.get_stock_a_fecha(db, _sucursal_consulta(current_user, sucursal_id), fecha, producto_id=producto_id)
+    if isinstance(resultado, dict) and "error" in resultado:
+        raise HTTPException(status_code=400, detail=resultado["error"])
+    return resultado
+
+@router.get("/kardex/{producto_id}", response_model=List[schemas.MovimientoStockResponse])
+def consultar_kardex(
+    producto_id: int,
+    sucursal_id: Optional[int] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: models.Usuario = Depends(get_current_active_user)
+):
+    """
+    Movimientos de stock de un producto en la sucursal, del más reciente al más antiguo.
+    """
+    return crud.get_movimientos_stock(
+        db, _sucursal_consulta(current_user, sucursal_id), producto_id,
+        fecha_inicio=fecha_inicio, fecha_fin=fecha_fin, skip=skip, limit=limit
+    )
+
 @router.get("/{inventario_id}", response_model=schemas.InventarioResponse)
 def leer_inventario(
     inventario_id: int, 
@@ -107,6 +167,7 @@ def ajustar_stock(
         raise HTTPException(status_code=400, detail="La cantidad excede el stock máximo permitido")
     if not db_inventario:
         raise HTTPException(status_code=404, detail="Registro de inventario no encontrado")
+    marcar_lectura_primaria(current_user.email)
     return db_inventario
 
 @router.delete("/{inventario_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -123,6 +184,7 @@ def eliminar_inventario(
         raise HTTPException(status_code=404, detail="Inventario no encontrado")
     if resultado is False:
         raise HTTPException(status_code=400, detail="No se puede eliminar: El inventario tiene stock físico > 0. Ajuste a 0 primero.")
+    marcar_lectura_primaria(current_user.email)
     return None
 
 
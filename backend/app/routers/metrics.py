@@ -0,0 +1,30 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from app import models
+from app.database import (
+    DATABASE_REPLICA_URL, DB_ASYNC_MAX_OVERFLOW, DB_MAX_OVERFLOW,
+    engine, async_engine, replica_engine, async_replica_engine
+)
+from app.dependencies import get_current_active_user
+from app.core.pool_metrics import get_pool_stats
+
+router = APIRouter(prefix="/metrics", tags=["Métricas"])
+
+@router.get("/db-pool")
+def metricas_pool_db(current_user: models.Usuario = Depends(get_current_active_user)):
+    """
+    Estado de los pools de conexiones del worker que atiende la petición.
+    Cada worker de uvicorn tiene sus propios pools (ver 'pid'). Solo administradores.
+    """
+    if current_user.rol not in [models.TipoRol.ADMIN, models.TipoRol.SUPERADMIN]:
+        raise HTTPException(status_code=403, detail="No tienes permisos para ver las métricas")
+
+    stats = {
+        "pid": os.getpid(),
+        "sync": get_pool_stats(engine, DB_MAX_OVERFLOW),
+        "async": get_pool_stats(async_engine.sync_engine, DB_ASYNC_MAX_OVERFLOW),
+    }
+    if DATABASE_REPLICA_URL:
+        stats["replica_sync"] = get_pool_stats(replica_engine, DB_MAX_OVERFLOW)
+        stats["replica_async"] = get_pool_stats(async_replica_engine.sync_engine, DB_ASYNC_MAX_OVERFLOW)
+    return stats
@@ -1,16 +1,18 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import crud, models, schemas
-from app.database import get_db
-from app.dependencies import get_current_active_user, get_redis
+from app.database import get_async_db, get_db
+from app.dependencies import get_current_active_user, get_current_active_user_async, get_redis
 from app.core.redis import RedisService
-import json
-from fastapi.encoders import jsonable_encoder
+from app.core.respuestas import ORJSONResponse, dumps
 
 CACHE_KEY_PRODUCTOS = "maestro:productos:lista"
+# Misma primera página con total estimado (approx_total=true)
+CACHE_KEY_PRODUCTOS_APROX = "maestro:productos:lista:aprox"
 
 router = APIRouter(prefix="/productos", tags=["Productos y Categorías"])
 
@@ -85,11 +87,12 @@ def crear_producto(
     
     # Invalidate cache
     redis.delete(CACHE_KEY_PRODUCTOS)
+    redis.delete(CACHE_KEY_PRODUCTOS_APROX)
     
     return nuevo_producto
 
-@router.get("/", response_model=schemas.ProductoPaginatedResponse)
-def listar_productos(
+@router.get("/", response_model=schemas.ProductoPaginatedResponse, response_class=ORJSONResponse)
+async def listar_productos(
     skip: int = 0, 
     limit: int = 100, 
     busqueda: Optional[str] = None,
@@ -97,10 +100,20 @@ def listar_productos(
     unidad_medida: Optional[str] = None,
     precio_min: Optional[float] = None,
     precio_max: Optional[float] = None,
-    db: Session = Depends(get_db),
-    current_user: models.Usuario = Depends(get_current_active_user),
+    cursor: Optional[str] = None,
+    approx_total: bool = False,
+    proyeccion: bool = False,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.Usuario = Depends(get_current_active_user_async),
     redis: RedisService = Depends(get_redis)
 ):
+    """
+    proyeccion: items planos (columnas del producto y nombre de categoría, sin inventarios ni categoría anidados),
+    serializados directamente sin validar contra el esquema. Más liviano para listados grandes.
+    fields: columnas a retornar separadas por coma (ej. nombre,codigo_barras,precio_venta), implica proyeccion.
+    id_producto siempre se incluye.
+    """
     # Cache 
     is_default = (
         skip == 0 and 
@@ -109,31 +122,46 @@ def listar_productos(
         not id_categoria and 
         not unidad_medida and 
         not precio_min and 
-        not precio_max
+        not precio_max and
+        cursor is None and
+        not proyeccion and
+        not fields
     )
+    cache_key = CACHE_KEY_PRODUCTOS_APROX if approx_total else CACHE_KEY_PRODUCTOS
 
     if is_default:
         try:
-            cached = redis.get(CACHE_KEY_PRODUCTOS)
+            cached = await redis.get_async(cache_key)
             if cached:
-                return json.loads(cached)
+                # Ya es el JSON final: se envía tal cual, sin volver a validar ni serializar
+                return Response(content=cached, media_type="application/json")
         except Exception as e:
             print(f"Redis Error (Get): {e}")
 
-    productos = crud.get_productos(
-        db, 
-        skip=skip, 
-        limit=limit, 
-        busqueda=busqueda, 
-        id_categoria=id_categoria,
-        unidad_medida=unidad_medida,
-        precio_min=precio_min,
-        precio_max=precio_max
-    )
+    try:
+        productos = await crud.get_productos_async(
+            db, 
+            skip=skip, 
+            limit=limit, 
+            busqueda=busqueda, 
+            id_categoria=id_categoria,
+            unidad_medida=unidad_medida,
+            precio_min=precio_min,
+            precio_max=precio_max,
+            cursor=cursor,
+            approx_total=approx_total,
+            proyeccion=proyeccion,
+            fields=fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
+    if proyeccion or fields:
+        return ORJSONResponse(productos)
+
     if is_default:
         try:
-            redis.set(CACHE_KEY_PRODUCTOS, json.dumps(jsonable_encoder(productos)), ttl=3600)
+            await redis.set_async(cache_key, dumps(productos.model_dump()).decode(), ttl=3600)
         except Exception as e:
             print(f"Redis Error (Set): {e}")
             
@@ -162,6 +190,7 @@ def actualizar_producto(
     
     # Invalidate cache
     redis.delete(CACHE_KEY_PRODUCTOS)
+    redis.delete(CACHE_KEY_PRODUCTOS_APROX)
         
     return db_producto
 
@@ -185,5 +214,6 @@ def eliminar_producto(
          
     # Invalidate cache
     redis.delete(CACHE_KEY_PRODUCTOS)
+    redis.delete(CACHE_KEY_PRODUCTOS_APROX)
 
     return None
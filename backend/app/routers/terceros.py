@@ -27,6 +27,8 @@ def listar_terceros(
     rut: Optional[str] = None,
     rol: Optional[str] = None,
     busqueda: Optional[str] = None,
+    cursor: Optional[str] = None,
+    approx_total: bool = False,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_active_user)
 ):
@@ -35,8 +37,13 @@ def listar_terceros(
     rut: Busca un registro específico por RUT.
     rol: cliente o proveedor para filtrar por tipo.
     busqueda: Filtro parcial por nombre.
+    cursor: Paginación por cursor (vacío para la primera página, luego el next_cursor recibido). Ignora skip y no calcula total.
+    approx_total: Sin filtros, total estimado por el planner en vez de count().
     """
-    return crud.get_terceros(db, skip=skip, limit=limit, rut=rut, rol=rol, busqueda=busqueda)
+    try:
+        return crud.get_terceros(db, skip=skip, limit=limit, rut=rut, rol=rol, busqueda=busqueda, cursor=cursor, approx_total=approx_total)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{tercero_id}", response_model=schemas.ClienteProveedorResponse)
 def obtener_tercero(
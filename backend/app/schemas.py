@@ -9,6 +9,7 @@ from app.models import (
     EstadoPago,
     TipoDocumento,
     TipoMovimientoCaja,
+    TipoMovimientoStock,
     TipoOperacion,
     TipoRol,
 )
@@ -115,8 +116,12 @@ class ClienteProveedorResponse(ClienteProveedorBase):
     model_config = ConfigDict(from_attributes=True)
 
 class ClienteProveedorPaginatedResponse(BaseModel):
-    total: int
+    # total es None en modo cursor (no se cuenta) y es la estimación del planner si total_aproximado.
+    # next_cursor es None en la última página o en modo offset
+    total: Optional[int] = None
+    total_aproximado: bool = False
     items: List[ClienteProveedorResponse]
+    next_cursor: Optional[str] = None
 
 
 
@@ -170,8 +175,10 @@ class ProductoResponse(ProductoBase):
     model_config = ConfigDict(from_attributes=True)
 
 class ProductoPaginatedResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
+    total_aproximado: bool = False
     items: List[ProductoResponse]
+    next_cursor: Optional[str] = None
 
 
 
@@ -204,8 +211,24 @@ class InventarioAgrupadoResponse(BaseModel):
     total_cantidad: int
 
 class InventarioPaginatedResponse(BaseModel):
-    total: int
+    total: Optional[int] = None
     items: List[InventarioAgrupadoResponse]
+    next_cursor: Optional[str] = None
+
+class MovimientoStockResponse(BaseModel):
+    id_movimiento_stock: int
+    id_sucursal: int
+    id_producto: int
+    ubicacion_especifica: Optional[str] = None
+    tipo: TipoMovimientoStock
+    cantidad: int
+    id_documento: Optional[int] = None
+    fecha: datetime
+    model_config = ConfigDict(from_attributes=True)
+
+class StockAFechaItem(BaseModel):
+    id_producto: int
+    cantidad: int
 
 
 # DETALLE DOCUMENTO SCHEMAS
@@ -258,6 +281,17 @@ class DocumentoResponse(DocumentoBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class DocumentoLoteResultado(BaseModel):
+    indice: int # Posición del documento en el lote recibido
+    id_documento: Optional[int] = None
+    folio: Optional[str] = None
+    error: Optional[str] = None
+
+class DocumentoLoteResponse(BaseModel):
+    creados: int
+    fallidos: int
+    resultados: List[DocumentoLoteResultado]
+
 
 
 # MOVIMIENTOS CAJA SCHEMAS
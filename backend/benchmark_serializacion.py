@@ -0,0 +1,63 @@
+import sys
+import os
+import json
+import time
+
+# configuración de importaciones
+sys.path.append(os.getcwd())
+from fastapi.encoders import jsonable_encoder
+from app.database import SessionLocal
+from app import crud, schemas
+from app.core.respuestas import dumps
+
+# Compara el costo por ítem de los listados de /productos/ e /inventarios/:
+#   ORM:        entidades + validación from_attributes + jsonable_encoder + json.dumps (camino por defecto)
+#   proyección: tuplas de columnas + orjson (proyeccion=true)
+# Solo lectura, usa los datos existentes de la base.
+# Uso: python benchmark_serializacion.py [limit] [repeticiones]
+
+def _medir(consultar, serializar, repeticiones: int):
+    consulta = serializacion = 0.0
+    items = 0
+    for _ in range(repeticiones):
+        db = SessionLocal()
+        try:
+            inicio = time.perf_counter()
+            resultado = consultar(db)
+            medio = time.perf_counter()
+            cuerpo, items = serializar(resultado)
+            fin = time.perf_counter()
+        finally:
+            db.close()
+        consulta += medio - inicio
+        serializacion += fin - medio
+    return consulta / repeticiones, serializacion / repeticiones, items, len(cuerpo)
+
+def _serializar_productos_orm(resultado):
+    respuesta = schemas.ProductoPaginatedResponse.model_validate(resultado, from_attributes=True)
+    return json.dumps(jsonable_encoder(respuesta)), len(respuesta.items)
+
+def _serializar_inventario_orm(resultado):
+    respuesta = [schemas.InventarioResponse.model_validate(i, from_attributes=True) for i in resultado]
+    return json.dumps(jsonable_encoder(respuesta)), len(respuesta)
+
+def ejecutar(limit: int = 100, repeticiones: int = 20):
+    casos = [
+        ("productos ORM", lambda db: crud.get_productos(db, limit=limit), _serializar_productos_orm),
+        ("productos proyección", lambda db: crud.get_productos(db, limit=limit, proyeccion=True),
+         lambda r: (dumps(r), len(r["items"]))),
+        ("inventario ORM", lambda db: crud.get_inventarios(db, limit=limit), _serializar_inventario_orm),
+        ("inventario proyección", lambda db: crud.get_inventarios(db, limit=limit, proyeccion=True),
+         lambda r: (dumps(r), len(r))),
+    ]
+
+    print(f"limit={limit}, {repeticiones} repeticiones (promedios)")
+    print(f"{'caso':<24}{'ítems':>7}{'consulta ms':>13}{'serializ. ms':>14}{'µs/ítem':>10}{'bytes':>10}")
+    for nombre, consultar, serializar in casos:
+        consulta, serializacion, items, tamano = _medir(consultar, serializar, repeticiones)
+        por_item = (consulta + serializacion) / items * 1e6 if items else 0
+        print(f"{nombre:<24}{items:>7}{consulta * 1000:>13.2f}{serializacion * 1000:>14.2f}{por_item:>10.1f}{tamano:>10}")
+
+if __name__ == "__main__":
+    argumentos = [int(a) for a in sys.argv[1:3]]
+    ejecutar(*argumentos)
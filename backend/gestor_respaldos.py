@@ -9,10 +9,16 @@ sys.path.append(os.getcwd())
 try:
     from app.database import SessionLocal, engine
     from app.models import Producto, Categoria, Base
+    from app.core.redis import redis_service
+    from app.crud.productos import invalidar_arbol_categorias, reconstruir_closure_categorias
+    from app.core.paginacion import invalidar_conteos
 except ImportError:
     sys.path.append(os.path.join(os.getcwd(), 'app'))
     from app.database import SessionLocal, engine
     from app.models import Producto, Categoria, Base
+    from app.core.redis import redis_service
+    from app.crud.productos import invalidar_arbol_categorias, reconstruir_closure_categorias
+    from app.core.paginacion import invalidar_conteos
 
 # nombre del archivo de respaldo
 ARCHIVO_RESPALDO = "respaldo_productos.json"
@@ -81,6 +87,10 @@ def hacer_load():
                 nueva_cat = Categoria(**cat_dict)
                 db.add(nueva_cat)
         db.commit()
+        # clausura al día y la API vuelve a armar su árbol de categorías cacheado
+        reconstruir_closure_categorias(db)
+        redis_service.connect()
+        invalidar_arbol_categorias()
 
         # cargar productos
         print(f" - Cargando {len(datos['productos'])} productos...")
@@ -90,6 +100,8 @@ def hacer_load():
                 nuevo_prod = Producto(**prod_dict)
                 db.add(nuevo_prod)
         db.commit()
+        # los totales cacheados de /productos/ ya no corresponden
+        invalidar_conteos("productos")
 
         print("Restauración completada")
 
@@ -8,10 +8,12 @@ sys.path.append(os.getcwd())
 try:
     from app.database import SessionLocal
     from app.models import Usuario, TipoRol, Sucursal
+    from app.core.folios import crear_secuencias_folio
 except ImportError:
     sys.path.append(os.path.join(os.getcwd(), 'app'))
     from app.database import SessionLocal
     from app.models import Usuario, TipoRol, Sucursal
+    from app.core.folios import crear_secuencias_folio
 
 # nombre del archivo de respaldo
 ARCHIVO_RESPALDO = "respaldo_usuarios.json"
@@ -79,6 +81,8 @@ def hacer_load():
             if not existe:
                nueva_suc = Sucursal(**suc_dict)
                db.add(nueva_suc)
+               # secuencias de folios de la sucursal (una por tipo de documento)
+               crear_secuencias_folio(db, suc_dict['id_sucursal'])
                creados_suc += 1
         db.commit()
 
@@ -6,6 +6,9 @@ import os
 sys.path.append(os.getcwd())
 from app.database import SessionLocal
 from app.models import Producto, Categoria
+from app.core.redis import redis_service
+from app.crud.productos import invalidar_arbol_categorias, reconstruir_closure_categorias
+from app.core.paginacion import invalidar_conteos
 
 NOMBRE_ARCHIVO = "productos.csv"
 SEPARADOR_CATEGORIA = ">" # lo que separa padre de hijo
@@ -98,6 +101,13 @@ def importar_datos_jerarquicos():
                 db.bulk_save_objects(productos_nuevos)
                 db.commit()
 
+        # pueden haberse creado categorías: clausura al día y la API vuelve a armar su árbol cacheado
+        reconstruir_closure_categorias(db)
+        redis_service.connect()
+        invalidar_arbol_categorias()
+        # y los totales cacheados de /productos/
+        invalidar_conteos("productos")
+
         print(f"{contador} productos importados con sus jerarquías.")
 
     except Exception as e:
@@ -0,0 +1,74 @@
+import sys
+import os
+
+# configuración de importaciones
+sys.path.append(os.getcwd())
+from app.database import SessionLocal
+from app import crud
+
+# Tareas de mantenimiento de datos derivados.
+# Uso: python mantenimiento.py <tarea> [--todos]
+
+def tarea_totales(db, todos: bool = False):
+    # totales persistidos de documentos (subtotal, descuento_total, total)
+    actualizados = crud.recalcular_totales_documentos(db, solo_pendientes=not todos)
+    print(f"{actualizados} documentos actualizados.")
+
+def tarea_ventas_diarias(db, todos: bool = False):
+    # rollup ventas_diarias (siempre completo, desde el historial de documentos)
+    filas = crud.reconstruir_ventas_diarias(db)
+    print(f"{filas} filas de ventas_diarias generadas.")
+
+def tarea_cierres(db, todos: bool = False):
+    # cuadratura congelada de sesiones cerradas antes de existir cierres_caja
+    creados = crud.reconstruir_cierres_caja(db)
+    print(f"{creados} cierres de caja generados.")
+
+def tarea_snapshot_stock(db, todos: bool = False):
+    # foto del stock actual por sucursal/producto (base de las consultas de stock a una fecha)
+    filas = crud.crear_snapshot_stock(db)
+    print(f"{filas} filas de snapshot de stock guardadas.")
+
+def tarea_outbox(db, todos: bool = False):
+    # borra eventos del outbox ya procesados hace más de 7 días
+    borrados = crud.limpiar_eventos_procesados(db, dias=7)
+    print(f"{borrados} eventos de outbox eliminados.")
+
+def tarea_closure_categorias(db, todos: bool = False):
+    # clausura del árbol de categorías (filtros por subárbol); ejecutar tras migrar una base existente
+    filas = crud.reconstruir_closure_categorias(db)
+    print(f"{filas} filas de categorias_closure generadas.")
+
+TAREAS = {
+    "totales": tarea_totales,
+    "ventas-diarias": tarea_ventas_diarias,
+    "cierres": tarea_cierres,
+    "snapshot-stock": tarea_snapshot_stock,
+    "outbox": tarea_outbox,
+    "closure-categorias": tarea_closure_categorias,
+}
+
+def ejecutar(nombre: str, todos: bool = False):
+    tarea = TAREAS.get(nombre)
+    if not tarea:
+        print(f"Tarea desconocida '{nombre}'. Disponibles: {', '.join(TAREAS)}")
+        return
+
+    db = SessionLocal()
+    try:
+        print(f"Ejecutando '{nombre}'...")
+        tarea(db, todos=todos)
+        print("Listo")
+    except Exception as e:
+        print(f"Error en '{nombre}': {e}")
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"Uso: python mantenimiento.py <tarea> [--todos]. Tareas: {', '.join(TAREAS)}")
+    else:
+        ejecutar(sys.argv[1], todos="--todos" in sys.argv[2:])
@@ -0,0 +1,130 @@
+import sys
+import os
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+# configuración de importaciones
+sys.path.append(os.getcwd())
+from app.database import engine, Base, SessionLocal
+from app import models
+from app.core.folios import crear_secuencias_folio
+from app.crud.productos import reconstruir_closure_categorias
+from app.crud.inventarios import crear_snapshot_stock
+
+# Base.metadata.create_all solo crea tablas nuevas: en una BD existente no agrega
+# columnas ni índices a tablas que ya existen. Este script completa lo que falte.
+
+def crear_tablas():
+    print("Creando tablas faltantes...")
+    Base.metadata.create_all(bind=engine)
+
+def agregar_columnas():
+    # columnas nuevas en tablas existentes (se agregan como NULL, sin defaults)
+    inspector = inspect(engine)
+    agregadas = 0
+
+    with engine.begin() as conn:
+        for tabla in Base.metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+            existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+
+            for columna in tabla.columns:
+                if columna.name in existentes:
+                    continue
+
+                tipo = columna.type.compile(dialect=engine.dialect)
+                print(f" - {tabla.name}: agregando columna {columna.name} {tipo}")
+                conn.exec_driver_sql(f'ALTER TABLE {tabla.name} ADD COLUMN IF NOT EXISTS "{columna.name}" {tipo}')
+                agregadas += 1
+
+    print(f"{agregadas} columnas agregadas.")
+
+def crear_indices():
+    inspector = inspect(engine)
+    creados = 0
+
+    # CONCURRENTLY no puede ir dentro de una transacción
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Un CREATE INDEX CONCURRENTLY interrumpido (o un UNIQUE con duplicados) deja el índice
+        # marcado inválido: existe, no se usa en consultas y sí se mantiene en cada escritura
+        invalidos = set(conn.execute(text(
+            "SELECT c.relname FROM pg_index i "
+            "JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE NOT i.indisvalid AND n.nspname = current_schema()"
+        )).scalars())
+
+        for tabla in Base.metadata.sorted_tables:
+            existentes = {ix["name"] for ix in inspector.get_indexes(tabla.name)}
+
+            for indice in tabla.indexes:
+                if indice.name in invalidos:
+                    print(f" - {tabla.name}: índice {indice.name} inválido, se reconstruye")
+                    conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{indice.name}"')
+                elif indice.name in existentes:
+                    continue
+
+                # crear sin bloquear escrituras sobre la tabla
+                ddl = str(CreateIndex(indice).compile(dialect=engine.dialect))
+                ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+                ddl = ddl.replace("CREATE UNIQUE INDEX", "CREATE UNIQUE INDEX CONCURRENTLY", 1)
+
+                print(f" - {tabla.name}: creando índice {indice.name}")
+                conn.exec_driver_sql(ddl)
+                creados += 1
+
+    print(f"{creados} índices creados.")
+
+def crear_secuencias():
+    # Una secuencia de folios por (sucursal, tipo de documento) para las sucursales existentes
+    with engine.begin() as conn:
+        sucursales = conn.execute(select(models.Sucursal.id_sucursal)).scalars().all()
+        for id_sucursal in sucursales:
+            crear_secuencias_folio(conn, id_sucursal)
+
+    print(f"Secuencias de folios verificadas para {len(sucursales)} sucursales.")
+
+def poblar_closure_categorias():
+    # categorias_closure nace vacía en una BD existente: sin ella los filtros por categoría no
+    # encuentran nada y delete_categoria no ve los productos de la rama
+    db = SessionLocal()
+    try:
+        categorias = db.query(func.count(models.Categoria.id_categoria)).scalar()
+        propias = db.query(func.count()).select_from(models.CategoriaClosure)\
+            .filter(models.CategoriaClosure.profundidad == 0).scalar()
+        if categorias == propias:
+            print("Clausura de categorías al día.")
+            return
+        filas = reconstruir_closure_categorias(db)
+        print(f"Clausura de categorías regenerada: {filas} filas.")
+    finally:
+        db.close()
+
+def snapshot_stock_inicial():
+    # Base del stock a una fecha: sin snapshot, el kardex solo no incluye el stock previo a él
+    db = SessionLocal()
+    try:
+        if db.query(models.SnapshotStock).first():
+            return
+        filas = crear_snapshot_stock(db)
+        print(f"Snapshot de stock inicial: {filas} filas.")
+    finally:
+        db.close()
+
+def migrar():
+    try:
+        crear_tablas()
+        agregar_columnas()
+        crear_indices()
+        crear_secuencias()
+        poblar_closure_categorias()
+        snapshot_stock_inicial()
+        print("Migración completada")
+    except Exception as e:
+        print(f"Error al migrar: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    migrar()
@@ -0,0 +1,152 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Prueba de carga del descuento de stock: dispara cientos de ventas simultáneas de un mismo producto
+# y verifica que no se venda más de lo disponible y que el throughput no caiga bajo un mínimo.
+# Necesita Postgres (variables DB_* del .env, ej. docker-compose exec backend pytest); sin él se omite.
+# Crea su propia sucursal, usuario, producto y caja, y los elimina al terminar.
+
+for _modulo in ("sqlalchemy", "psycopg2", "asyncpg", "redis"):
+    pytest.importorskip(_modulo)
+
+if not os.getenv("DB_HOST"):
+    pytest.skip("Sin Postgres configurado (DB_HOST)", allow_module_level=True)
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import OperationalError
+
+from app.database import Base, SessionLocal, engine, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from app import crud, models, schemas
+from app.core.folios import nombre_secuencia_folio
+
+try:
+    with engine.connect():
+        pass
+except OperationalError as e:
+    pytest.skip(f"Postgres no disponible: {e.orig}", allow_module_level=True)
+
+STOCK_INICIAL = 100
+VENTAS = int(os.getenv("PRUEBA_CONCURRENCIA_VENTAS", 300))
+HILOS = int(os.getenv("PRUEBA_CONCURRENCIA_HILOS", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+# Piso de ventas por segundo (exitosas + rechazadas por stock): detecta bloqueos que serialicen de más
+VENTAS_POR_SEGUNDO_MIN = float(os.getenv("PRUEBA_CONCURRENCIA_VENTAS_POR_SEGUNDO_MIN", 25))
+
+
+@pytest.fixture(scope="module")
+def escenario():
+    """Sucursal con caja abierta y un producto con STOCK_INICIAL unidades en una sola ubicación."""
+    Base.metadata.create_all(bind=engine)
+    sufijo = uuid.uuid4().hex[:12]
+    db = SessionLocal()
+    try:
+        sucursal = crud.create_sucursal(db, schemas.SucursalCreate(nombre=f"prueba_concurrencia_{sufijo}"))
+        usuario = models.Usuario(
+            id_sucursal=sucursal.id_sucursal,
+            nombre="prueba_concurrencia",
+            email=f"prueba_concurrencia_{sufijo}@example.com",
+            password="-"
+        )
+        producto = models.Producto(nombre=f"prueba_concurrencia_{sufijo}", codigo_barras=f"PC{sufijo}", precio_venta=1000)
+        db.add_all([usuario, producto])
+        db.flush()
+        db.add(models.Inventario(
+            id_sucursal=sucursal.id_sucursal,
+            id_producto=producto.id_producto,
+            cantidad=STOCK_INICIAL,
+            ubicacion_especifica="Bodega General"
+        ))
+        db.commit()
+        apertura = crud.abrir_caja(db, sucursal.id_sucursal, usuario.id_usuario, 0)
+        ids = (sucursal.id_sucursal, producto.id_producto, usuario.id_usuario)
+    finally:
+        db.close()
+
+    yield ids
+
+    _eliminar_escenario(*ids, apertura.id_movimiento)
+
+
+def _eliminar_escenario(sucursal_id: int, producto_id: int, usuario_id: int, apertura_id: int):
+    db = SessionLocal()
+    try:
+        documentos = db.query(models.Documento.id_documento).filter(models.Documento.id_sucursal == sucursal_id)
+        db.query(models.EventoOutbox).filter(
+            models.EventoOutbox.payload["id_sucursal"].astext == str(sucursal_id)
+        ).delete(synchronize_session=False)
+        db.query(models.MovimientoStock).filter(models.MovimientoStock.id_sucursal == sucursal_id).delete(synchronize_session=False)
+        db.query(models.MovimientosCaja).filter(models.MovimientosCaja.id_sucursal == sucursal_id).delete(synchronize_session=False)
+        db.query(models.DetalleDocumento).filter(models.DetalleDocumento.id_documento.in_(documentos)).delete(synchronize_session=False)
+        db.query(models.Documento).filter(models.Documento.id_sucursal == sucursal_id).delete(synchronize_session=False)
+        db.query(models.Inventario).filter(models.Inventario.id_sucursal == sucursal_id).delete(synchronize_session=False)
+        db.query(models.Producto).filter(models.Producto.id_producto == producto_id).delete(synchronize_session=False)
+        db.query(models.Usuario).filter(models.Usuario.id_usuario == usuario_id).delete(synchronize_session=False)
+        db.query(models.Sucursal).filter(models.Sucursal.id_sucursal == sucursal_id).delete(synchronize_session=False)
+        for tipo in models.TipoDocumento:
+            db.execute(text(f"DROP SEQUENCE IF EXISTS {nombre_secuencia_folio(sucursal_id, tipo)}"))
+        db.commit()
+    finally:
+        db.close()
+    crud.eliminar_contadores_caja(apertura_id)
+
+
+def vender(sucursal_id: int, producto_id: int, usuario_id: int):
+    db = SessionLocal()
+    try:
+        doc = crud.create_documento(db, schemas.DocumentoCreate(
+            id_sucursal=sucursal_id,
+            id_usuario=usuario_id,
+            tipo_operacion=models.TipoOperacion.VENTA,
+            observaciones="prueba_concurrencia_stock",
+            detalles=[schemas.DetalleDocumentoCreate(id_producto=producto_id, cantidad=1)]
+        ))
+        return doc if isinstance(doc, dict) else "ok"
+    except ValueError:
+        return "sin_stock"
+    finally:
+        db.close()
+
+
+def stock_total(sucursal_id: int, producto_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.sum(models.Inventario.cantidad)).filter(
+            models.Inventario.id_sucursal == sucursal_id,
+            models.Inventario.id_producto == producto_id
+        ).scalar() or 0
+    finally:
+        db.close()
+
+
+def test_ventas_concurrentes_sin_sobreventa(escenario):
+    sucursal_id, producto_id, usuario_id = escenario
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=HILOS) as pool:
+        resultados = list(pool.map(lambda _: vender(sucursal_id, producto_id, usuario_id), range(VENTAS)))
+    duracion = time.perf_counter() - inicio
+
+    errores = [r for r in resultados if r not in ("ok", "sin_stock")]
+    exitos = resultados.count("ok")
+    assert not errores, errores[:5]
+
+    # Sin sobreventa ni actualizaciones perdidas: cada unidad disponible se vende exactamente una vez
+    assert exitos == min(VENTAS, STOCK_INICIAL)
+    assert stock_total(sucursal_id, producto_id) == STOCK_INICIAL - exitos
+
+    db = SessionLocal()
+    try:
+        kardex = db.query(func.sum(models.MovimientoStock.cantidad)).filter(
+            models.MovimientoStock.id_sucursal == sucursal_id,
+            models.MovimientoStock.id_producto == producto_id
+        ).scalar() or 0
+    finally:
+        db.close()
+    assert kardex == -exitos
+
+    ventas_por_segundo = VENTAS / duracion
+    assert ventas_por_segundo >= VENTAS_POR_SEGUNDO_MIN, \
+        f"{ventas_por_segundo:.1f} ventas/s con {HILOS} hilos (mínimo {VENTAS_POR_SEGUNDO_MIN})"
@@ -0,0 +1,46 @@
+import os
+import json
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Receptor mínimo de webhooks para desarrollo: registra cada evento que envía worker_outbox.py.
+# Uso: python webhook_stub.py  (docker-compose lo levanta como servicio "webhook")
+# WEBHOOK_STUB_ESTADO permite simular un webhook caído (ej. 500) y probar los reintentos del worker.
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("webhook_stub")
+
+WEBHOOK_STUB_PUERTO = int(os.getenv("WEBHOOK_STUB_PUERTO", 9000))
+WEBHOOK_STUB_ESTADO = int(os.getenv("WEBHOOK_STUB_ESTADO", 204))
+
+
+class ReceptorEventos(BaseHTTPRequestHandler):
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            evento = json.loads(cuerpo or b"null")
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        tipo = evento.get("tipo") if isinstance(evento, dict) else None
+        id_evento = evento.get("id_evento") if isinstance(evento, dict) else None
+        logger.info(f"{self.path} evento {id_evento} ({tipo}): {json.dumps(evento, ensure_ascii=False)}")
+        self.send_response(WEBHOOK_STUB_ESTADO)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # El evento ya queda registrado en do_POST
+        pass
+
+
+if __name__ == "__main__":
+    servidor = ThreadingHTTPServer(("0.0.0.0", WEBHOOK_STUB_PUERTO), ReceptorEventos)
+    logger.info(f"Webhook stub escuchando en el puerto {WEBHOOK_STUB_PUERTO}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
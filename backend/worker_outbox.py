@@ -0,0 +1,145 @@
+import sys
+import os
+import time
+import signal
+import logging
+from datetime import date
+from decimal import Decimal
+
+import httpx
+
+# configuración de importaciones
+sys.path.append(os.getcwd())
+from app.database import SessionLocal
+from app import crud
+from app.core.redis import redis_service
+
+# Worker del outbox: procesa los efectos secundarios encolados por las escrituras
+# (rollup ventas_diarias e invalidación de cachés; luego, fuera de la transacción, los webhooks).
+# Uso: python worker_outbox.py  (se pueden levantar varios, la cola usa SKIP LOCKED)
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("worker_outbox")
+
+# Segundos de espera cuando la cola está vacía
+OUTBOX_INTERVALO = float(os.getenv("OUTBOX_INTERVALO", 1))
+# Eventos por transacción
+OUTBOX_LOTE = int(os.getenv("OUTBOX_LOTE", 100))
+# Webhook opcional que recibe cada evento (ej. webhook_stub.py en http://localhost:9000/eventos)
+OUTBOX_WEBHOOK_URL = os.getenv("OUTBOX_WEBHOOK_URL") or None
+# Segundos que una entrega al webhook queda reservada para el worker que la tomó (si se cae, otro la reintenta)
+OUTBOX_RESERVA = int(os.getenv("OUTBOX_RESERVA", 60))
+
+_detener = False
+
+def _pedir_detencion(signum, frame):
+    global _detener
+    _detener = True
+
+# MANEJADORES (corren dentro de la transacción del lote: sus escrituras y la marca de procesado van juntas)
+
+def _aplicar_rollup(db, evento, signo: int):
+    payload = evento.payload
+    if not payload.get("rollup"):
+        return
+    lineas = [(p, c, q, Decimal(precio), Decimal(desc)) for p, c, q, precio, desc in payload["rollup"]]
+    crud.actualizar_ventas_diarias(db, date.fromisoformat(payload["fecha"]), payload["id_sucursal"], lineas, signo=signo)
+
+MANEJADORES = {
+    "documento_creado": lambda db, evento: _aplicar_rollup(db, evento, signo=1),
+    "documento_anulado": lambda db, evento: _aplicar_rollup(db, evento, signo=-1),
+}
+
+def _enviar_webhook(evento):
+    respuesta = httpx.post(OUTBOX_WEBHOOK_URL, json=evento.payload, timeout=5.0)
+    respuesta.raise_for_status()
+
+def _invalidar_caches(sucursal_id: int):
+    for panel in ("stats", "charts"):
+        redis_service.delete(f"dashboard:{panel}:{sucursal_id}")
+        redis_service.delete(f"dashboard:{panel}:global")
+
+def procesar_lote(db) -> int:
+    eventos = crud.tomar_eventos_pendientes(db, limite=OUTBOX_LOTE)
+    sucursales = set()
+
+    for evento in eventos:
+        # Savepoint por evento: si uno falla se reintenta después sin deshacer el resto del lote
+        savepoint = db.begin_nested()
+        try:
+            manejador = MANEJADORES.get(evento.tipo)
+            if manejador:
+                manejador(db, evento)
+            savepoint.commit()
+        except Exception as e:
+            savepoint.rollback()
+            logger.warning(f"Evento {evento.id_evento} ({evento.tipo}) falló: {e}")
+            crud.marcar_evento_fallido(evento, e)
+            continue
+
+        crud.marcar_evento_procesado(evento)
+        # La entrega al webhook queda como otro evento: sus fallos no afectan al rollup ya aplicado
+        if OUTBOX_WEBHOOK_URL:
+            crud.encolar_webhook(db, evento)
+        if evento.payload.get("id_sucursal"):
+            sucursales.add(evento.payload["id_sucursal"])
+
+    db.commit()
+
+    # Cachés después del commit: una lectura concurrente no vuelve a cachear datos anteriores al rollup
+    for sucursal_id in sucursales:
+        _invalidar_caches(sucursal_id)
+
+    return len(eventos)
+
+def procesar_webhooks(db) -> int:
+    if not OUTBOX_WEBHOOK_URL:
+        return 0
+
+    # Tomar y reservar en una transacción corta: el HTTP corre sin locks de la cola
+    eventos = crud.tomar_eventos_pendientes(db, limite=OUTBOX_LOTE, webhooks=True)
+    if not eventos:
+        db.commit()
+        return 0
+    crud.reservar_eventos(eventos, OUTBOX_RESERVA)
+    db.commit()
+
+    for evento in eventos:
+        try:
+            _enviar_webhook(evento)
+        except Exception as e:
+            logger.warning(f"Webhook del evento {evento.payload.get('id_evento')} falló: {e}")
+            crud.marcar_evento_fallido(evento, e)
+            continue
+        crud.marcar_evento_procesado(evento)
+
+    db.commit()
+    return len(eventos)
+
+def ejecutar():
+    signal.signal(signal.SIGTERM, _pedir_detencion)
+    signal.signal(signal.SIGINT, _pedir_detencion)
+    redis_service.connect()
+    logger.info(f"Worker outbox iniciado (lote {OUTBOX_LOTE}, intervalo {OUTBOX_INTERVALO}s)")
+
+    while not _detener:
+        db = SessionLocal()
+        try:
+            procesados = procesar_lote(db)
+            procesados = max(procesados, procesar_webhooks(db))
+        except Exception as e:
+            logger.error(f"Error procesando outbox: {e}")
+            db.rollback()
+            procesados = 0
+        finally:
+            db.close()
+
+        # Cola vacía (o lote incompleto): esperar antes de volver a consultar
+        if procesados < OUTBOX_LOTE:
+            time.sleep(OUTBOX_INTERVALO)
+
+    redis_service.close()
+    logger.info("Worker outbox detenido")
+
+if __name__ == "__main__":
+    ejecutar()
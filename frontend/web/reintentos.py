@@ -0,0 +1,43 @@
+import random
+import time
+import uuid
+import httpx
+
+# POST al backend con Idempotency-Key: se puede reintentar con timeout corto sin duplicar la operación,
+# el backend retorna la respuesta original si la primera petición ya se había procesado.
+TIMEOUT_ESCRITURA = 5.0
+# Tiempo total para reintentar. Debe superar holgadamente TIMEOUT_ESCRITURA: una petición que excedió
+# el timeout puede seguir procesándose en el backend (que retiene la clave hasta 60 s) y mientras tanto
+# los reintentos reciben 409.
+VENTANA_REINTENTOS = 30.0
+# Espera exponencial entre intentos (0.5, 1, 2, 4, 8, 8... s) con jitter, para que los clientes
+# que fallaron a la vez no reintenten todos al mismo instante
+ESPERA_BASE = 0.5
+ESPERA_MAX = 8.0
+
+def _esperar(intento, limite):
+    """Duerme antes del siguiente intento. False si ya no cabe dentro de la ventana."""
+    tope = min(ESPERA_MAX, ESPERA_BASE * 2 ** intento)
+    espera = tope / 2 + random.uniform(0, tope / 2)
+    if time.monotonic() + espera >= limite:
+        return False
+    time.sleep(espera)
+    return True
+
+def post_idempotente(url, json=None, headers=None, clave=None):
+    headers = dict(headers or {})
+    headers["Idempotency-Key"] = clave or str(uuid.uuid4())
+    limite = time.monotonic() + VENTANA_REINTENTOS
+
+    intento = 0
+    while True:
+        try:
+            response = httpx.post(url, json=json, headers=headers, timeout=TIMEOUT_ESCRITURA)
+        except (httpx.TimeoutException, httpx.ConnectError):
+            if not _esperar(intento, limite):
+                raise
+        else:
+            # 409: la primera petición con esta clave sigue en curso
+            if response.status_code != 409 or not _esperar(intento, limite):
+                return response
+        intento += 1
@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect
+import uuid
 import httpx
 from ..decorators import token_required
+from ..reintentos import post_idempotente
 
 from django.conf import settings
 
@@ -77,9 +79,9 @@ def cerrar_caja(request):
     error = None
     resumen = {} # Para mostrar lo esperado antes de cerrar o al confirmar
 
-    # Pre-cargar resumen para mostrar al usuario cuanto debería haber
+    # Pre-cargar resumen para mostrar al usuario cuanto debería haber (con documentos y movimientos)
     try:
-        resp = httpx.get(f"{BACKEND_URL}/caja/resumen", headers=headers)
+        resp = httpx.get(f"{BACKEND_URL}/caja/resumen", params={"detalle": True}, headers=headers)
         if resp.status_code == 200:
             resumen = resp.json()
             # Parsear fechas para el template
@@ -192,7 +194,10 @@ def registrar_movimiento(request):
             }
             
             
-            resp = httpx.post(f"{BACKEND_URL}/caja/movimientos", json=payload, headers=headers)
+            resp = post_idempotente(
+                f"{BACKEND_URL}/caja/movimientos", json=payload, headers=headers,
+                clave=request.POST.get("idempotency_key")
+            )
             
             if resp.status_code == 201:
                 return redirect("gestion_caja")
@@ -207,7 +212,9 @@ def registrar_movimiento(request):
         except httpx.RequestError as exc:
             error = f"Error de conexión: {exc}"
 
-    return render(request, "caja/movimiento_extra.html", {"error": error})
+    # Clave de idempotencia del formulario: un doble envío no registra el movimiento dos veces
+    idempotency_key = request.POST.get("idempotency_key") or str(uuid.uuid4())
+    return render(request, "caja/movimiento_extra.html", {"error": error, "idempotency_key": idempotency_key})
 
 @token_required
 def ver_reportes(request):
@@ -3,6 +3,7 @@ from django.http import JsonResponse
 import json
 import httpx
 from ..decorators import token_required
+from ..reintentos import post_idempotente
 
 from django.conf import settings
 
@@ -21,7 +22,11 @@ def crear_documento(request):
             if not data.get("id_sucursal"):
                 data["id_sucursal"] = request.session.get("id_sucursal")
             
-            response = httpx.post(f"{BACKEND_URL}/documentos/", json=data, headers=headers)
+            # La clave viene del navegador (una por venta) para que un doble envío tampoco duplique
+            response = post_idempotente(
+                f"{BACKEND_URL}/documentos/", json=data, headers=headers,
+                clave=request.headers.get("Idempotency-Key")
+            )
             
             if response.status_code == 200 or response.status_code == 201:
                 return JsonResponse({"status": "success", "redirect_url": "/inventario/"}) # O detalle confirmacion
@@ -94,7 +99,7 @@ def api_ver_stock(request):
     
     try:
         # Usamos endpoint inventarios con filtros
-        params = {"sucursal_id": s_id, "producto_id": p_id}
+        params = {"sucursal_id": s_id, "producto_id": p_id, "fields": "cantidad"}
         response = httpx.get(f"{BACKEND_URL}/inventarios/", params=params, headers=headers)
         data = response.json()
         cantidad = 0
@@ -41,7 +41,11 @@ def lista_productos(request):
     try:
         params = {
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            # Sin filtros el total es la estimación del planner (evita un count() completo por página)
+            "approx_total": "true",
+            # Solo las columnas que muestra la tabla (categoria llega como nombre)
+            "fields": "nombre,codigo_barras,precio_venta,unidad_medida,categoria"
         }
         if busqueda: params["busqueda"] = busqueda
         if unidad_medida: params["unidad_medida"] = unidad_medida
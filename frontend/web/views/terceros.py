@@ -29,7 +29,9 @@ def lista_terceros(request):
     try:
         params = {
             "skip": skip,
-            "limit": limit
+            "limit": limit,
+            # Sin filtros el total es la estimación del planner (evita un count() completo por página)
+            "approx_total": "true"
         }
         if busqueda: params["busqueda"] = busqueda
         if filtro_rol: params["rol"] = filtro_rol